@@ -0,0 +1,209 @@
+import asyncio
+import heapq
+import time
+
+# Bucket size in seconds and how many buckets of each resolution are kept
+RESOLUTIONS = {'minute': (60, 120), 'hour': (3600, 168), 'day': (86400, 90)}
+FIELDS = ('messages', 'joins', 'leaves', 'xp')
+MESSAGES, JOINS, LEAVES, XP = range(len(FIELDS))
+# Days of per-channel message counts kept for top channels
+CHANNEL_DAYS = 7
+DAY = RESOLUTIONS['day'][0]
+SPARK = '▁▂▃▄▅▆▇█'
+
+
+def bucket_start(timestamp, size):
+    return int(timestamp // size * size)
+
+
+def sparkline(values):
+    peak = max(values, default=0)
+    return ''.join(SPARK[round(value / peak * (len(SPARK) - 1)) if peak else 0] for value in values)
+
+
+class GuildActivity:
+    """One guild's rollups: counts per minute, hour and day bucket, and messages per channel per day.
+
+    `channel_totals` holds each channel's messages over the kept days, updated as days
+    are added and dropped, so top channels never re-add the days.
+    """
+
+    def __init__(self):
+        self.buckets = {resolution: {} for resolution in RESOLUTIONS}
+        self.channel_days = {}
+        self.channel_totals = {}
+
+    def add(self, resolution, start, field, amount):
+        buckets = self.buckets[resolution]
+        counts = buckets.get(start)
+        if counts is None:
+            counts = buckets[start] = [0] * len(FIELDS)
+            if len(buckets) > RESOLUTIONS[resolution][1]:
+                del buckets[min(buckets)]
+        counts[field] += amount
+
+    def add_channel(self, day, channel_id, amount):
+        counts = self.channel_days.get(day)
+        if counts is None:
+            counts = self.channel_days[day] = {}
+            self._expire_channels(day)
+        counts[channel_id] = counts.get(channel_id, 0) + amount
+        self.channel_totals[channel_id] = self.channel_totals.get(channel_id, 0) + amount
+
+    def _expire_channels(self, today):
+        cutoff = today - (CHANNEL_DAYS - 1) * DAY
+        for day in [day for day in self.channel_days if day < cutoff]:
+            for channel_id, count in self.channel_days.pop(day).items():
+                remaining = self.channel_totals[channel_id] - count
+                if remaining:
+                    self.channel_totals[channel_id] = remaining
+                else:
+                    del self.channel_totals[channel_id]
+
+    def series(self, resolution, count, now):
+        """Counts of the last `count` buckets, oldest first and ending with the current one."""
+        size = RESOLUTIONS[resolution][0]
+        current = bucket_start(now, size)
+        buckets = self.buckets[resolution]
+        empty = [0] * len(FIELDS)
+        return [buckets.get(current - size * offset, empty) for offset in range(count - 1, -1, -1)]
+
+    def totals(self, resolution, count, now):
+        """Each field summed over the last `count` buckets."""
+        return [sum(column) for column in zip(*self.series(resolution, count, now))]
+
+    def top_channels(self, limit, now):
+        """[(channel_id, messages)] for the busiest channels over the last CHANNEL_DAYS days."""
+        self._expire_channels(bucket_start(now, DAY))
+        return heapq.nlargest(limit, self.channel_totals.items(), key=lambda item: item[1])
+
+
+class ActivityStore:
+    """Messages, joins, leaves and XP per guild, rolled up by minute, hour and day.
+
+    Events add to pending deltas, keyed (guild_id, resolution, bucket) and, for
+    messages, (guild_id, channel_id, day). `flush` hands them to
+    `await writer(rows, channel_rows)`, which adds them to the stored counts, so
+    processes sharing the DB don't overwrite each other. A guild's rollups are read
+    once through `await loader(guild_id)`, the first time they are asked for, and kept
+    current from then on, so reads never rescan. `await pruner(cutoffs, channel_cutoff)`
+    deletes buckets that have aged out.
+    """
+
+    def __init__(self, loader, writer, pruner):
+        self.loader = loader
+        self.writer = writer
+        self.pruner = pruner
+        self._guilds = {}
+        self._pending = {}
+        self._pending_channels = {}
+        # Loads and flushes take turns, so a loaded guild counts every delta exactly once
+        self._lock = asyncio.Lock()
+
+    def _add(self, guild_id, field, amount, now):
+        activity = self._guilds.get(guild_id)
+        for resolution, (size, _) in RESOLUTIONS.items():
+            start = bucket_start(now, size)
+            key = (guild_id, resolution, start)
+            counts = self._pending.get(key)
+            if counts is None:
+                counts = self._pending[key] = [0] * len(FIELDS)
+            counts[field] += amount
+            if activity is not None:
+                activity.add(resolution, start, field, amount)
+
+    def message(self, guild_id, channel_id, now=None):
+        guild_id, now = str(guild_id), time.time() if now is None else now
+        self._add(guild_id, MESSAGES, 1, now)
+        day = bucket_start(now, DAY)
+        key = (guild_id, channel_id, day)
+        self._pending_channels[key] = self._pending_channels.get(key, 0) + 1
+        activity = self._guilds.get(guild_id)
+        if activity is not None:
+            activity.add_channel(day, channel_id, 1)
+
+    def join(self, guild_id, now=None):
+        self._add(str(guild_id), JOINS, 1, time.time() if now is None else now)
+
+    def leave(self, guild_id, now=None):
+        self._add(str(guild_id), LEAVES, 1, time.time() if now is None else now)
+
+    def xp(self, guild_id, amount, now=None):
+        self._add(str(guild_id), XP, amount, time.time() if now is None else now)
+
+    async def guild(self, guild_id):
+        """A guild's GuildActivity, loading its stored rollups the first time."""
+        guild_id = str(guild_id)
+        activity = self._guilds.get(guild_id)
+        if activity is not None:
+            return activity
+        async with self._lock:
+            activity = self._guilds.get(guild_id)
+            if activity is None:
+                activity = GuildActivity()
+                rows, channel_rows = await self.loader(guild_id)
+                for resolution, start, *counts in sorted(rows, key=lambda row: row[1]):
+                    for field, amount in enumerate(counts):
+                        activity.add(resolution, start, field, amount)
+                for channel_id, day, messages in sorted(channel_rows, key=lambda row: row[1]):
+                    activity.add_channel(day, channel_id, messages)
+                # Deltas not written yet are in neither the DB nor the loaded rollups
+                for (pending_guild, resolution, start), counts in self._pending.items():
+                    if pending_guild == guild_id:
+                        for field, amount in enumerate(counts):
+                            activity.add(resolution, start, field, amount)
+                for (pending_guild, channel_id, day), messages in self._pending_channels.items():
+                    if pending_guild == guild_id:
+                        activity.add_channel(day, channel_id, messages)
+                self._guilds[guild_id] = activity
+        return activity
+
+    def drain(self):
+        rows = [(guild_id, resolution, start, *counts) for (guild_id, resolution, start), counts in self._pending.items()]
+        channel_rows = [(guild_id, channel_id, day, messages)
+                        for (guild_id, channel_id, day), messages in self._pending_channels.items()]
+        self._pending, self._pending_channels = {}, {}
+        return rows, channel_rows
+
+    def restore(self, rows, channel_rows):
+        """Put back deltas whose write failed, adding to any recorded since."""
+        for guild_id, resolution, start, *counts in rows:
+            pending = self._pending.setdefault((guild_id, resolution, start), [0] * len(FIELDS))
+            for field, amount in enumerate(counts):
+                pending[field] += amount
+        for guild_id, channel_id, day, messages in channel_rows:
+            key = (guild_id, channel_id, day)
+            self._pending_channels[key] = self._pending_channels.get(key, 0) + messages
+
+    async def flush(self):
+        async with self._lock:
+            rows, channel_rows = self.drain()
+            if not rows and not channel_rows:
+                return 0
+            try:
+                await self.writer(rows, channel_rows)
+            except Exception:
+                self.restore(rows, channel_rows)
+                raise
+            return len(rows) + len(channel_rows)
+
+    def cutoffs(self, now):
+        """The oldest bucket kept per resolution, and the oldest day of channel counts."""
+        cutoffs = {resolution: bucket_start(now, size) - size * (keep - 1) for resolution, (size, keep) in RESOLUTIONS.items()}
+        return cutoffs, bucket_start(now, DAY) - DAY * (CHANNEL_DAYS - 1)
+
+    async def run(self, interval=60, prune_interval=3600):
+        """Flush every `interval` seconds and delete aged-out buckets every `prune_interval`."""
+        last_prune = time.monotonic()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush()
+                if time.monotonic() - last_prune >= prune_interval:
+                    last_prune = time.monotonic()
+                    await self.pruner(*self.cutoffs(time.time()))
+            except Exception as e:
+                print(f"🚨 Error: Failed to write activity rollups: {str(e)}")
+
+    def stats(self):
+        return {"guilds_loaded": len(self._guilds), "pending_rows": len(self._pending) + len(self._pending_channels)}
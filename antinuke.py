@@ -0,0 +1,228 @@
+import asyncio
+import time
+from collections import deque
+
+import discord
+
+from state_backend import MemoryCounterBackend
+
+# Anti-nuke event types, as recorded by the guild event handlers
+ACTIONS = (
+    'channel_create',
+    'channel_delete',
+    'role_create',
+    'role_delete',
+    'member_ban',
+    'member_remove',
+    'guild_update',
+    'verification_level_change',
+)
+
+
+class AntiNukeEventStore:
+    """Sliding-window counts of anti-nuke events per guild and action type.
+
+    Rates are kept by `counter`, a CounterBackend (in-process by default, see
+    state_backend.py), so a shared backend lets several workers count one burst
+    together. A short per-guild history of the latest events backs
+    /checkrecentactions; it is local to the process, and everything older than
+    `retention` seconds is expired by `sweep`.
+    """
+
+    def __init__(self, history=50, retention=600, counter=None):
+        self.retention = retention
+        self._counter = counter or MemoryCounterBackend(idle_ttl=retention)
+        self._history = {}
+        self._history_size = history
+
+    async def record(self, guild_id, action, detail, limit, window, now=None):
+        """Record an event; returns True when it pushes the action over its threshold.
+
+        The action's window is cleared when it trips, so one burst alerts once rather
+        than on every event that follows it.
+        """
+        now = time.monotonic() if now is None else now
+        guild_id = str(guild_id)
+        history = self._history.get(guild_id)
+        if history is None:
+            history = self._history[guild_id] = deque(maxlen=self._history_size)
+        history.append((now, action, detail))
+
+        if await self._counter.hit(guild_id, action, limit, window) > limit:
+            await self._counter.reset(guild_id, action)
+            return True
+        return False
+
+    def recent(self, guild_id, action=None, now=None):
+        """Unexpired events as (seconds ago, action, detail), oldest first."""
+        now = time.monotonic() if now is None else now
+        return [
+            (now - timestamp, event_action, detail)
+            for timestamp, event_action, detail in self._history.get(str(guild_id), ())
+            if now - timestamp < self.retention and (action is None or event_action == action)
+        ]
+
+    async def reset(self, guild_id):
+        await self._counter.reset(str(guild_id))
+        self._history.pop(str(guild_id), None)
+
+    async def sweep(self, now=None):
+        await self._counter.sweep()
+        now = time.monotonic() if now is None else now
+        for guild_id in list(self._history):
+            history = self._history[guild_id]
+            while history and now - history[0][0] >= self.retention:
+                history.popleft()
+            if not history:
+                del self._history[guild_id]
+
+    async def run_sweeper(self, interval=60):
+        while True:
+            await asyncio.sleep(interval)
+            await self.sweep()
+
+    def stats(self):
+        stats = self._counter.stats()
+        stats["guilds_with_history"] = len(self._history)
+        return stats
+
+
+# Audit log action names (discord.AuditLogAction) that explain each anti-nuke event
+AUDIT_ACTIONS = {
+    'channel_create': 'channel_create',
+    'channel_delete': 'channel_delete',
+    'role_create': 'role_create',
+    'role_delete': 'role_delete',
+    'member_ban': 'ban',
+    'member_remove': 'kick',
+    'guild_update': 'guild_update',
+    'verification_level_change': 'guild_update',
+}
+
+
+class AuditAttributor:
+    """Attributes anti-nuke events to the member behind them using batched audit log reads.
+
+    Events are queued per guild and resolved together `delay` seconds after the first
+    one, with a single audit log fetch, instead of one fetch per event. Matches are
+    counted per actor and action; an actor over the action's threshold is passed to
+    `await on_offender(guild, actor, action)` once per burst.
+
+    Discord often writes the audit log entry a moment after the event arrives, so
+    events left unmatched, or caught by a failed fetch, are queued again with a doubled
+    delay, up to `retries` attempts. A guild that forbids reading its audit log is left
+    alone for `forbidden_backoff` seconds. Flushes of one guild take turns, and each
+    audit log entry is counted at most once.
+    """
+
+    def __init__(self, on_offender, delay=2.0, fetch_limit=100, counter=None, retries=3, forbidden_backoff=600):
+        self.on_offender = on_offender
+        self.delay = delay
+        self.fetch_limit = fetch_limit
+        self.retries = retries
+        self.forbidden_backoff = forbidden_backoff
+        self.fetches = 0
+        self._actors = counter or MemoryCounterBackend(idle_ttl=600)
+        self._pending = {}
+        self._timers = {}
+        self._locks = {}
+        self._forbidden_until = {}
+        self._counted = {}
+
+    def submit(self, guild, action, target_id, limit, window):
+        guild_id = str(guild.id)
+        forbidden_until = self._forbidden_until.get(guild_id)
+        if forbidden_until is not None:
+            if time.monotonic() < forbidden_until:
+                return
+            del self._forbidden_until[guild_id]
+        self._pending.setdefault(guild_id, []).append((action, target_id, limit, window, 0))
+        self._schedule(guild, self.delay)
+
+    def _schedule(self, guild, delay):
+        guild_id = str(guild.id)
+        if guild_id not in self._timers:
+            self._timers[guild_id] = asyncio.create_task(self._flush_later(guild, delay))
+
+    async def _flush_later(self, guild, delay):
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            # Events queued while this flush runs start a new timer
+            self._timers.pop(str(guild.id), None)
+        await self.flush(guild)
+
+    def _retry(self, guild, events):
+        events = [(action, target_id, limit, window, attempts + 1)
+                  for action, target_id, limit, window, attempts in events if attempts + 1 < self.retries]
+        if events:
+            guild_id = str(guild.id)
+            self._pending[guild_id] = events + self._pending.get(guild_id, [])
+            self._schedule(guild, self.delay * 2 ** min(event[4] for event in events))
+
+    async def flush(self, guild):
+        """Resolve the guild's queued events now. Returns the offenders found."""
+        guild_id = str(guild.id)
+        lock = self._locks.get(guild_id)
+        if lock is None:
+            lock = self._locks[guild_id] = asyncio.Lock()
+        async with lock:
+            offenders = await self._resolve(guild, guild_id)
+        for actor, action in offenders:
+            await self.on_offender(guild, actor, action)
+        return offenders
+
+    async def _resolve(self, guild, guild_id):
+        events = self._pending.pop(guild_id, None)
+        if not events:
+            return []
+
+        try:
+            self.fetches += 1
+            entries = [entry async for entry in guild.audit_logs(limit=self.fetch_limit)]
+        except discord.Forbidden:
+            self._forbidden_until[guild_id] = time.monotonic() + self.forbidden_backoff
+            print(f"🚨 Error: Missing permission to read the audit log for guild {guild_id}; "
+                  f"attribution paused for {self.forbidden_backoff} seconds")
+            return []
+        except Exception as e:
+            print(f"🚨 Error: Could not read the audit log for guild {guild_id}: {str(e)}")
+            self._retry(guild, events)
+            return []
+
+        waiting = {}
+        for event in events:
+            waiting.setdefault((AUDIT_ACTIONS[event[0]], str(event[1])), []).append(event)
+
+        counted = self._counted.setdefault(guild_id, set())
+        offenders = []
+        # Oldest first, skipping entries an earlier batch already counted. Entries that
+        # match nothing yet stay available for events that haven't arrived
+        for entry in sorted(entries, key=lambda entry: entry.id):
+            if entry.id in counted or entry.user is None:
+                continue
+            target_id = str(getattr(entry.target, 'id', entry.target))
+            matched = waiting.pop((entry.action.name, target_id), None)
+            if not matched:
+                continue
+            counted.add(entry.id)
+            for action, _, limit, window, _ in matched:
+                key = f"{entry.user.id}:{action}"
+                if await self._actors.hit(guild_id, key, limit, window) > limit:
+                    await self._actors.reset(guild_id, key)
+                    offenders.append((entry.user, action))
+
+        if entries:
+            # Older entries fall out of the fetched page and can't be seen again
+            oldest = min(entry.id for entry in entries)
+            counted.difference_update([entry_id for entry_id in counted if entry_id < oldest])
+        self._retry(guild, [event for unmatched in waiting.values() for event in unmatched])
+        return offenders
+
+    async def run_sweeper(self, interval=60):
+        while True:
+            await asyncio.sleep(interval)
+            await self._actors.sweep()
+            for guild_id in [guild_id for guild_id, lock in self._locks.items()
+                             if not lock.locked() and guild_id not in self._pending]:
+                del self._locks[guild_id]
@@ -0,0 +1,247 @@
+"""Stand-ins for the discord.py objects the handlers touch, backed by a stub REST layer.
+
+Only the attributes and coroutines the bot's handlers use are modelled. Every call that
+would hit Discord's API goes through `StubREST.call`, which counts it per route and can
+add a fixed latency, so a scenario measures the bot's own work plus a known REST cost.
+"""
+import asyncio
+import itertools
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import discord
+
+DISCORD_EPOCH_MS = 1420070400000
+_sequence = itertools.count()
+
+
+def snowflake():
+    """A unique ID shaped like Discord's, so shard routing and ID ordering behave as in production."""
+    return ((int(time.time() * 1000) - DISCORD_EPOCH_MS) << 22) | (next(_sequence) & 0x3FFFFF)
+
+
+class StubREST:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+
+    async def call(self, route):
+        self.calls[route] += 1
+        # Even with no latency, yield like a real request would
+        await asyncio.sleep(self.latency)
+
+
+class FakeRole:
+    def __init__(self, guild, name, managed=False):
+        self.id = snowflake()
+        self.guild = guild
+        self.name = name
+        self.managed = managed
+        self.mention = f"<@&{self.id}>"
+
+    async def edit(self, **fields):
+        await self.guild.rest.call('role_edit')
+
+    async def delete(self, reason=None):
+        await self.guild.rest.call('role_delete')
+
+
+class FakeMember:
+    def __init__(self, guild, name, bot=False, administrator=False, roles=()):
+        self.id = snowflake()
+        self.guild = guild
+        self.name = self.display_name = name
+        self.bot = bot
+        self.mention = f"<@{self.id}>"
+        self.roles = list(roles)
+        self.guild_permissions = SimpleNamespace(administrator=administrator)
+
+    async def send(self, content=None, **kwargs):
+        await self.guild.rest.call('dm')
+
+    async def timeout(self, duration, reason=None):
+        await self.guild.rest.call('member_edit')
+
+    async def edit(self, reason=None, **fields):
+        if 'roles' in fields:
+            self.roles = list(fields['roles'])
+        await self.guild.rest.call('member_edit')
+
+    async def add_roles(self, *roles, reason=None):
+        self.roles.extend(roles)
+        await self.guild.rest.call('member_roles')
+
+    async def kick(self, reason=None):
+        await self.guild.rest.call('kick')
+
+
+class FakeChannel:
+    def __init__(self, guild, name):
+        self.id = snowflake()
+        self.guild = guild
+        self.name = name
+        self.mention = f"<#{self.id}>"
+        self.sent = 0
+        self.messages = []
+        self.deleted = set()
+
+    async def send(self, content=None, **kwargs):
+        self.sent += 1
+        await self.guild.rest.call('message_create')
+
+    async def history(self, limit=100, before=None, after=None, oldest_first=False):
+        """Messages newest first, fetched a page of 100 per REST call like discord.py does."""
+        remaining = len(self.messages) if limit is None else limit
+        messages = [
+            message for message in reversed(self.messages)
+            if message.id not in self.deleted
+            and (before is None or message.id < before.id) and (after is None or message.id > after.id)
+        ]
+        for start in range(0, min(remaining, len(messages)), 100):
+            await self.guild.rest.call('message_history')
+            for message in messages[start:min(start + 100, remaining)]:
+                yield message
+
+    async def delete_messages(self, messages, reason=None):
+        self.deleted.update(message.id for message in messages)
+        await self.guild.rest.call('message_bulk_delete' if len(messages) > 1 else 'message_delete')
+
+    async def delete(self, reason=None):
+        await self.guild.rest.call('channel_delete')
+
+
+class FakeMessage:
+    def __init__(self, channel, author, content, created_at=None):
+        self.id = snowflake()
+        self.guild = channel.guild
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self.created_at = created_at or datetime.now(timezone.utc)
+
+    async def delete(self, delay=None):
+        self.channel.deleted.add(self.id)
+        await self.guild.rest.call('message_delete')
+
+
+class FakeAuditEntry:
+    def __init__(self, action, user, target):
+        self.id = snowflake()
+        self.action = SimpleNamespace(name=action)
+        self.user = user
+        self.target = target
+
+
+class FakeGuild:
+    def __init__(self, rest, name="Benchmark"):
+        self.id = snowflake()
+        self.rest = rest
+        self.name = name
+        self.verification_level = discord.VerificationLevel.low
+        self.members = []
+        self.member_count = 0
+        self._members = {}
+        self.channels = {}
+        self.roles = [FakeRole(self, "@everyone")]
+        self.audit_entries = []
+        self.owner = self.add_member("Owner", administrator=True)
+        self.owner_id = self.owner.id
+        self.system_channel = self.add_channel("general")
+
+    @property
+    def text_channels(self):
+        return list(self.channels.values())
+
+    def add_member(self, name, **kwargs):
+        member = FakeMember(self, name, **kwargs)
+        self.members.append(member)
+        self._members[member.id] = member
+        self.member_count = len(self.members)
+        return member
+
+    def add_channel(self, name):
+        channel = FakeChannel(self, name)
+        self.channels[channel.id] = channel
+        return channel
+
+    def add_role(self, name, **kwargs):
+        role = FakeRole(self, name, **kwargs)
+        self.roles.append(role)
+        return role
+
+    def log(self, action, user, target):
+        """Record an audit log entry, as Discord does when a moderator acts."""
+        self.audit_entries.append(FakeAuditEntry(action, user, target))
+
+    def get_member(self, member_id):
+        return self._members.get(member_id)
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    def get_role(self, role_id):
+        return next((role for role in self.roles if role.id == role_id), None)
+
+    async def edit(self, reason=None, **fields):
+        for key, value in fields.items():
+            setattr(self, key, value)
+        await self.rest.call('guild_edit')
+
+    async def create_role(self, name="new role", **kwargs):
+        await self.rest.call('role_create')
+        return self.add_role(name)
+
+    async def audit_logs(self, limit=100):
+        await self.rest.call('audit_logs')
+        for entry in reversed(self.audit_entries[-limit:]):
+            yield entry
+
+
+class FakeResponse:
+    def __init__(self, rest):
+        self.rest = rest
+        self.done = False
+
+    def is_done(self):
+        return self.done
+
+    async def send_message(self, content=None, **kwargs):
+        self.done = True
+        await self.rest.call('interaction_response')
+
+    async def edit_message(self, **kwargs):
+        self.done = True
+        await self.rest.call('interaction_response')
+
+    async def defer(self, **kwargs):
+        self.done = True
+        await self.rest.call('interaction_response')
+
+
+class FakeWebhookMessage:
+    def __init__(self, rest):
+        self.rest = rest
+
+    async def edit(self, **fields):
+        await self.rest.call('webhook_edit')
+
+
+class FakeFollowup:
+    def __init__(self, rest):
+        self.rest = rest
+
+    async def send(self, content=None, wait=False, **kwargs):
+        await self.rest.call('webhook_message')
+        return FakeWebhookMessage(self.rest) if wait else None
+
+
+class FakeInteraction:
+    def __init__(self, guild, user, channel=None):
+        self.guild = guild
+        self.guild_id = guild.id
+        self.user = user
+        self.channel = channel or guild.system_channel
+        self.response = FakeResponse(guild.rest)
+        self.followup = FakeFollowup(guild.rest)
@@ -0,0 +1,6 @@
+"""Stand-in for the bot's abilities.py, which is not part of this repository (see models.py here)."""
+
+
+def apply_sqlite_migrations(engine, base, directory):
+    # No migration files to replay; a fresh database gets the current schema directly
+    base.metadata.create_all(engine)
@@ -0,0 +1,48 @@
+"""Stand-in for the bot's models.py, which is not part of this repository.
+
+Only the tables and columns main.py, db.py and tables.py use are defined, so the
+benchmarks can run from a bare checkout:
+    PYTHONPATH=benchmarks/fixtures python -m benchmarks.harness
+A real models.py at the repository root comes first on sys.path and is used instead.
+"""
+from sqlalchemy import Boolean, Column, DateTime, Integer, String, create_engine
+from sqlalchemy.orm import declarative_base
+
+Base = declarative_base()
+# The benchmarks point db.engine at their own throwaway files
+engine = create_engine("sqlite://")
+
+
+class GuildSettings(Base):
+    __tablename__ = 'guild_settings'
+
+    guild_id = Column(String, primary_key=True)
+    filter_enabled = Column(Boolean, default=False)
+    level_enabled = Column(Boolean, default=False)
+    level_up_channel = Column(String)
+    level_up_message = Column(String)
+    log_channel_id = Column(String)
+    raise_verification = Column(Boolean, default=False)
+    trusted_admin_role_id = Column(String)
+    welcome_channel_id = Column(String)
+    welcome_enabled = Column(Boolean, default=False)
+    welcome_message = Column(String)
+    anti_nuke_enabled = Column(Boolean, default=True)
+
+
+class FilteredWord(Base):
+    __tablename__ = 'filtered_words'
+
+    id = Column(Integer, primary_key=True)
+    guild_id = Column(String)
+    word = Column(String)
+
+
+class UserLevel(Base):
+    __tablename__ = 'user_levels'
+
+    id = Column(Integer, primary_key=True)
+    guild_id = Column(String)
+    user_id = Column(String)
+    xp = Column(Integer, default=0)
+    last_xp_gain = Column(DateTime)
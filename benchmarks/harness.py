@@ -0,0 +1,397 @@
+"""Offline load test: replays synthetic gateway traffic through the bot's real handlers.
+
+The handlers in main.py run unchanged against fake guilds, members and channels (see
+benchmarks/fakes.py), a stub REST layer and a throwaway SQLite database migrated with
+apply_sqlite_migrations. Each scenario builds its event trace up front, then replays it
+and reports events per second, p50/p99 handler latency, REST calls made and the peak
+RSS of the process. Results can be saved as a baseline and compared on later runs.
+
+main.py needs models.py and abilities.py, which are not in this repository. Without
+them, run with the stand-ins in benchmarks/fixtures (a real models.py at the repository
+root still takes precedence):
+    PYTHONPATH=benchmarks/fixtures python -m benchmarks.harness
+
+benchmarks/baseline.json is a default run (scale 1, concurrency 1, no REST latency)
+made that way; it records which models module it ran against. Timings depend on the
+machine, so when comparing on another one, save a baseline there first from the commit
+you are comparing against.
+
+Scenarios:
+    chat_flood         guild chat with bursts from spammers and some filtered words
+    raid               a join burst big enough to switch the guild into raid mode
+    nuke               one member deleting channels and roles and banning members
+    leaderboard_storm  /leaderboard and /rank against a large ranking while XP changes
+    purge              /clear over long channel histories, unfiltered and filtered
+
+Run from the repository root:
+    python -m benchmarks.harness [--scenarios chat_flood,raid] [--scale 1.0]
+                                 [--concurrency 1] [--rest-latency-ms 0]
+                                 [--baseline benchmarks/baseline.json] [--save-baseline]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine
+
+from benchmarks.fakes import FakeGuild, FakeInteraction, FakeMessage, StubREST
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+WORDS = ['lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit', 'sed', 'do']
+FILTERED = ['badword', 'spoiler', 'scam link']
+STANDARD_RESULTS = ('events', 'events_per_sec', 'p50_ms', 'p99_ms', 'max_ms', 'peak_rss_mb', 'rest_calls',
+                    'errors', 'background_tasks_cancelled')
+
+
+def open_bot(database_path):
+    """Import main with the DB layer pointed at a fresh, migrated SQLite file."""
+    # No metrics server or shared counters: the harness measures the in-process defaults
+    for name in ('METRICS_PORT', 'STATE_BACKEND', 'SHARD_COUNT', 'SHARD_IDS', 'SHARD_PROCESSES'):
+        os.environ.pop(name, None)
+    import main
+    from abilities import apply_sqlite_migrations
+    from models import Base
+
+    engine = create_engine(f"sqlite:///{database_path}")
+    main.db.engine = main.engine = engine
+    main.db.apply_storage_profile(engine)
+    apply_sqlite_migrations(engine, Base, 'migrations')
+    main.db.ensure_indexes()
+    return main
+
+
+class Harness:
+    """The imported main module plus the stub REST layer shared by a scenario's guilds."""
+
+    def __init__(self, main, rest):
+        self.main = main
+        self.rest = rest
+        # Optional `report(elapsed) -> {name: value}` with scenario-specific results
+        self.report = None
+        self._paced = {}
+
+    def lift_pacing(self, *routes):
+        """Stop pacing these bulk routes until the scenario ends, to measure the bot's own cost."""
+        for route in routes:
+            self._paced.setdefault(route, self.main.bulk.route_rates.get(route))
+            self.main.bulk.route_rates[route] = (1e9, 1e9)
+
+    def restore_pacing(self):
+        for route, rate in self._paced.items():
+            if rate is None:
+                self.main.bulk.route_rates.pop(route, None)
+            else:
+                self.main.bulk.route_rates[route] = rate
+
+    async def guild(self, members=0, **settings):
+        guild = FakeGuild(self.rest)
+        for index in range(members):
+            guild.add_member(f"member{index}")
+        if settings:
+            self.main.settings_cache.update(await self.main.db.update_guild_settings(guild.id, **settings))
+        return guild
+
+
+def chat_text(rng, filtered_ratio):
+    text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 30)))
+    if rng.random() < filtered_ratio:
+        text += ' ' + rng.choice(FILTERED)
+    return text
+
+
+async def chat_flood(harness, rng, scale):
+    guild = await harness.guild(members=500, level_enabled=True, filter_enabled=True)
+    for word in FILTERED:
+        await harness.main.db.add_filtered_word(guild.id, word)
+    channels = [guild.add_channel(f"chat{index}") for index in range(5)]
+    spammers = guild.members[1:11]
+    trace = []
+    for _ in range(int(20000 * scale)):
+        channel = rng.choice(channels)
+        if rng.random() < 0.05:
+            # A spammer fires off a quick burst
+            author = rng.choice(spammers)
+            for _ in range(rng.randint(5, 12)):
+                trace.append(('message', harness.main.on_message, (FakeMessage(channel, author, 'buy now'),)))
+        else:
+            author = rng.choice(guild.members)
+            trace.append(('message', harness.main.on_message, (FakeMessage(channel, author, chat_text(rng, 0.02)),)))
+    return trace
+
+
+async def raid(harness, rng, scale):
+    guild = await harness.guild(welcome_enabled=True, welcome_message="Welcome {user} to {server}, member #{membercount}!")
+    guild.add_role("New Member")
+    log_channel = guild.add_channel("mod-log")
+    harness.main.settings_cache.update(await harness.main.db.update_guild_settings(guild.id, log_channel_id=str(log_channel.id)))
+    await harness.main.db.set_raise_verification(guild.id, True)
+    # Joiners are created up front; only the join events are timed
+    joiners = [guild.add_member(f"raider{index}") for index in range(int(5000 * scale))]
+    return [('member_join', harness.main.on_member_join, (member,)) for member in joiners]
+
+
+async def nuke(harness, rng, scale):
+    guild = await harness.guild(members=200, anti_nuke_enabled=True)
+    attacker = guild.add_member("Compromised admin", administrator=True)
+    channels = [guild.add_channel(f"channel{index}") for index in range(int(300 * scale))]
+    roles = [guild.add_role(f"role{index}") for index in range(int(150 * scale))]
+    victims = rng.sample(guild.members[1:-1], min(len(guild.members) - 2, int(150 * scale)))
+    main = harness.main
+
+    # Discord writes the audit log entry as the action happens
+    async def channel_deleted(channel):
+        guild.log('channel_delete', attacker, channel)
+        await main.on_guild_channel_delete(channel)
+
+    async def role_deleted(role):
+        guild.log('role_delete', attacker, role)
+        await main.on_guild_role_delete(role)
+
+    async def member_banned(member):
+        guild.log('ban', attacker, member)
+        await main.on_member_ban(guild, member)
+
+    trace = [('channel_delete', channel_deleted, (channel,)) for channel in channels]
+    trace += [('role_delete', role_deleted, (role,)) for role in roles]
+    trace += [('member_ban', member_banned, (member,)) for member in victims]
+    rng.shuffle(trace)
+    return trace
+
+
+async def leaderboard_storm(harness, rng, scale):
+    member_count = int(20000 * scale)
+    guild = await harness.guild(members=member_count, level_enabled=True)
+    now = datetime.utcnow()
+    await harness.main.db.write_xp_batch([
+        {'guild_id': str(guild.id), 'user_id': str(member.id), 'delta': rng.randint(0, 500000), 'last_xp_gain': now}
+        for member in guild.members
+    ])
+    main = harness.main
+    pages = max(1, member_count // 10)
+    channel = guild.add_channel("bot-commands")
+    trace = []
+    for _ in range(int(20000 * scale)):
+        roll = rng.random()
+        member = rng.choice(guild.members)
+        if roll < 0.5:
+            trace.append(('leaderboard', main.leaderboard_top.callback,
+                          (FakeInteraction(guild, member), rng.randint(1, min(pages, 50)))))
+        elif roll < 0.8:
+            trace.append(('rank', main.rank.callback, (FakeInteraction(guild, member), None)))
+        else:
+            # Chat keeps moving the ranking, so cached pages keep being invalidated
+            trace.append(('message', main.on_message, (FakeMessage(channel, member, chat_text(rng, 0)),)))
+    return trace
+
+
+async def purge(harness, rng, scale):
+    guild = await harness.guild(members=300)
+    for member in guild.members[::5]:
+        member.bot = True
+    moderator = guild.add_member("Moderator")
+    now = datetime.now(timezone.utc)
+    channels = []
+    for index in range(3):
+        channel = guild.add_channel(f"busy{index}")
+        count = int(10000 * scale)
+        # Oldest first; the first tenth is past the 14-day bulk delete limit
+        for position in range(count):
+            age = timedelta(days=20) if position < count // 10 else timedelta(minutes=count - position)
+            channel.messages.append(FakeMessage(channel, rng.choice(guild.members), chat_text(rng, 0.1), now - age))
+        channels.append(channel)
+
+    # Discord's own limits (one bulk delete a second) would make this a test of the pacing
+    harness.lift_pacing('message_bulk_delete', 'message_delete')
+    harness.report = lambda elapsed: {
+        'messages_per_sec': sum(len(channel.deleted) for channel in channels) / elapsed if elapsed else 0.0,
+        'deleted': sum(len(channel.deleted) for channel in channels),
+        'bulk_calls': harness.rest.calls['message_bulk_delete'],
+        'single_calls': harness.rest.calls['message_delete'],
+    }
+    clear = harness.main.clear_messages.callback
+    interaction = lambda channel: FakeInteraction(guild, moderator, channel)
+    return [
+        ('clear', clear, (interaction(channels[0]), 10000, None, False, None, None, None)),
+        ('clear', clear, (interaction(channels[1]), 2000, None, True, None, None, None)),
+        ('clear', clear, (interaction(channels[2]), 500, None, False, FILTERED[0], None, None)),
+    ]
+
+
+SCENARIOS = {
+    'chat_flood': chat_flood,
+    'raid': raid,
+    'nuke': nuke,
+    'leaderboard_storm': leaderboard_storm,
+    'purge': purge,
+}
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+async def replay(trace, concurrency):
+    """Run every event in order through `concurrency` workers, timing each handler call."""
+    latencies = []
+    errors = 0
+    events = iter(trace)
+
+    async def worker():
+        nonlocal errors
+        for _, handler, args in events:
+            started = time.perf_counter()
+            try:
+                await handler(*args)
+            except Exception as e:
+                errors += 1
+                if errors <= 3:
+                    print(f"🚨 Error: Handler {handler.__name__} failed: {str(e)}")
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - started, errors
+
+
+async def run_scenario(main, name, seed, scale, concurrency, rest_latency):
+    rest = StubREST(rest_latency)
+    harness = Harness(main, rest)
+    trace = await SCENARIOS[name](harness, random.Random(seed), scale)
+    rest.calls.clear()
+    before = asyncio.all_tasks()
+
+    try:
+        latencies, elapsed, errors = await replay(trace, concurrency)
+    finally:
+        harness.restore_pacing()
+
+    # Stop what the scenario left running (raid summaries, attribution timers, role queues)
+    leftover = [task for task in asyncio.all_tasks() - before if task is not asyncio.current_task()]
+    for task in leftover:
+        task.cancel()
+    await asyncio.gather(*leftover, return_exceptions=True)
+
+    latencies.sort()
+    return {
+        **(harness.report(elapsed) if harness.report else {}),
+        'events': len(trace),
+        'events_per_sec': len(trace) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': latencies[-1] * 1000 if latencies else 0.0,
+        'peak_rss_mb': peak_rss_mb(),
+        'rest_calls': sum(rest.calls.values()),
+        'errors': errors,
+        'background_tasks_cancelled': len(leftover),
+    }
+
+
+def models_module():
+    """Where the models module came from, relative to the repository when inside it."""
+    import models
+    path = os.path.abspath(models.__file__)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.relpath(path, root) if path.startswith(root + os.sep) else path
+
+
+def compare(result, baseline):
+    """One line of relative changes against a baseline run; higher is better only for events/s."""
+    parts = []
+    for key in ('events_per_sec', 'messages_per_sec', 'p50_ms', 'p99_ms', 'peak_rss_mb'):
+        old, new = baseline.get(key), result.get(key)
+        if old and new is not None:
+            parts.append(f"{key} {(new - old) / old * 100:+.1f}%")
+    return ', '.join(parts)
+
+
+async def run_all(names, seed, scale, concurrency, rest_latency):
+    with tempfile.TemporaryDirectory() as directory:
+        main = open_bot(os.path.join(directory, 'bench.db'))
+        # Handlers read the bot's own ID (e.g. to never quarantine itself)
+        main.bot._connection.user = SimpleNamespace(id=0, mention='<@0>')
+        await main.thresholds.load_all()
+        results = {}
+        for name in names:
+            results[name] = await run_scenario(main, name, seed, scale, concurrency, rest_latency)
+        await main.xp_ledger.flush()
+        await main.http.close()
+        await main.counters.close()
+        main.db.executor.shutdown(wait=True)
+        return results
+
+
+def run(names, seed=0, scale=1.0, concurrency=1, rest_latency=0.0, baseline_path=DEFAULT_BASELINE, save=False):
+    print(f"scale={scale} concurrency={concurrency} rest_latency={rest_latency * 1000:g}ms")
+    results = asyncio.run(run_all(names, seed, scale, concurrency, rest_latency))
+
+    settings = {'seed': seed, 'scale': scale, 'concurrency': concurrency, 'rest_latency_ms': rest_latency * 1000}
+    baseline = {}
+    if baseline_path and os.path.exists(baseline_path):
+        with open(baseline_path) as file:
+            saved = json.load(file)
+        baseline = saved.get('scenarios', {})
+        differs = [f"{key} {saved.get(key)}" for key, value in settings.items() if saved.get(key, value) != value]
+        if differs:
+            print(f"Baseline was run with {', '.join(differs)}; comparisons are not like for like")
+        print(f"Comparing against {baseline_path} (Python {saved.get('python', '?')} on {saved.get('machine', '?')}, "
+              f"models from {saved.get('models', '?')})")
+        if saved.get('models', models_module()) != models_module():
+            print(f"This run uses models from {models_module()}; comparisons are not like for like")
+
+    for name, result in results.items():
+        print(f"{name}: {result['events']} events, {result['events_per_sec']:,.0f} events/s, "
+              f"p50 {result['p50_ms']:.3f} ms, p99 {result['p99_ms']:.3f} ms, max {result['max_ms']:.1f} ms, "
+              f"peak RSS {result['peak_rss_mb']:.0f} MB, {result['rest_calls']} REST calls"
+              + (f", {result['errors']} errors" if result['errors'] else ""))
+        extra = {key: value for key, value in result.items() if key not in STANDARD_RESULTS}
+        if extra:
+            print("  " + ", ".join(f"{key} {value:,.0f}" for key, value in extra.items()))
+        if name in baseline:
+            print(f"  vs baseline: {compare(result, baseline[name])}")
+
+    if save:
+        with open(baseline_path, 'w') as file:
+            json.dump({**settings, 'python': platform.python_version(), 'machine': platform.platform(),
+                       'cpus': os.cpu_count(), 'models': models_module(), 'scenarios': results},
+                      file, indent=2, sort_keys=True)
+            file.write('\n')
+        print(f"Saved baseline to {baseline_path}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--scale', type=float, default=1.0, help="multiply every scenario's size")
+    parser.add_argument('--concurrency', type=int, default=1, help="events in flight at once")
+    parser.add_argument('--rest-latency-ms', type=float, default=0.0, help="simulated latency per REST call")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    names = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    run(names, args.seed, args.scale, args.concurrency, args.rest_latency_ms / 1000, args.baseline, args.save_baseline)
+
+
+if __name__ == '__main__':
+    main()
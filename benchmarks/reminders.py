@@ -0,0 +1,64 @@
+"""Reminder scheduler at scale: memory per pending reminder and delivery throughput.
+
+Run from the repository root:
+    python -m benchmarks.reminders [--reminders 100000] [--spread 5]
+"""
+import argparse
+import asyncio
+import random
+import time
+import tracemalloc
+
+from reminders import ReminderScheduler
+
+
+async def run(reminder_count, spread, seed=0):
+    rng = random.Random(seed)
+    delivered = []
+
+    async def loader():
+        return []
+
+    async def fetcher(ids):
+        return [(reminder_id, 'user', 'text', 0) for reminder_id in ids]
+
+    async def deliver(rows):
+        delivered.extend(time.time() for _ in rows)
+
+    async def deleter(ids):
+        pass
+
+    scheduler = ReminderScheduler(loader, fetcher, deliver, deleter)
+    start = time.time() + 1
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    for reminder_id in range(reminder_count):
+        scheduler.add(reminder_id, start + rng.random() * spread)
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    task = asyncio.create_task(scheduler.run())
+    while len(delivered) < reminder_count:
+        await asyncio.sleep(0.1)
+    # A fixed handful (this coroutine, the scheduler and its timer), however many are pending
+    running = len(asyncio.all_tasks())
+    task.cancel()
+
+    lateness = sorted(delivered)[-1] - (start + spread)
+    print(f"reminders={reminder_count} spread={spread}s")
+    print(f"memory:     {(after - before) / reminder_count:.0f} bytes per pending reminder")
+    print(f"delivered:  {len(delivered):,} in {delivered[-1] - start:.2f}s, last one {max(lateness, 0) * 1000:.0f} ms late")
+    print(f"tasks:      {running} running")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--reminders', type=int, default=100000)
+    parser.add_argument('--spread', type=float, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(run(args.reminders, args.spread, args.seed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Event throughput of the message path when shards are split over several processes.
+
+Each process gets a fake gateway that replays MESSAGE_CREATE payloads for the guilds of
+its shards. Events are decoded and dispatched on an asyncio loop through the same
+in-memory steps the bot runs per message: the per-shard spam counter, the compiled word
+filter and the level lookup. The total work is fixed, so on a machine with enough cores
+throughput should grow with the process count until it runs out of cores.
+
+Run from the repository root:
+    python -m benchmarks.sharding [--shards 8] [--events 200000] [--processes 1,2,4]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import time
+
+from leveling import calculate_level_for_xp
+from rate_limit import SlidingWindowCounter
+from sharding import ShardConfig, ShardedState, shard_for
+from word_filter import WordFilter
+
+
+def guild_ids_for(shard_ids, shard_count, per_shard, rng):
+    guild_ids = []
+    for shard_id in shard_ids:
+        while sum(1 for guild_id in guild_ids if shard_for(guild_id, shard_count) == shard_id) < per_shard:
+            guild_id = rng.getrandbits(63)
+            if shard_for(guild_id, shard_count) == shard_id:
+                guild_ids.append(guild_id)
+    return guild_ids
+
+
+def fake_gateway(shard_ids, shard_count, event_count, seed):
+    """Raw gateway frames for this process's shards, as discord.py would receive them."""
+    rng = random.Random(seed)
+    guild_ids = guild_ids_for(shard_ids, shard_count, 5, rng)
+    words = ['lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit']
+    return [
+        json.dumps({'op': 0, 't': 'MESSAGE_CREATE', 's': sequence, 'd': {
+            'guild_id': str(rng.choice(guild_ids)),
+            'author': {'id': str(rng.randrange(5000)), 'bot': False},
+            'content': ' '.join(rng.choice(words) for _ in range(rng.randint(3, 30))),
+        }})
+        for sequence in range(event_count)
+    ]
+
+
+def run_process(shard_ids, shard_count, event_count, seed):
+    frames = fake_gateway(shard_ids, shard_count, event_count, seed)
+    config = ShardConfig(shard_count, shard_ids)
+    spam = ShardedState(lambda: SlidingWindowCounter(idle_ttl=300), lambda: shard_count)
+    word_filter = WordFilter([f"badword{index}" for index in range(1000)])
+    xp = {}
+
+    async def on_message(data):
+        guild_id, user_id = int(data['guild_id']), data['author']['id']
+        if spam.for_guild(guild_id).hit(guild_id, user_id, 5, 10) > 5:
+            return
+        if word_filter.find(data['content']):
+            return
+        xp[user_id] = xp.get(user_id, 0) + 20
+        calculate_level_for_xp(xp[user_id])
+
+    async def gateway():
+        for frame in frames:
+            payload = json.loads(frame)
+            data = payload['d']
+            if payload['t'] == 'MESSAGE_CREATE' and config.owns_guild(int(data['guild_id'])):
+                await on_message(data)
+
+    # perf_counter is the system-wide monotonic clock on Linux, so spans line up across processes
+    started = time.perf_counter()
+    asyncio.run(gateway())
+    return started, time.perf_counter()
+
+
+def run(shard_count, event_count, process_counts, seed=0):
+    print(f"shards={shard_count} events={event_count} cpus={os.cpu_count()}")
+    baseline = None
+    for processes in process_counts:
+        config = ShardConfig(shard_count, list(range(shard_count)), processes)
+        ranges = config.process_ranges()
+        jobs = [(shard_ids, shard_count, event_count * len(shard_ids) // shard_count, seed + index)
+                for index, shard_ids in enumerate(ranges)]
+        with multiprocessing.Pool(processes) as pool:
+            started = time.perf_counter()
+            # Frame generation happens in the workers too; only the dispatch spans count
+            spans = pool.starmap(run_process, jobs)
+            wall = time.perf_counter() - started
+        dispatch = max(end for _, end in spans) - min(start for start, _ in spans)
+        rate = event_count / dispatch
+        baseline = baseline or rate
+        print(f"processes={processes}: {rate:,.0f} events/s ({rate / baseline:.2f}x), "
+              f"dispatch {dispatch:.2f}s, wall {wall:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shards', type=int, default=8)
+    parser.add_argument('--events', type=int, default=200000)
+    parser.add_argument('--processes', default='1,2,4')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    run(args.shards, args.events, [int(count) for count in args.processes.split(',')], args.seed)
+
+
+if __name__ == '__main__':
+    main()
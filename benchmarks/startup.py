@@ -0,0 +1,94 @@
+"""Cold start: time from process start to the first served slash command, by phase.
+
+Each run is a fresh interpreter that goes through the bot's own start-up steps offline:
+importing main, migrating the database, loading the small state tables setup_hook
+loads, hashing the command tree the way CommandSync does, and serving a first /rank
+against a fake guild. Login, the gateway handshake and any sync call are network bound
+and left out. The first run starts from an empty database, as on a first deploy; the
+others reuse it, as on a restart.
+
+Run from the repository root:
+    python -m benchmarks.startup [--runs 5]
+Without models.py and abilities.py, prefix PYTHONPATH=benchmarks/fixtures (see
+benchmarks/harness.py).
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from startup import StartupTimeline
+
+PHASES = ('import', 'database', 'state', 'tree_hash', 'first_interaction')
+
+
+async def child(database_path, timeline):
+    from types import SimpleNamespace
+
+    from benchmarks.fakes import FakeInteraction, StubREST
+    from benchmarks.harness import Harness, open_bot
+    from startup import tree_hash
+
+    # main is already imported, so this times opening and migrating the database
+    main = open_bot(database_path)
+    timeline.mark('database')
+    await asyncio.gather(main.thresholds.load_all(), main.temp_voice.load_all(), main.snapshots.load_all())
+    timeline.mark('state')
+    tree_hash(main.tree)
+    timeline.mark('tree_hash')
+
+    main.bot._connection.user = SimpleNamespace(id=0, mention='<@0>')
+    harness = Harness(main, StubREST())
+    guild = await harness.guild(members=1, level_enabled=True)
+    await main.rank.callback(FakeInteraction(guild, guild.members[-1]), None)
+    timeline.mark('first_interaction')
+
+    await main.http.close()
+    await main.counters.close()
+    main.db.executor.shutdown(wait=True)
+
+
+def run_child(database_path):
+    timeline = StartupTimeline()
+    import main  # noqa: F401  (imported before open_bot so its cost lands in the 'import' phase)
+    timeline.mark('import')
+    asyncio.run(child(database_path, timeline))
+    print(json.dumps(timeline.marks))
+
+
+def run(runs=5):
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        database_path = os.path.join(directory, 'startup.db')
+        for index in range(runs):
+            output = subprocess.run([sys.executable, '-m', 'benchmarks.startup', '--child', database_path],
+                                    check=True, capture_output=True, text=True).stdout
+            marks = json.loads(output.strip().splitlines()[-1])
+            results.append(marks)
+            print(f"run {index + 1} ({'empty database' if index == 0 else 'restart'}): "
+                  + ", ".join(f"{phase} {marks[phase] * 1000:.0f} ms" for phase in PHASES))
+
+    restarts = results[1:]
+    if restarts:
+        print("median restart: " + ", ".join(
+            f"{phase} {statistics.median(marks[phase] for marks in restarts) * 1000:.0f} ms" for phase in PHASES))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help="fresh processes to start; the first gets an empty database")
+    parser.add_argument('--child', metavar='DATABASE', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child(args.child)
+    else:
+        run(args.runs)
+
+
+if __name__ == '__main__':
+    main()
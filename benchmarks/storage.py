@@ -0,0 +1,241 @@
+"""SQLite queries per second on the bot's hot paths, before and after the storage profile.
+
+Both databases hold the same rows: `--rows` UserLevel rows spread over guilds of
+`--guild-size` members, plus a settings row and a few filtered words per guild.
+"before" is how the bot ran until db.STORAGE_PRAGMAS: default pragmas, no composite
+indexes for single-member XP updates or filter lookups, and ORM queries built on every
+call. "after" is db.py as it runs now, on a copy of the same file.
+
+Queries:
+    settings   one guild's GuildSettings row, as a settings cache miss loads it
+    words      one guild's filtered words
+    guild_xp   every XP row of one guild, as the XP ledger loads a guild
+    xp_flush   500-change XP batches as the ledger flushes them, counted per change
+    mixed      guild_xp on 4 threads while xp_flush writes on a fifth
+
+Run from the repository root:
+    python -m benchmarks.storage [--rows 1000000] [--guild-size 1000] [--seconds 3]
+Without models.py and abilities.py, prefix PYTHONPATH=benchmarks/fixtures (see
+benchmarks/harness.py).
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import bindparam, create_engine, insert, text, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+import db
+from models import Base, FilteredWord, GuildSettings, UserLevel
+
+# The indexes added together with the storage profile; "before" drops them
+PROFILE_INDEXES = ('ux_userlevel_guild_id_user_id', 'ix_filteredword_guild_id_word')
+WORDS_PER_GUILD = 5
+FLUSH_SIZE = 500
+READERS = 4
+
+
+def build(path, rows, guild_size, rng):
+    """Create the schema and fill it; returns the guild IDs and each guild's member IDs."""
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    guilds = {str(rng.getrandbits(62)): [] for _ in range(max(1, rows // guild_size))}
+    guild_ids = list(guilds)
+    now = datetime.utcnow()
+    with engine.begin() as connection:
+        batch = []
+        for index in range(rows):
+            guild_id = guild_ids[index % len(guild_ids)]
+            user_id = str(rng.getrandbits(62))
+            guilds[guild_id].append(user_id)
+            batch.append({'guild_id': guild_id, 'user_id': user_id, 'xp': rng.randint(0, 500000), 'last_xp_gain': now})
+            if len(batch) == 50000:
+                connection.execute(insert(UserLevel.__table__), batch)
+                batch = []
+        if batch:
+            connection.execute(insert(UserLevel.__table__), batch)
+        connection.execute(insert(GuildSettings.__table__), [{'guild_id': guild_id} for guild_id in guilds])
+        connection.execute(insert(FilteredWord.__table__), [
+            {'guild_id': guild_id, 'word': f"word{index}"} for guild_id in guilds for index in range(WORDS_PER_GUILD)])
+    engine.dispose()
+    return guilds
+
+
+def drop_profile_indexes(path):
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as connection:
+        for name in PROFILE_INDEXES:
+            connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    engine.dispose()
+
+
+class Before:
+    """The DB functions as they were before the storage profile, on a default engine."""
+
+    def __init__(self, path):
+        self.engine = create_engine(f"sqlite:///{path}")
+
+    def settings(self, guild_id):
+        with Session(self.engine) as session:
+            settings = session.query(GuildSettings).filter_by(guild_id=guild_id).first()
+            return db.snapshot_settings(settings) if settings else None
+
+    def words(self, guild_id):
+        with Session(self.engine) as session:
+            return [word for (word,) in session.query(FilteredWord.word).filter_by(guild_id=guild_id).all()]
+
+    def guild_xp(self, guild_id):
+        with Session(self.engine) as session:
+            rows = session.query(UserLevel.user_id, UserLevel.xp, UserLevel.last_xp_gain).filter_by(guild_id=guild_id).all()
+            return {user_id: (xp, last_xp_gain) for user_id, xp, last_xp_gain in rows}
+
+    def xp_flush(self, batch):
+        table = UserLevel.__table__
+        updates = [{'b_guild_id': change['guild_id'], 'b_user_id': change['user_id'],
+                    'b_delta': change['delta'], 'b_last_xp_gain': change['last_xp_gain']} for change in batch]
+        with Session(self.engine) as session:
+            session.execute(
+                update(table)
+                .where(table.c.guild_id == bindparam('b_guild_id'), table.c.user_id == bindparam('b_user_id'))
+                .values(xp=table.c.xp + bindparam('b_delta'), last_xp_gain=bindparam('b_last_xp_gain')),
+                updates
+            )
+            session.commit()
+
+
+class After:
+    """db.py's own functions, pointed at an engine with the storage profile."""
+
+    def __init__(self, path):
+        self.engine = create_engine(f"sqlite:///{path}")
+        db.apply_storage_profile(self.engine)
+        db.engine = self.engine
+
+    def settings(self, guild_id):
+        return db._get_guild_settings(guild_id)
+
+    def words(self, guild_id):
+        return db._get_filtered_words(guild_id)
+
+    def guild_xp(self, guild_id):
+        return db._get_guild_xp(guild_id)
+
+    def xp_flush(self, batch):
+        db._write_xp_batch(batch)
+
+
+def flush_batch(guilds, rng):
+    """A ledger flush: changes for random members of a few active guilds."""
+    active = rng.sample(list(guilds), min(5, len(guilds)))
+    now = datetime.utcnow()
+    return [{'guild_id': guild_id, 'user_id': rng.choice(guilds[guild_id]), 'delta': rng.randint(15, 25),
+             'last_xp_gain': now}
+            for guild_id in (rng.choice(active) for _ in range(FLUSH_SIZE))]
+
+
+def rate(call, seconds, per_call=1):
+    count, started = 0, time.perf_counter()
+    deadline = started + seconds
+    while time.perf_counter() < deadline:
+        call()
+        count += per_call
+    return count / (time.perf_counter() - started)
+
+
+def mixed(store, guilds, seconds, seed):
+    """Reads and written changes per second with READERS readers beside one writer."""
+    stop = threading.Event()
+    counts = {'reads': 0, 'writes': 0, 'locked': 0}
+    lock = threading.Lock()
+    guild_ids = list(guilds)
+
+    def reader(index):
+        rng = random.Random(seed + index)
+        while not stop.is_set():
+            try:
+                store.guild_xp(rng.choice(guild_ids))
+            except OperationalError:
+                key = 'locked'
+            else:
+                key = 'reads'
+            with lock:
+                counts[key] += 1
+
+    def writer():
+        rng = random.Random(seed)
+        while not stop.is_set():
+            try:
+                store.xp_flush(flush_batch(guilds, rng))
+            except OperationalError:
+                key, amount = 'locked', 1
+            else:
+                key, amount = 'writes', FLUSH_SIZE
+            with lock:
+                counts[key] += amount
+
+    threads = [threading.Thread(target=reader, args=(index,)) for index in range(READERS)]
+    threads.append(threading.Thread(target=writer))
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return counts['reads'] / elapsed, counts['writes'] / elapsed, counts['locked']
+
+
+def measure(store, guilds, seconds, seed):
+    rng = random.Random(seed)
+    guild_ids = list(guilds)
+    results = {
+        'settings': rate(lambda: store.settings(rng.choice(guild_ids)), seconds),
+        'words': rate(lambda: store.words(rng.choice(guild_ids)), seconds),
+        'guild_xp': rate(lambda: store.guild_xp(rng.choice(guild_ids)), seconds),
+        'xp_flush': rate(lambda: store.xp_flush(flush_batch(guilds, rng)), seconds, FLUSH_SIZE),
+    }
+    results['mixed_reads'], results['mixed_writes'], results['mixed_locked'] = mixed(store, guilds, seconds, seed)
+    store.engine.dispose()
+    return results
+
+
+def run(rows=1000000, guild_size=1000, seconds=3.0, seed=0):
+    with tempfile.TemporaryDirectory() as directory:
+        before_path, after_path = os.path.join(directory, 'before.db'), os.path.join(directory, 'after.db')
+        started = time.perf_counter()
+        guilds = build(before_path, rows, guild_size, random.Random(seed))
+        shutil.copyfile(before_path, after_path)
+        drop_profile_indexes(before_path)
+        print(f"{rows:,} UserLevel rows in {len(guilds):,} guilds, built in {time.perf_counter() - started:.1f}s")
+
+        before = measure(Before(before_path), guilds, seconds, seed)
+        after = measure(After(after_path), guilds, seconds, seed)
+
+    for name in before:
+        if name == 'mixed_locked':
+            print(f"{name:>13}: {before[name]:,.0f} -> {after[name]:,.0f} lock errors")
+            continue
+        speedup = after[name] / before[name] if before[name] else float('inf')
+        print(f"{name:>13}: {before[name]:>10,.0f} -> {after[name]:>10,.0f} per second ({speedup:.1f}x)")
+    return {'before': before, 'after': after}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--guild-size', type=int, default=1000, help="members per guild")
+    parser.add_argument('--seconds', type=float, default=3.0, help="time spent on each query")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    run(args.rows, args.guild_size, args.seconds, args.seed)
+
+
+if __name__ == '__main__':
+    main()
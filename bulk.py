@@ -0,0 +1,159 @@
+import asyncio
+import time
+
+import discord
+
+# Pacing per REST route as (requests per second, burst). discord.py already retries 429s;
+# these keep bulk jobs under Discord's buckets so they don't trigger them in the first place.
+ROUTE_RATES = {
+    'kick': (1.0, 5),
+    'ban': (1.0, 5),
+    'role_edit': (1.0, 5),
+    'role_create': (1.0, 5),
+    'channel_create': (1.0, 5),
+    'member_roles': (2.0, 10),
+    'dm': (1.0, 5),
+    'message_delete': (1.0, 5),
+    'message_bulk_delete': (1.0, 2),
+}
+DEFAULT_RATE = (1.0, 5)
+
+
+def safe_progress(on_progress):
+    """Wrap `await on_progress(job)` so a failed report never stops the job.
+
+    Progress messages stop being editable once the interaction token expires (15 minutes)
+    or the user dismisses them; after the first failure reporting is skipped.
+    """
+    if on_progress is None:
+        return None
+    failed = False
+
+    async def report(job):
+        nonlocal failed
+        if failed:
+            return
+        try:
+            await on_progress(job)
+        except discord.HTTPException as e:
+            failed = True
+            print(f"🚨 Error: Could not report progress of {job.description}: {str(e)}")
+
+    return report
+
+
+class TokenBucket:
+    def __init__(self, rate, burst, on_wait=None):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.on_wait = on_wait
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            waited = 0.0
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    if waited and self.on_wait:
+                        self.on_wait(waited)
+                    return
+                delay = (1 - self.tokens) / self.rate
+                waited += delay
+                await asyncio.sleep(delay)
+
+
+class BulkJob:
+    """Progress and cancellation state of one bulk operation."""
+
+    def __init__(self, description, total):
+        self.description = description
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.cancelled = False
+        self.finished = False
+        self.started = time.monotonic()
+
+    def cancel(self):
+        self.cancelled = True
+
+    def summary(self):
+        processed = self.done + self.failed
+        if self.finished:
+            state = "cancelled" if self.cancelled else "finished"
+        else:
+            state = "cancelling" if self.cancelled else "in progress"
+        text = f"{self.description}: {processed}/{self.total} ({state})"
+        if self.failed:
+            text += f", {self.failed} failed"
+        return text
+
+
+class BulkScheduler:
+    """Runs bulk REST actions with bounded concurrency and per-route pacing.
+
+    Buckets are keyed by (route, scope) so that, like Discord's own buckets, jobs in
+    different guilds don't slow each other down.
+    """
+
+    def __init__(self, concurrency=10, route_rates=None):
+        self.route_rates = dict(ROUTE_RATES, **(route_rates or {}))
+        # Optional `on_wait(route, seconds)`, told whenever pacing holds a request back
+        self.on_wait = None
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._buckets = {}
+
+    def bucket(self, route, scope=None):
+        key = (route, scope)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            on_wait = (lambda seconds: self.on_wait(route, seconds)) if self.on_wait else None
+            bucket = self._buckets[key] = TokenBucket(*self.route_rates.get(route, DEFAULT_RATE), on_wait=on_wait)
+        return bucket
+
+    async def run(self, job, route, items, action, scope=None, concurrency=3, on_progress=None, progress_interval=2.0):
+        """Apply `await action(item)` to every item, reporting via `await on_progress(job)`.
+
+        Failed items are counted rather than raised. Cancelling the job stops new items
+        from starting; ones already in flight finish.
+        """
+        bucket = self.bucket(route, scope)
+        pending = iter(items)
+        on_progress = safe_progress(on_progress)
+
+        async def worker():
+            for item in pending:
+                if job.cancelled:
+                    return
+                await bucket.acquire()
+                async with self._semaphore:
+                    try:
+                        await action(item)
+                        job.done += 1
+                    except Exception:
+                        job.failed += 1
+
+        workers = [asyncio.create_task(worker()) for _ in range(max(1, min(concurrency, job.total)))]
+        try:
+            while True:
+                finished, running = await asyncio.wait(workers, timeout=progress_interval)
+                if not running:
+                    break
+                if on_progress:
+                    await on_progress(job)
+        except asyncio.CancelledError:
+            job.cancel()
+            raise
+        finally:
+            for task in workers:
+                task.cancel()
+            job.finished = True
+        if on_progress:
+            await on_progress(job)
+        return job
@@ -0,0 +1,490 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from sqlalchemy import bindparam, event, inspect, select, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from models import engine, GuildSettings, FilteredWord, UserLevel
+from tables import ActivityRollup, BotState, ChannelActivity, GuildObjectSnapshot, GuildThreshold, RaidSettings, Reminder, TempVoiceChannel, VoiceLobby, ADDED_INDEXES, DROPPED_INDEXES, USER_LEVEL_UNIQUE_INDEX
+
+# All SQLAlchemy work runs on this pool so a slow fsync or a locked database never
+# stalls the gateway loop. SQLite serialises writers anyway, so a few threads suffice.
+executor = ThreadPoolExecutor(max_workers=int(os.environ.get('DB_WORKERS', 4)), thread_name_prefix='db')
+
+# Storage profile set on every SQLite connection. WAL lets the executor's readers run while
+# a write commits; under WAL, synchronous=NORMAL can lose the last commits on power loss but
+# never corrupts the database. Negative cache sizes are in KiB.
+STORAGE_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('mmap_size', int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))),
+    ('cache_size', -int(os.environ.get('SQLITE_CACHE_KB', 64 * 1024))),
+    ('temp_store', 'MEMORY'),
+)
+
+
+def apply_storage_profile(engine):
+    """Set STORAGE_PRAGMAS on every connection `engine` opens from now on."""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in STORAGE_PRAGMAS:
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    # Connections pooled before the listener existed reopen with the profile
+    engine.dispose()
+
+
+apply_storage_profile(engine)
+
+# Statements on the per-message and per-flush paths, built once. SQLAlchemy then compiles
+# each a single time and the sqlite3 driver keeps it prepared on every connection.
+SETTINGS_KEYS = tuple(attribute.key for attribute in inspect(GuildSettings).column_attrs)
+SELECT_SETTINGS = select(*(getattr(GuildSettings, key) for key in SETTINGS_KEYS)).where(
+    GuildSettings.guild_id == bindparam('guild_id'))
+SELECT_FILTERED_WORDS = select(FilteredWord.word).where(FilteredWord.guild_id == bindparam('guild_id'))
+SELECT_GUILD_XP = select(UserLevel.user_id, UserLevel.xp, UserLevel.last_xp_gain).where(
+    UserLevel.guild_id == bindparam('guild_id'))
+_insert_xp = sqlite_insert(UserLevel.__table__)
+ADD_XP = _insert_xp.on_conflict_do_update(
+    index_elements=[UserLevel.__table__.c.guild_id, UserLevel.__table__.c.user_id],
+    set_={'xp': UserLevel.__table__.c.xp + _insert_xp.excluded.xp, 'last_xp_gain': _insert_xp.excluded.last_xp_gain}
+)
+
+
+async def run(fn, *args, **kwargs):
+    """Run a blocking DB function on the DB executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+
+
+def _merge_duplicate_levels():
+    """Keep one UserLevel row per member, the one with the most XP, so the unique index can be built."""
+    table = UserLevel.__tablename__
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            f"DELETE FROM {table} WHERE EXISTS (SELECT 1 FROM {table} AS other "
+            f"WHERE other.guild_id = {table}.guild_id AND other.user_id = {table}.user_id "
+            f"AND (COALESCE(other.xp, 0) > COALESCE({table}.xp, 0) "
+            f"OR (COALESCE(other.xp, 0) = COALESCE({table}.xp, 0) AND other.rowid < {table}.rowid)))"
+        )
+
+
+def ensure_indexes():
+    """Create indexes added to existing tables; create_all skips tables that already exist."""
+    existing = {index['name'] for index in inspect(engine).get_indexes(UserLevel.__tablename__)}
+    if USER_LEVEL_UNIQUE_INDEX not in existing:
+        # Older databases could hold several rows for one member
+        _merge_duplicate_levels()
+    with engine.begin() as connection:
+        for name in DROPPED_INDEXES:
+            connection.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+    for index in ADDED_INDEXES:
+        index.create(engine, checkfirst=True)
+    if engine.dialect.name == 'sqlite':
+        # Refresh the planner's statistics where they are stale, e.g. for indexes just created
+        with engine.connect() as connection:
+            connection.exec_driver_sql('PRAGMA optimize')
+
+
+def snapshot_settings(settings):
+    """Copy a GuildSettings row into a plain, session-independent object."""
+    columns = inspect(GuildSettings).column_attrs
+    return SimpleNamespace(**{column.key: getattr(settings, column.key) for column in columns})
+
+
+def _get_guild_settings(guild_id):
+    with engine.connect() as connection:
+        row = connection.execute(SELECT_SETTINGS, {'guild_id': str(guild_id)}).first()
+        return SimpleNamespace(**dict(zip(SETTINGS_KEYS, row))) if row else None
+
+
+def _get_all_guild_settings(guild_ids=None, limit=None):
+    with Session(engine) as session:
+        query = session.query(GuildSettings)
+        if guild_ids is not None:
+            query = query.filter(GuildSettings.guild_id.in_([str(guild_id) for guild_id in guild_ids]))
+        if limit is not None:
+            query = query.limit(limit)
+        return [snapshot_settings(settings) for settings in query.all()]
+
+
+def _update_guild_settings(guild_id, **fields):
+    with Session(engine) as session:
+        settings = session.query(GuildSettings).filter_by(guild_id=str(guild_id)).first()
+
+        if not settings:
+            settings = GuildSettings(guild_id=str(guild_id))
+            session.add(settings)
+
+        for key, value in fields.items():
+            setattr(settings, key, value)
+        session.commit()
+        return snapshot_settings(settings)
+
+
+def _get_filtered_words(guild_id):
+    with engine.connect() as connection:
+        return list(connection.execute(SELECT_FILTERED_WORDS, {'guild_id': str(guild_id)}).scalars())
+
+
+def _add_filtered_word(guild_id, word):
+    with Session(engine) as session:
+        settings = session.query(GuildSettings).filter_by(guild_id=str(guild_id)).first()
+
+        if not settings:
+            settings = GuildSettings(guild_id=str(guild_id))
+            session.add(settings)
+            settings.filter_enabled = True
+
+        session.add(FilteredWord(guild_id=str(guild_id), word=word))
+        session.commit()
+        return snapshot_settings(settings)
+
+
+def _remove_filtered_word(guild_id, word):
+    with Session(engine) as session:
+        filtered_word = session.query(FilteredWord).filter_by(guild_id=str(guild_id), word=word).first()
+
+        if not filtered_word:
+            return False
+        session.delete(filtered_word)
+        session.commit()
+        return True
+
+
+def _get_guild_xp(guild_id):
+    with engine.connect() as connection:
+        rows = connection.execute(SELECT_GUILD_XP, {'guild_id': str(guild_id)})
+        return {user_id: (xp, last_xp_gain) for user_id, xp, last_xp_gain in rows}
+
+
+def _write_xp_batch(batch):
+    """Add a drained XP ledger batch to UserLevel with one UPSERT, creating rows for new members."""
+    if not batch:
+        return
+    with engine.begin() as connection:
+        connection.execute(ADD_XP, [
+            {'guild_id': change['guild_id'], 'user_id': change['user_id'],
+             'xp': change['delta'], 'last_xp_gain': change['last_xp_gain']}
+            for change in batch
+        ])
+
+
+def _get_all_thresholds():
+    with Session(engine) as session:
+        rows = session.query(GuildThreshold.guild_id, GuildThreshold.key, GuildThreshold.max_events, GuildThreshold.window_seconds).all()
+        return [tuple(row) for row in rows]
+
+
+def _set_threshold(guild_id, key, limit, window):
+    with Session(engine) as session:
+        threshold = session.query(GuildThreshold).filter_by(guild_id=str(guild_id), key=key).first()
+
+        if not threshold:
+            threshold = GuildThreshold(guild_id=str(guild_id), key=key)
+            session.add(threshold)
+
+        threshold.max_events = limit
+        threshold.window_seconds = window
+        session.commit()
+
+
+def _get_raise_verification(guild_id):
+    with Session(engine) as session:
+        settings = session.get(RaidSettings, str(guild_id))
+        return bool(settings and settings.raise_verification)
+
+
+def _set_raise_verification(guild_id, enabled):
+    with Session(engine) as session:
+        settings = session.get(RaidSettings, str(guild_id))
+
+        if not settings:
+            settings = RaidSettings(guild_id=str(guild_id))
+            session.add(settings)
+
+        settings.raise_verification = enabled
+        session.commit()
+
+
+def _add_reminder(user_id, guild_id, message, due_at, created_at):
+    with Session(engine) as session:
+        reminder = Reminder(user_id=str(user_id), guild_id=str(guild_id) if guild_id else None,
+                            message=message, due_at=due_at, created_at=created_at)
+        session.add(reminder)
+        session.commit()
+        return reminder.id
+
+
+def _get_pending_reminders():
+    with Session(engine) as session:
+        return [tuple(row) for row in session.query(Reminder.id, Reminder.due_at, Reminder.guild_id).all()]
+
+
+def _get_reminders(reminder_ids):
+    with Session(engine) as session:
+        rows = session.query(Reminder.id, Reminder.user_id, Reminder.message, Reminder.created_at) \
+                      .filter(Reminder.id.in_(reminder_ids)).all()
+        return [tuple(row) for row in rows]
+
+
+def _delete_reminders(reminder_ids):
+    with Session(engine) as session:
+        session.query(Reminder).filter(Reminder.id.in_(reminder_ids)).delete(synchronize_session=False)
+        session.commit()
+
+
+def _get_temp_voice_state():
+    with Session(engine) as session:
+        lobbies = [tuple(row) for row in session.query(VoiceLobby.guild_id, VoiceLobby.channel_id).all()]
+        channels = [tuple(row) for row in session.query(TempVoiceChannel.channel_id, TempVoiceChannel.guild_id,
+                                                        TempVoiceChannel.owner_id).all()]
+        return lobbies, channels
+
+
+def _set_voice_lobby(guild_id, channel_id):
+    with Session(engine) as session:
+        lobby = session.get(VoiceLobby, str(guild_id))
+
+        if channel_id is None:
+            if lobby:
+                session.delete(lobby)
+        elif lobby:
+            lobby.channel_id = str(channel_id)
+        else:
+            session.add(VoiceLobby(guild_id=str(guild_id), channel_id=str(channel_id)))
+        session.commit()
+
+
+def _add_temp_voice_channel(channel_id, guild_id, owner_id, created_at):
+    with Session(engine) as session:
+        session.add(TempVoiceChannel(channel_id=str(channel_id), guild_id=str(guild_id),
+                                     owner_id=str(owner_id), created_at=created_at))
+        session.commit()
+
+
+def _delete_temp_voice_channels(channel_ids):
+    with Session(engine) as session:
+        session.query(TempVoiceChannel).filter(TempVoiceChannel.channel_id.in_([str(channel_id) for channel_id in channel_ids])) \
+               .delete(synchronize_session=False)
+        session.commit()
+
+
+def _get_snapshots():
+    with Session(engine) as session:
+        rows = session.query(GuildObjectSnapshot.guild_id, GuildObjectSnapshot.object_id, GuildObjectSnapshot.kind,
+                             GuildObjectSnapshot.data, GuildObjectSnapshot.deleted_at).all()
+        return [tuple(row) for row in rows]
+
+
+def _write_snapshots(rows, removed):
+    """Upsert snapshot rows and delete removed (guild_id, object_id) keys in one transaction."""
+    table = GuildObjectSnapshot.__table__
+    with Session(engine) as session:
+        if rows:
+            statement = sqlite_insert(table)
+            session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[table.c.guild_id, table.c.object_id],
+                    set_={'kind': statement.excluded.kind, 'data': statement.excluded.data,
+                          'deleted_at': statement.excluded.deleted_at}
+                ),
+                [{'guild_id': guild_id, 'object_id': object_id, 'kind': kind, 'data': data, 'deleted_at': deleted_at}
+                 for guild_id, object_id, kind, data, deleted_at in rows]
+            )
+        # Chunked to stay under SQLite's bound parameter limit
+        for start in range(0, len(removed), 500):
+            session.execute(table.delete().where(
+                tuple_(table.c.guild_id, table.c.object_id).in_(removed[start:start + 500])))
+        session.commit()
+
+
+def _get_activity(guild_id):
+    with Session(engine) as session:
+        rows = session.query(ActivityRollup.resolution, ActivityRollup.bucket, ActivityRollup.messages, ActivityRollup.joins,
+                             ActivityRollup.leaves, ActivityRollup.xp).filter_by(guild_id=str(guild_id)).all()
+        channel_rows = session.query(ChannelActivity.channel_id, ChannelActivity.day,
+                                     ChannelActivity.messages).filter_by(guild_id=str(guild_id)).all()
+        return ([tuple(row) for row in rows],
+                [(int(channel_id), day, messages) for channel_id, day, messages in channel_rows])
+
+
+def _write_activity(rows, channel_rows):
+    """Add rollup deltas to the stored counts in one transaction, creating missing buckets."""
+    rollups, channels = ActivityRollup.__table__, ChannelActivity.__table__
+    with Session(engine) as session:
+        if rows:
+            statement = sqlite_insert(rollups)
+            session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[rollups.c.guild_id, rollups.c.resolution, rollups.c.bucket],
+                    set_={field: rollups.c[field] + statement.excluded[field] for field in ('messages', 'joins', 'leaves', 'xp')}
+                ),
+                [{'guild_id': guild_id, 'resolution': resolution, 'bucket': bucket,
+                  'messages': messages, 'joins': joins, 'leaves': leaves, 'xp': xp}
+                 for guild_id, resolution, bucket, messages, joins, leaves, xp in rows]
+            )
+        if channel_rows:
+            statement = sqlite_insert(channels)
+            session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[channels.c.guild_id, channels.c.channel_id, channels.c.day],
+                    set_={'messages': channels.c.messages + statement.excluded.messages}
+                ),
+                [{'guild_id': guild_id, 'channel_id': str(channel_id), 'day': day, 'messages': messages}
+                 for guild_id, channel_id, day, messages in channel_rows]
+            )
+        session.commit()
+
+
+def _prune_activity(cutoffs, channel_cutoff):
+    rollups, channels = ActivityRollup.__table__, ChannelActivity.__table__
+    with Session(engine) as session:
+        for resolution, cutoff in cutoffs.items():
+            session.execute(rollups.delete().where(rollups.c.resolution == resolution, rollups.c.bucket < cutoff))
+        session.execute(channels.delete().where(channels.c.day < channel_cutoff))
+        session.commit()
+
+
+def _get_state(key):
+    with Session(engine) as session:
+        state = session.get(BotState, key)
+        return state.value if state else None
+
+
+def _set_state(key, value):
+    with Session(engine) as session:
+        state = session.get(BotState, key)
+
+        if not state:
+            state = BotState(key=key, value=value)
+            session.add(state)
+
+        state.value = value
+        session.commit()
+
+
+async def get_guild_settings(guild_id):
+    return await run(_get_guild_settings, guild_id)
+
+
+async def get_all_guild_settings(guild_ids=None, limit=None):
+    return await run(_get_all_guild_settings, guild_ids, limit)
+
+
+async def update_guild_settings(guild_id, **fields):
+    """Create or update a guild's settings row; returns the committed snapshot."""
+    return await run(_update_guild_settings, guild_id, **fields)
+
+
+async def get_filtered_words(guild_id):
+    return await run(_get_filtered_words, guild_id)
+
+
+async def add_filtered_word(guild_id, word):
+    """Add a filtered word, enabling the filter for guilds without settings."""
+    return await run(_add_filtered_word, guild_id, word)
+
+
+async def remove_filtered_word(guild_id, word):
+    return await run(_remove_filtered_word, guild_id, word)
+
+
+async def get_guild_xp(guild_id):
+    return await run(_get_guild_xp, guild_id)
+
+
+async def write_xp_batch(batch):
+    return await run(_write_xp_batch, batch)
+
+
+async def get_all_thresholds():
+    return await run(_get_all_thresholds)
+
+
+async def set_threshold(guild_id, key, limit, window):
+    return await run(_set_threshold, guild_id, key, limit, window)
+
+
+async def get_raise_verification(guild_id):
+    return await run(_get_raise_verification, guild_id)
+
+
+async def set_raise_verification(guild_id, enabled):
+    return await run(_set_raise_verification, guild_id, enabled)
+
+
+async def add_reminder(user_id, guild_id, message, due_at, created_at):
+    """Store a reminder; returns its id."""
+    return await run(_add_reminder, user_id, guild_id, message, due_at, created_at)
+
+
+async def get_pending_reminders():
+    """Every pending reminder as (reminder_id, due_at, guild_id)."""
+    return await run(_get_pending_reminders)
+
+
+async def get_reminders(reminder_ids):
+    return await run(_get_reminders, reminder_ids)
+
+
+async def delete_reminders(reminder_ids):
+    return await run(_delete_reminders, reminder_ids)
+
+
+async def get_temp_voice_state():
+    """Returns (lobbies as (guild_id, channel_id), temp channels as (channel_id, guild_id, owner_id))."""
+    return await run(_get_temp_voice_state)
+
+
+async def set_voice_lobby(guild_id, channel_id):
+    """Set a guild's lobby channel, or remove it when `channel_id` is None."""
+    return await run(_set_voice_lobby, guild_id, channel_id)
+
+
+async def add_temp_voice_channel(channel_id, guild_id, owner_id, created_at):
+    return await run(_add_temp_voice_channel, channel_id, guild_id, owner_id, created_at)
+
+
+async def delete_temp_voice_channels(channel_ids):
+    return await run(_delete_temp_voice_channels, channel_ids)
+
+
+async def get_snapshots():
+    """Returns every snapshot as (guild_id, object_id, kind, data, deleted_at)."""
+    return await run(_get_snapshots)
+
+
+async def write_snapshots(rows, removed):
+    return await run(_write_snapshots, rows, removed)
+
+
+async def get_activity(guild_id):
+    """Returns (rollups as (resolution, bucket, messages, joins, leaves, xp), channel counts as (channel_id, day, messages))."""
+    return await run(_get_activity, guild_id)
+
+
+async def write_activity(rows, channel_rows):
+    return await run(_write_activity, rows, channel_rows)
+
+
+async def prune_activity(cutoffs, channel_cutoff):
+    return await run(_prune_activity, cutoffs, channel_cutoff)
+
+
+async def get_state(key):
+    """Returns the stored value for `key`, or None."""
+    return await run(_get_state, key)
+
+
+async def set_state(key, value):
+    return await run(_set_state, key, value)
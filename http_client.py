@@ -0,0 +1,137 @@
+import asyncio
+import random
+import time
+from collections import OrderedDict, deque
+
+import aiohttp
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class HTTPError(Exception):
+    pass
+
+
+class TTLCache:
+    def __init__(self, max_size=512):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            return None
+        return value
+
+    def set(self, key, value, ttl):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+class HTTPClient:
+    """One pooled aiohttp session for external APIs, with timeouts, retries and a TTL cache.
+
+    A `Retry-After` longer than `max_retry_after` seconds fails the request instead of
+    holding the caller for as long as the server asks.
+    """
+
+    def __init__(self, timeout=10, retries=3, backoff=0.5, connections=20, max_retry_after=5):
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_retry_after = max_retry_after
+        self.connections = connections
+        self.cache = TTLCache()
+        self._session = None
+
+    def session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(limit=self.connections),
+            )
+        return self._session
+
+    async def get_json(self, url, params=None, ttl=0):
+        """GET a JSON document, retrying transient failures; cached for `ttl` seconds if set."""
+        key = (url, tuple(sorted((params or {}).items())))
+        if ttl:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        for attempt in range(self.retries + 1):
+            delay = self.backoff * (2 ** attempt) * (1 + random.random())
+            try:
+                async with self.session().get(url, params=params) as response:
+                    if response.status in RETRY_STATUSES and attempt < self.retries:
+                        retry_after = response.headers.get('Retry-After')
+                        if retry_after and retry_after.replace('.', '', 1).isdigit():
+                            delay = float(retry_after)
+                            if delay > self.max_retry_after:
+                                raise HTTPError(f"GET {url} returned {response.status}, retry after {retry_after}s")
+                    elif response.status != 200:
+                        raise HTTPError(f"GET {url} returned {response.status}")
+                    else:
+                        try:
+                            data = await response.json(content_type=None)
+                        except ValueError as e:
+                            # A 200 with an HTML error page or a truncated body; retrying won't help
+                            raise HTTPError(f"GET {url} returned invalid JSON: {str(e)}") from e
+                        if ttl:
+                            self.cache.set(key, data, ttl)
+                        return data
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == self.retries:
+                    raise HTTPError(f"GET {url} failed: {str(e)}") from e
+            await asyncio.sleep(delay)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+class MemeBuffer:
+    """Keeps a queue of pre-fetched memes so /meme can answer without waiting on the API."""
+
+    def __init__(self, client, url, size=25, refill_below=5):
+        self.client = client
+        self.url = url.rstrip('/')
+        self.size = size
+        self.refill_below = refill_below
+        self._memes = deque()
+        self._refill = None
+
+    @property
+    def ready(self):
+        return bool(self._memes)
+
+    async def get(self):
+        if not self._memes:
+            await asyncio.shield(self._ensure_refill())
+        meme = self._memes.popleft() if self._memes else None
+        if len(self._memes) <= self.refill_below:
+            self._ensure_refill()
+        return meme
+
+    def _ensure_refill(self):
+        if self._refill is None or self._refill.done():
+            self._refill = asyncio.create_task(self.refill())
+        return self._refill
+
+    async def refill(self):
+        try:
+            data = await self.client.get_json(f"{self.url}/{self.size - len(self._memes)}")
+        except HTTPError as e:
+            print(f"🚨 Error: Couldn't prefetch memes: {str(e)}")
+            return
+        if not isinstance(data, dict):
+            print(f"🚨 Error: Couldn't prefetch memes: unexpected response from {self.url}")
+            return
+        self._memes.extend(meme['url'] for meme in data.get('memes', []) if isinstance(meme, dict) and meme.get('url'))
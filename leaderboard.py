@@ -0,0 +1,90 @@
+import bisect
+import math
+
+
+class GuildRanking:
+    __slots__ = ('keys', 'xp', 'pages')
+
+    def __init__(self, balances):
+        self.xp = dict(balances)
+        # Sorted ascending by (-xp, user_id): highest XP first, ties broken by user ID
+        self.keys = sorted((-xp, user_id) for user_id, xp in self.xp.items())
+        self.pages = {}
+
+
+class LeaderboardIndex:
+    """Per-guild XP rankings kept sorted in memory, with rendered pages cached.
+
+    `await loader(guild_id)` returns {user_id: xp} for a guild (the XP ledger's balances)
+    and is called the first time the guild's leaderboard is used; after that `update`
+    keeps the ranking current. Positions are found by bisection, so a rank lookup is
+    O(log n). A guild's rendered pages are dropped on its next XP change.
+    """
+
+    def __init__(self, loader, page_size=10):
+        self.loader = loader
+        self.page_size = page_size
+        self._guilds = {}
+
+    async def _ranking(self, guild_id):
+        guild_id = str(guild_id)
+        ranking = self._guilds.get(guild_id)
+        if ranking is None:
+            balances = await self.loader(guild_id)
+            # Another caller may have built it while the balances loaded
+            ranking = self._guilds.get(guild_id)
+            if ranking is None:
+                ranking = self._guilds[guild_id] = GuildRanking(balances)
+        return ranking
+
+    def update(self, guild_id, user_id, xp):
+        """Move a user to their new XP. Guilds that haven't been ranked yet are skipped."""
+        ranking = self._guilds.get(str(guild_id))
+        if ranking is None:
+            return
+        user_id = str(user_id)
+        old_xp = ranking.xp.get(user_id)
+        if old_xp == xp:
+            return
+        if old_xp is not None:
+            del ranking.keys[bisect.bisect_left(ranking.keys, (-old_xp, user_id))]
+        bisect.insort(ranking.keys, (-xp, user_id))
+        ranking.xp[user_id] = xp
+        ranking.pages.clear()
+
+    def invalidate(self, guild_id=None):
+        if guild_id is None:
+            self._guilds.clear()
+        else:
+            self._guilds.pop(str(guild_id), None)
+
+    async def rank(self, guild_id, user_id):
+        """(position, xp, ranked members) for a user, or None if they have no XP."""
+        ranking = await self._ranking(guild_id)
+        user_id = str(user_id)
+        xp = ranking.xp.get(user_id)
+        if xp is None:
+            return None
+        return bisect.bisect_left(ranking.keys, (-xp, user_id)) + 1, xp, len(ranking.keys)
+
+    async def page_count(self, guild_id):
+        ranking = await self._ranking(guild_id)
+        return max(1, math.ceil(len(ranking.keys) / self.page_size))
+
+    async def page(self, guild_id, number):
+        """Entries on a 1-based page as (position, user_id, xp)."""
+        ranking = await self._ranking(guild_id)
+        start = (number - 1) * self.page_size
+        return [
+            (position, user_id, -negative_xp)
+            for position, (negative_xp, user_id) in enumerate(ranking.keys[start:start + self.page_size], start + 1)
+        ]
+
+    async def render(self, guild_id, number, formatter):
+        """`formatter(entries, number, page_count)` for a page, cached until the next XP change."""
+        ranking = await self._ranking(guild_id)
+        rendered = ranking.pages.get(number)
+        if rendered is None:
+            rendered = ranking.pages[number] = formatter(
+                await self.page(guild_id, number), number, await self.page_count(guild_id))
+        return rendered
@@ -0,0 +1,43 @@
+import bisect
+
+# Thresholds for the levels anyone realistically reaches; beyond this we invert in closed form
+MAX_TABLE_LEVEL = 1000
+
+
+def calculate_xp_for_level(level):
+    return int(100 * (level ** 1.5))
+
+
+XP_THRESHOLDS = [calculate_xp_for_level(level) for level in range(MAX_TABLE_LEVEL + 1)]
+
+
+def calculate_level_for_xp(xp):
+    """Highest level whose threshold is <= xp, in O(log n) or O(1) instead of a level-by-level walk."""
+    if xp < XP_THRESHOLDS[-1]:
+        return max(bisect.bisect_right(XP_THRESHOLDS, xp) - 1, 0)
+
+    # Invert xp = 100 * level ** 1.5, then correct for float rounding and the int() truncation
+    level = int((xp / 100) ** (2 / 3))
+    while calculate_xp_for_level(level + 1) <= xp:
+        level += 1
+    while calculate_xp_for_level(level) > xp:
+        level -= 1
+    return level
+
+
+def levels_for_xp(xp_values):
+    """Convert a batch of XP totals to levels, e.g. for a leaderboard page.
+
+    Values are visited in sorted order so runs that fall within the same level
+    (common on leaderboards) reuse the previous answer without a lookup.
+    """
+    levels = [0] * len(xp_values)
+    level = None
+    next_threshold = None
+    for index in sorted(range(len(xp_values)), key=xp_values.__getitem__):
+        xp = xp_values[index]
+        if level is None or xp >= next_threshold:
+            level = calculate_level_for_xp(xp)
+            next_threshold = calculate_xp_for_level(level + 1)
+        levels[index] = level
+    return levels
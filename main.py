@@ -1,12 +1,36 @@
 import os
+import sys
 import discord
 import asyncio
 from discord import app_commands
 from datetime import datetime, timedelta
 from abilities import apply_sqlite_migrations
-from models import Base, engine, GuildSettings, FilteredWord, UserLevel
-from sqlalchemy.orm import Session
+from models import Base, engine
+import db
+from settings_cache import GuildSettingsCache
+from word_filter import WordFilterCache
+from xp_ledger import XPLedger
+from thresholds import ThresholdStore
+from http_client import HTTPClient, HTTPError, MemeBuffer
+from bulk import BulkJob, BulkScheduler
+from purge import PurgeEngine, PurgeFilter, PurgeJob
+from snapshots import SnapshotRestorer, SnapshotStore
+from analytics import ActivityStore, sparkline
+from reminders import ReminderScheduler
+from temp_voice import TempVoiceManager
+from raid import JoinRoleAssigner, RaidGuard
+from sharding import ShardConfig, ShardedState, run_shard_processes
+from pipeline import MessageContext, MessagePipeline
+from startup import CommandSync, StartupTimeline
+from metrics import MetricsRegistry, instrument_commands, instrument_engine, instrument_events, observe_rate_limits, serve as serve_metrics
+from state_backend import CounterBackends
+from antinuke import AntiNukeEventStore, AuditAttributor, ACTIONS
+from leaderboard import LeaderboardIndex
+from templates import LEVEL_UP_FIELDS, WELCOME_FIELDS, TemplateError, compile_template, validate_template
+from leveling import calculate_xp_for_level, calculate_level_for_xp, levels_for_xp
 import random
+import time
+from urllib.parse import quote
 
 def generate_oauth_link(client_id):
     base_url = "https://discord.com/api/oauth2/authorize"
@@ -15,15 +39,6 @@ def generate_oauth_link(client_id):
     permissions = "8"  # Administrator permission for simplicity, adjust as needed.
     return f"{base_url}?client_id={client_id}&permissions={permissions}&scope={scope}"
 
-def calculate_xp_for_level(level):
-    return int(100 * (level ** 1.5))
-
-def calculate_level_for_xp(xp):
-    level = 0
-    while xp >= calculate_xp_for_level(level + 1):
-        level += 1
-    return level
-
 def generate_progress_bar(current, total, length=10):
     filled = int(length * current / total)
     return '█' * filled + '░' * (length - filled)
@@ -33,253 +48,479 @@ intents.messages = True
 intents.message_content = True
 intents.members = True  # Enable member events
 
-bot = discord.Client(intents=intents, activity=discord.CustomActivity("Moderating the server"))
+# Sharding is configured through SHARD_COUNT, SHARD_IDS and SHARD_PROCESSES (see sharding.py)
+shard_config = ShardConfig.from_env()
+
+# Seconds from process start to login, ready and the first interaction
+startup = StartupTimeline()
+
+class Bot(discord.AutoShardedClient if shard_config.sharded else discord.Client):
+    # Set by main() to the migrations running on the DB executor while the bot logs in
+    database_ready = None
+
+    async def setup_hook(self):
+        # Runs once per process, after login and before the gateway connects; on_ready runs
+        # again on every reconnect, so one-time start-up work belongs here
+        startup.mark('login')
+        if self.database_ready is not None:
+            await asyncio.wrap_future(self.database_ready)
+        startup.mark('database')
+        # Small tables handlers consult from the first event on; guild settings load on first
+        # use and the snapshot captures run later in the background
+        await asyncio.gather(thresholds.load_all(), temp_voice.load_all(), snapshots.load_all())
+        startup.mark('state')
+        # One process syncs the command tree for the whole deployment
+        if shard_config.is_primary():
+            start_background_task('command_sync', lambda: command_sync.sync(force=bool(os.environ.get('FORCE_COMMAND_SYNC'))))
+
+    async def close(self):
+        # Persist any XP earned and activity counted since the last timed flush, then release
+        # connections; a step that fails must not stop the others or the gateway from closing
+        steps = (("flush the XP ledger", xp_ledger.flush), ("flush activity rollups", activity.flush),
+                 ("close the HTTP session", http.close), ("close the counter backend", counters.close))
+        try:
+            for description, step in steps:
+                try:
+                    await step()
+                except Exception as e:
+                    print(f"🚨 Error: Failed to {description} on shutdown: {str(e)}")
+        finally:
+            await super().close()
+
+# Prometheus metrics on METRICS_PORT (plus the first shard ID when sharded across processes).
+# With it unset nothing is instrumented; see install_metrics.
+metrics_port = int(os.environ['METRICS_PORT']) + (shard_config.shard_ids or [0])[0] if os.environ.get('METRICS_PORT') else None
+metrics = MetricsRegistry({'shards': f"{shard_config.shard_ids[0]}-{shard_config.shard_ids[-1]}"} if shard_config.shard_ids else None)
+
+bot = Bot(intents=intents, activity=discord.CustomActivity("Moderating the server"), **shard_config.client_kwargs())
 tree = app_commands.CommandTree(bot)
 
+# Syncs the tree only when its hash differs from the last synced one; DEV_GUILD_ID syncs to that guild alone
+command_sync = CommandSync(tree, db.get_state, db.set_state,
+                           dev_guild_id=int(os.environ['DEV_GUILD_ID']) if os.environ.get('DEV_GUILD_ID') else None)
+
+# Shared GuildSettings cache; every command that writes settings must update it
+settings_cache = GuildSettingsCache(db.get_guild_settings, db.get_all_guild_settings,
+                                    max_size=int(os.environ.get('SETTINGS_CACHE_SIZE', 10000)))
+
+# Compiled per-guild word filters; addfilter/removefilter keep them in sync with the DB
+word_filters = WordFilterCache(db.get_filtered_words)
+
+# Write-behind XP balances; flushed on a timer, at a size threshold and on shutdown
+xp_ledger = XPLedger(db.get_guild_xp, db.write_xp_batch,
+                     max_pending=int(os.environ.get('XP_FLUSH_THRESHOLD', 500)))
+
+# Sorted per-guild XP rankings built from the ledger, for /leaderboard and /rank
+leaderboards = LeaderboardIndex(xp_ledger.balances)
+
+# Where spam and anti-nuke rates are counted: in process, or shared through STATE_BACKEND
+counters = CounterBackends.from_env()
+
+# Per-guild overrides of the spam and anti-nuke thresholds
+thresholds = ThresholdStore(db.get_all_thresholds)
+
+# Paces mass moderation actions (kicks, role edits, DMs) under Discord's rate limits
+bulk = BulkScheduler(concurrency=int(os.environ.get('BULK_CONCURRENCY', 10)))
+
+# /clear's deletions: 100-message bulk deletes, single deletes only for messages over 14 days old
+purger = PurgeEngine(bulk)
+
+# Shared HTTP session for external APIs
+http = HTTPClient(timeout=10, retries=2)
+meme_buffer = MemeBuffer(http, os.environ.get('MEME_API_URL', 'https://meme-api.com/gimme'))
+WEATHER_API_URL = os.environ.get('WEATHER_API_URL', 'https://wttr.in').rstrip('/')
+
+async def deliver_reminders(rows):
+    """DM a batch of due reminders, paced through the bulk scheduler."""
+    async def send(row):
+        _, user_id, message, created_at = row
+        user = bot.get_user(int(user_id)) or await bot.fetch_user(int(user_id))
+        await user.send(f"⏰ Reminder: {message}")
+
+    job = await bulk.run(BulkJob("Reminders", len(rows)), 'dm', rows, send, concurrency=5)
+    if job.failed:
+        print(f"Could not deliver {job.failed} of {job.total} reminders (DMs closed or user gone)")
+
+async def get_owned_reminders():
+    return [(reminder_id, due_at) for reminder_id, due_at, guild_id in await db.get_pending_reminders()
+            if shard_config.owns_guild(guild_id)]
+
+# Every pending reminder of this process's guilds, stored in the DB and delivered by a single timer task
+reminders = ReminderScheduler(get_owned_reminders, db.get_reminders, deliver_reminders, db.delete_reminders)
+
+# Lobby and temporary voice channels, tracked by ID
+temp_voice = TempVoiceManager(db, on_removed=lambda guild_id, channel_id: snapshots.forget(guild_id, channel_id))
+
+# Last known state of every role and channel, kept after deletion so /restore can rebuild them;
+# temporary voice channels come and go by design and are left out
+snapshots = SnapshotStore(db.get_snapshots, db.write_snapshots, skip_channel=temp_voice.is_temp)
+restorer = SnapshotRestorer(snapshots, bulk)
+
+# Messages, joins, leaves and XP per guild in minute, hour and day rollups, for /stats
+activity = ActivityStore(db.get_activity, db.write_activity, db.prune_activity)
+
+# Background loops started once from setup_hook or on_ready, keyed by name
+background_tasks = {}
+
+def start_background_task(name, coro_factory):
+    if name not in background_tasks:
+        background_tasks[name] = asyncio.create_task(coro_factory())
+
 @bot.event
 async def on_guild_channel_create(channel):
-    # Log the channel creation
-    guild_id = str(channel.guild.id)
-    if guild_id in recent_actions:
-        recent_actions[guild_id].append(("channel_create", channel.id))
-    else:
-        recent_actions[guild_id] = [("channel_create", channel.id)]
-    
-    # Check for suspicious activity (e.g., multiple channels created)
-    if len(recent_actions[guild_id]) > 5:  # Example threshold
-        await handle_suspicious_activity(channel.guild)
+    snapshots.record_channel(channel)
+    # Log the channel creation and check for suspicious activity (e.g., multiple channels created)
+    await record_action(channel.guild, "channel_create", channel.id)
+
+@bot.event
+async def on_guild_channel_update(before, after):
+    snapshots.record_channel(after)
 
 @bot.event
 async def on_guild_update(before, after):
-    # Log guild updates (like name changes)
-    guild_id = str(after.id)
-    if guild_id in recent_actions:
-        recent_actions[guild_id].append(("guild_update", after.name))
-    else:
-        recent_actions[guild_id] = [("guild_update", after.name)]
-    
-    # Check for suspicious activity
-    if len(recent_actions[guild_id]) > 3:  # Example threshold
-        await handle_suspicious_activity(after)
+    # Log guild updates (like name changes) and check for suspicious activity
+    await record_action(after, "guild_update", after.name, target_id=after.id)
+    # Lowering verification opens the door to raids; a burst of changes alerts the owner
+    if before.verification_level != after.verification_level:
+        await record_action(after, "verification_level_change", after.verification_level, target_id=after.id,
+                            on_trip=notify_suspicious_activity)
 
 async def notify_suspicious_activity(guild):
     # Notify the server owner or admins
     owner = guild.owner
     await owner.send("🚨 Suspicious activity detected in your server! Please check the recent actions.")
     
-    # Optionally, log the activity or take further action (like disabling permissions)
-    # Temporarily restrict permissions for certain roles.
-    for role in guild.roles:
-        if role.name != "@everyone":
-            await role.edit(permissions=discord.Permissions.none())
-    
     # Send a message to a designated log channel if available
     log_channel_id = None  # Placeholder for log channel ID retrieval logic
     if log_channel_id:
         log_channel = guild.get_channel(log_channel_id)
         if log_channel:
-            await log_channel.send(f"🚨 Suspicious activity detected: {recent_actions[str(guild.id)]}")
+            actions = ", ".join(f"{action}: {detail}" for _, action, detail in recent_actions.for_guild(guild.id).recent(guild.id))
+            await log_channel.send(f"🚨 Suspicious activity detected: {actions}")
 
 @tree.command(name="setlogchannel", description="Set a channel for logging anti-nuke actions")
 @app_commands.checks.has_permissions(manage_guild=True)
 async def set_log_channel(interaction: discord.Interaction, channel: discord.TextChannel):
-    with Session(engine) as session:
-        settings = session.query(GuildSettings).filter_by(guild_id=str(interaction.guild_id)).first()
-        
-        if not settings:
-            settings = GuildSettings(guild_id=str(interaction.guild_id))
-            session.add(settings)
-        
-        settings.log_channel_id = str(channel.id)
-        session.commit()
-        
-        await interaction.response.send_message(f"Log channel set to {channel.mention}.", ephemeral=True)
+    settings_cache.update(await db.update_guild_settings(interaction.guild_id, log_channel_id=str(channel.id)))
+    
+    await interaction.response.send_message(f"Log channel set to {channel.mention}.", ephemeral=True)
 
 @tree.command(name="checkrecentactions", description="Check recent actions that triggered anti-nuke")
 @app_commands.checks.has_permissions(manage_guild=True)
 async def check_recent_actions(interaction: discord.Interaction):
-    guild_id = str(interaction.guild.id)
-    actions = recent_actions.get(guild_id, [])
+    actions = recent_actions.for_guild(interaction.guild.id).recent(interaction.guild.id)
     
     if not actions:
         await interaction.response.send_message("No recent actions detected.", ephemeral=True)
         return
     
-    action_messages = "\n".join([f"{action[0]}: {action[1]}" for action in actions])
+    action_messages = "\n".join([f"{action}: {detail} ({int(age)}s ago)" for age, action, detail in actions])
     await interaction.response.send_message(f"Recent actions:\n{action_messages}", ephemeral=True)
 
 @tree.command(name="resetrecentactions", description="Reset the recent actions log")
 @app_commands.checks.has_permissions(manage_guild=True)
 async def reset_recent_actions(interaction: discord.Interaction):
-    guild_id = str(interaction.guild.id)
-    if guild_id in recent_actions:
-        del recent_actions[guild_id]
+    await recent_actions.for_guild(interaction.guild.id).reset(interaction.guild.id)
     await interaction.response.send_message("Recent actions log has been reset.", ephemeral=True)
 
 @bot.event
 async def on_ready():
     print(f'Bot is ready. Logged in as {bot.user}')
-    await tree.sync()
+    if startup.mark('ready'):
+        start_background_task('xp_flush', lambda: xp_ledger.run(interval=int(os.environ.get('XP_FLUSH_INTERVAL', 30))))
+        start_background_task('spam_sweeper', lambda: spam_counter.run_sweeper(interval=60))
+        start_background_task('antinuke_sweeper', lambda: recent_actions.run_sweeper(interval=60))
+        start_background_task('attribution_sweeper', lambda: attributor.run_sweeper(interval=60))
+        start_background_task('raid_sweeper', lambda: raid_guard.run_sweeper(interval=60))
+        start_background_task('meme_prefetch', meme_buffer.refill)
+        start_background_task('reminders', reminders.run)
+        start_background_task('activity', lambda: activity.run(interval=int(os.environ.get('ACTIVITY_FLUSH_INTERVAL', 60))))
+        if metrics_port:
+            start_background_task('metrics', lambda: serve_metrics(metrics, metrics_port, os.environ.get('METRICS_HOST', '127.0.0.1')))
+        # Settings load on first use anyway; warming them all and capturing every guild's roles
+        # and channels can wait until the first interactions have been served
+        start_background_task('settings_warmup', warm_settings)
+        start_background_task('snapshots', lambda: snapshots.run(lambda: bot.guilds, initial_delay=60))
+    # On reconnects too: voice channels may have emptied while the gateway was away
+    deleted, forgotten = await temp_voice.reconcile(bot.guilds)
+    print(f'Temp voice: deleted {deleted} empty channels, forgot {forgotten} missing ones')
+
+async def warm_settings():
+    loaded = await settings_cache.load_all([guild.id for guild in bot.guilds])
+    print(f'Loaded settings for {loaded} guilds')
+
+@bot.event
+async def on_interaction(interaction):
+    if startup.mark('first_interaction'):
+        print(f'Startup: {startup.summary()}')
+
+# Anti-nuke events per guild and action type, counted over sliding windows, one store per shard
+recent_actions = ShardedState(lambda: AntiNukeEventStore(retention=600, counter=counters.counter('antinuke', idle_ttl=600)),
+                              lambda: bot.shard_count)
+
+async def quarantine_offender(guild, actor, action):
+    """Strip the roles of a member caught in an anti-nuke burst with a single API call."""
+    member = guild.get_member(actor.id)
+    if member is None or member.id in (guild.owner_id, bot.user.id):
+        return
+    # /setantinuke may have turned quarantining off since the events were queued
+    if not anti_nuke_enabled(await settings_cache.get(guild.id)):
+        await handle_suspicious_activity(guild)
+        return
 
-# Global variable to keep track of recent actions
-recent_actions = {}
+    try:
+        if member.bot:
+            await member.kick(reason=f"Anti-nuke: {action} burst")
+        else:
+            # Managed (integration) roles can't be removed, so they are kept
+            await member.edit(roles=[role for role in member.roles if role.managed], reason=f"Anti-nuke: {action} burst")
+        outcome = "kicked" if member.bot else "quarantined (roles removed)"
+    except discord.Forbidden:
+        outcome = "detected but could not be quarantined (missing permissions)"
+
+    alert = f"🚨 Anti-nuke: {member.mention} ({member.id}) was {outcome} after a {action} burst."
+    if action in ("role_delete", "channel_delete"):
+        alert += " Use /restore to rebuild what was deleted."
+    await send_to_log_channel(guild, alert)
+    if guild.owner:
+        await guild.owner.send(alert)
+
+# Resolves who caused anti-nuke events from the audit log, one fetch per guild per batch
+attributor = AuditAttributor(quarantine_offender, delay=2.0, counter=counters.counter('attribution', idle_ttl=600))
+
+def anti_nuke_enabled(settings):
+    # On unless /setantinuke turned it off; guilds that never set it keep the protection
+    enabled = getattr(settings, 'anti_nuke_enabled', None)
+    return enabled is None or bool(enabled)
+
+async def record_action(guild, action, detail, target_id=None, on_trip=None):
+    """Record an anti-nuke event and respond once the guild's threshold for it is exceeded.
+
+    When the burst can be attributed to a member only that member is quarantined;
+    otherwise `on_trip` (handle_suspicious_activity by default) alerts the admins.
+    No response strips roles from the whole guild. With anti-nuke disabled for the
+    guild, bursts are never attributed and only alert.
+    """
+    limit, window = thresholds.get(guild.id, action)
+    tripped = await recent_actions.for_guild(guild.id).record(guild.id, action, detail, limit, window)
+    if not anti_nuke_enabled(await settings_cache.get(guild.id)):
+        if tripped:
+            await (on_trip or handle_suspicious_activity)(guild)
+        return
+    attributor.submit(guild, action, detail if target_id is None else target_id, limit, window)
+    if tripped and not await attributor.flush(guild):
+        await (on_trip or handle_suspicious_activity)(guild)
+
+@tree.command(name="setnukelimit", description="Set how many actions of a type within a time window trigger anti-nuke")
+@app_commands.checks.has_permissions(manage_guild=True)
+@app_commands.choices(action=[app_commands.Choice(name=action, value=action) for action in ACTIONS])
+async def set_nuke_limit(interaction: discord.Interaction, action: app_commands.Choice[str], count: app_commands.Range[int, 1, 100], seconds: app_commands.Range[int, 1, 3600]):
+    await db.set_threshold(interaction.guild_id, action.value, count, seconds)
+    thresholds.set(interaction.guild_id, action.value, count, seconds)
+    await interaction.response.send_message(
+        f"Anti-nuke will trigger on more than {count} {action.value} actions within {seconds} seconds.",
+        ephemeral=True
+    )
 
 @bot.event
 async def on_member_remove(member):
-    # Log the member removal
-    guild_id = str(member.guild.id)
-    if guild_id in recent_actions:
-        recent_actions[guild_id].append(("member_remove", member.id))
-    else:
-        recent_actions[guild_id] = [("member_remove", member.id)]
-    
-    # Check for suspicious activity (e.g., multiple members removed)
-    if len(recent_actions[guild_id]) > 4:  # Example threshold
-        await handle_suspicious_activity(member.guild)
+    activity.leave(member.guild.id)
+    # Log the member removal and check for suspicious activity (e.g., multiple members removed)
+    await record_action(member.guild, "member_remove", member.id)
 
 @bot.event
 async def on_member_ban(guild, user):
-    # Log the ban action
-    guild_id = str(guild.id)
-    if guild_id in recent_actions:
-        recent_actions[guild_id].append(("member_ban", user.id))
-    else:
-        recent_actions[guild_id] = [("member_ban", user.id)]
-    
-    # Check for suspicious activity
-    if len(recent_actions[guild_id]) > 4:  # Example threshold
-        await handle_suspicious_activity(guild)
+    # Log the ban action and check for suspicious activity
+    await record_action(guild, "member_ban", user.id)
 
 @bot.event
 async def on_guild_channel_delete(channel):
-    # Log the channel deletion
-    guild_id = str(channel.guild.id)
-    if guild_id in recent_actions:
-        recent_actions[guild_id].append(("channel_delete", channel.id))
-    else:
-        recent_actions[guild_id] = [("channel_delete", channel.id)]
-    
-    # Check for suspicious activity
-    if len(recent_actions[guild_id]) > 5:  # Example threshold
-        await handle_suspicious_activity(channel.guild)
-
-async def restrict_suspicious_activity(guild):
-    # Notify the server owner or admins
-    owner = guild.owner
-    await owner.send("@Everyone 🚨 Suspicious activity detected in your server! Please check the recent actions.")
-    
-    # Optionally, log the activity or take further action (like disabling permissions)
-    # For example, you could temporarily restrict permissions for certain roles.
-    for role in guild.roles:
-        if role.name != "@everyone":
-            await role.edit(permissions=discord.Permissions.none())
+    snapshots.mark_deleted(channel.guild.id, channel.id)
+    # Log the channel deletion and check for suspicious activity
+    await record_action(channel.guild, "channel_delete", channel.id)
+    await temp_voice.forget(channel.id)
 
 @tree.command(name="setantinuke", description="Enable or disable anti-nuke features")
 @app_commands.checks.has_permissions(manage_guild=True)
 async def set_anti_nuke(interaction: discord.Interaction, enabled: bool):
     # Save the setting to your database or configuration
-    with Session(engine) as session:
-        settings = session.query(GuildSettings).filter_by(guild_id=str(interaction.guild_id)).first()
-        
-        if not settings:
-            settings = GuildSettings(guild_id=str(interaction.guild_id))
-            session.add(settings)
-        
-        settings.anti_nuke_enabled = enabled
-        session.commit()
-        
-        status = "enabled" if enabled else "disabled"
-        await interaction.response.send_message(f"Anti-nuke features have been {status}.", ephemeral=True)
+    settings_cache.update(await db.update_guild_settings(interaction.guild_id, anti_nuke_enabled=enabled))
+    
+    status = "enabled" if enabled else "disabled"
+    await interaction.response.send_message(f"Anti-nuke features have been {status}.", ephemeral=True)
+
+def welcome_channel_for(guild, settings):
+    welcome_channel = None
+    if settings.welcome_channel_id:
+        welcome_channel = guild.get_channel(int(settings.welcome_channel_id))
+    
+    if not welcome_channel:
+        welcome_channel = guild.system_channel or discord.utils.get(guild.text_channels, name='general')
+    return welcome_channel
+
+async def send_to_log_channel(guild, text):
+    settings = await settings_cache.get(guild.id)
+    log_channel = guild.get_channel(int(settings.log_channel_id)) if settings and settings.log_channel_id else None
+    if log_channel:
+        await log_channel.send(text)
+
+async def start_raid_mode(guild):
+    """Alert the guild and, if it opted in, raise its verification level. Returns the level to restore."""
+    limit, window = thresholds.get(guild.id, 'raid_joins')
+    previous_level = None
+    if await db.get_raise_verification(guild.id) and guild.verification_level < discord.VerificationLevel.high:
+        try:
+            previous_level = guild.verification_level
+            await guild.edit(verification_level=discord.VerificationLevel.high, reason="Raid mode")
+        except discord.HTTPException:
+            previous_level = None
+    
+    alert = f"🚨 Raid mode: more than {limit} members joined within {window} seconds. Welcomes are being grouped"
+    alert += " and the verification level was raised to High." if previous_level is not None else "."
+    await send_to_log_channel(guild, alert)
+    return previous_level
+
+async def post_join_summary(guild, mentions, count):
+    settings = await settings_cache.get(guild.id)
+    if not settings or not settings.welcome_enabled:
+        return
+    welcome_channel = welcome_channel_for(guild, settings)
+    if welcome_channel:
+        others = f" and {count - len(mentions)} more" if count > len(mentions) else ""
+        await welcome_channel.send(f"👋 Welcome to our {count} newest members: {', '.join(mentions)}{others}!",
+                                   allowed_mentions=discord.AllowedMentions.none())
+
+async def end_raid_mode(guild, previous_level, total):
+    if previous_level is not None:
+        try:
+            await guild.edit(verification_level=previous_level, reason="Raid mode ended")
+        except discord.HTTPException:
+            pass
+    await send_to_log_channel(guild, f"✅ Raid mode ended after {total} joins.")
+
+# Switches guilds into raid mode on join bursts; welcomes are then posted as periodic summaries
+raid_guard = RaidGuard(start_raid_mode, post_join_summary, end_raid_mode)
+
+# Hands out the "New Member" role from a paced queue
+join_roles = JoinRoleAssigner(bulk)
 
 @bot.event
 async def on_member_join(member):
     """Event handler for when a new member joins the server"""
-    with Session(engine) as session:
-        settings = session.query(GuildSettings).filter_by(guild_id=str(member.guild.id)).first()
-        
-        if not settings or not settings.welcome_enabled:
-            return
-        
-        welcome_channel = None
-        if settings.welcome_channel_id:
-            welcome_channel = member.guild.get_channel(int(settings.welcome_channel_id))
+    activity.join(member.guild.id)
+    join_roles.enqueue(member)
+    limit, window = thresholds.get(member.guild.id, 'raid_joins')
+    if raid_guard.record_join(member.guild, member, limit, window):
+        return
+    
+    settings = await settings_cache.get(member.guild.id)
+    
+    if not settings or not settings.welcome_enabled:
+        return
+    
+    welcome_channel = welcome_channel_for(member.guild, settings)
+    
+    if welcome_channel:
+        if settings.welcome_message:
+            message = compile_template(settings.welcome_message, WELCOME_FIELDS).render(
+                user=member.mention,
+                server=member.guild.name,
+                membercount=member.guild.member_count,
+            )
+        else:
+            message = f"Welcome to the server, {member.mention}! 👋"
         
-        if not welcome_channel:
-            welcome_channel = member.guild.system_channel or discord.utils.get(member.guild.text_channels, name='general')
+        await welcome_channel.send(message)
+
+async def prepare_message(message):
+    if message.author.bot or message.guild is None:
+        return None
+    return MessageContext(message, await settings_cache.get(message.guild.id))
+
+# Every guild message goes through these stages in order; a stage returning True ends it there
+message_pipeline = MessagePipeline(prepare_message)
+
+# Recent message counts per guild and author; idle authors are swept out
+spam_counter = ShardedState(lambda: counters.counter('spam', idle_ttl=300), lambda: bot.shard_count)
+
+@message_pipeline.stage('activity')
+async def activity_stage(ctx):
+    # First, so messages later stages delete or punish still count
+    activity.message(ctx.guild_id, ctx.message.channel.id)
+    return False
+
+@message_pipeline.stage('spam')
+async def spam_stage(ctx):
+    limit, window = thresholds.get(ctx.guild_id, 'spam')
+    counter = spam_counter.for_guild(ctx.guild_id)
+    if await counter.hit(ctx.guild_id, ctx.author_id, limit, window) > limit:
+        # Start counting afresh so every following message doesn't re-trigger the mute
+        await counter.reset(ctx.guild_id, ctx.author_id)
+        await ctx.message.author.timeout(timedelta(seconds=60))  # Mute for 60 seconds
+        await ctx.message.channel.send(f"{ctx.message.author.mention}, you have been muted for spamming.")
+        return True
+    return False
+
+@message_pipeline.stage('filter')
+async def filter_stage(ctx):
+    if not ctx.settings or not ctx.settings.filter_enabled:
+        return False
+    if (await word_filters.get(ctx.guild_id)).find(ctx.content_lower, lowered=True):
+        try:
+            await ctx.message.delete()
+            await ctx.message.channel.send(
+                f"{ctx.message.author.mention} Your message was removed because it contained a filtered word.",
+                delete_after=5
+            )
+            return True
+        except discord.errors.Forbidden:
+            pass
+    return False
+
+@message_pipeline.stage('xp')
+async def xp_stage(ctx):
+    # XP gain (in memory; the ledger flushes to UserLevel in batches)
+    if not ctx.settings or not ctx.settings.level_enabled:
+        return False
+    message = ctx.message
+    awarded = await xp_ledger.award(ctx.guild_id, ctx.author_id, random.randint(15, 25), datetime.utcnow())
+    if awarded:
+        old_xp, new_xp = awarded
+        leaderboards.update(ctx.guild_id, ctx.author_id, new_xp)
+        activity.xp(ctx.guild_id, new_xp - old_xp)
+        old_level = calculate_level_for_xp(old_xp)
+        new_level = calculate_level_for_xp(new_xp)
         
-        if welcome_channel:
-            if settings.welcome_message:
-                message = settings.welcome_message.replace('{user}', member.mention) \
-                                                  .replace('{server}', member.guild.name) \
-                                                  .replace('{membercount}', str(member.guild.member_count))
+        if new_level > old_level:
+            level_up_channel = message.channel
+            if ctx.settings.level_up_channel:
+                channel = message.guild.get_channel(int(ctx.settings.level_up_channel))
+                if channel:
+                    level_up_channel = channel
+            
+            if ctx.settings.level_up_message:
+                level_up_msg = compile_template(ctx.settings.level_up_message, LEVEL_UP_FIELDS).render(
+                    user=message.author.mention,
+                    level=new_level,
+                )
             else:
-                message = f"Welcome to the server, {member.mention}! 👋"
+                level_up_msg = f"🎉 Congratulations {message.author.mention}! You've reached level {new_level}! 🎉"
             
-            await welcome_channel.send(message)
+            await level_up_channel.send(level_up_msg)
+    return False
 
 @bot.event
-async def on_message_event(message):
-    if message.author.bot:
-        return
+async def on_message(message):
+    await message_pipeline.dispatch(message)
 
-    # Word filter check
-    with Session(engine) as session:
-        settings = session.query(GuildSettings).filter_by(guild_id=str(message.guild.id)).first()
-        
-        if settings and settings.filter_enabled:
-            filtered_words = session.query(FilteredWord).filter_by(guild_id=str(message.guild.id)).all()
-            message_content = message.content.lower()
-            
-            for filtered_word in filtered_words:
-                if filtered_word.word.lower() in message_content:
-                    try:
-                        await message.delete()
-                        warning = await message.channel.send(
-                            f"{message.author.mention} Your message was removed because it contained a filtered word.",
-                            delete_after=5
-                        )
-                        return
-                    except discord.errors.Forbidden:
-                        pass
-        
-        # XP gain
-        if settings and settings.level_enabled:
-            user_level = session.query(UserLevel).filter_by(
-                guild_id=str(message.guild.id),
-                user_id=str(message.author.id)
-            ).first()
-            
-            if not user_level:
-                user_level = UserLevel(
-                    guild_id=str(message.guild.id),
-                    user_id=str(message.author.id)
-                )
-                session.add(user_level)
-            
-            now = datetime.utcnow()
-            if not user_level.last_xp_gain or (now - user_level.last_xp_gain).total_seconds() >= 60:
-                old_level = calculate_level_for_xp(user_level.xp)
-                xp_gain = random.randint(15, 25)
-                user_level.xp += xp_gain
-                user_level.last_xp_gain = now
-                new_level = calculate_level_for_xp(user_level.xp)
-                
-                if new_level > old_level:
-                    level_up_channel = message.channel
-                    if settings.level_up_channel:
-                        channel = message.guild.get_channel(int(settings.level_up_channel))
-                        if channel:
-                            level_up_channel = channel
-                    
-                    if settings.level_up_message:
-                        level_up_msg = settings.level_up_message.replace('{user}', message.author.mention) \
-                                                                .replace('{level}', str(new_level))
-                    else:
-                        level_up_msg = f"🎉 Congratulations {message.author.mention}! You've reached level {new_level}! 🎉"
-                    
-                    await level_up_channel.send(level_up_msg)
-                
-                session.commit()
+@tree.command(name="pipelinestats", description="Show message handling latency per stage")
+@app_commands.checks.has_permissions(manage_guild=True)
+async def pipeline_stats(interaction: discord.Interaction):
+    lines = ["**Message pipeline** (since startup)"]
+    for name, stats in message_pipeline.stats().items():
+        lines.append(f"{name}: {stats['count']} msgs, mean {stats['mean'] * 1000:.2f} ms, "
+                     f"p50 ≤ {stats['p50'] * 1000:g} ms, p99 ≤ {stats['p99'] * 1000:g} ms, stopped {stats['stopped']}")
+    await interaction.response.send_message("\n".join(lines), ephemeral=True)
 
 @tree.command(name="setwelcome", description="Configure welcome message settings")
 @app_commands.checks.has_permissions(manage_guild=True)
@@ -289,217 +530,189 @@ async def set_welcome(
     message: str = None,
     enabled: bool = None
 ):
-    with Session(engine) as session:
-        settings = session.query(GuildSettings).filter_by(guild_id=str(interaction.guild_id)).first()
-        
-        if not settings:
-            settings = GuildSettings(guild_id=str(interaction.guild_id))
-            session.add(settings)
-        
-        if channel is not None:
-            settings.welcome_channel_id = str(channel.id)
-        
-        if message is not None:
-            settings.welcome_message = message
-        
-        if enabled is not None:
-            settings.welcome_enabled = enabled
-        
-        session.commit()
-        
-        preview = "Current welcome message settings:\n"
-        preview += f"Enabled: {settings.welcome_enabled}\n"
-        
-        if settings.welcome_channel_id:
-            channel = interaction.guild.get_channel(int(settings.welcome_channel_id))
-            preview += f"Channel: {channel.mention if channel else 'Not found'}\n"
-        else:
-            preview += "Channel: Default (system channel or #general)\n"
-        
-        if settings.welcome_message:
-            message_preview = settings.welcome_message.replace('{user}', interaction.user.mention) \
-                                                    .replace('{server}', interaction.guild.name) \
-                                                    .replace('{membercount}', str(interaction.guild.member_count))
-            preview += f"Message: {message_preview}\n"
-        else:
-            preview += "Message: Default (Welcome to the server, @user! 👋)\n"
-        
-        preview += "\nAvailable placeholders: {user}, {server}, {membercount}"
-        
-        await interaction.response.send_message(preview)
+    changes = {}
+    if channel is not None:
+        changes['welcome_channel_id'] = str(channel.id)
+    
+    if message is not None:
+        try:
+            validate_template(message, WELCOME_FIELDS)
+        except TemplateError as e:
+            await interaction.response.send_message(str(e), ephemeral=True)
+            return
+        changes['welcome_message'] = message
+    
+    if enabled is not None:
+        changes['welcome_enabled'] = enabled
+    
+    settings = settings_cache.update(await db.update_guild_settings(interaction.guild_id, **changes))
+    
+    preview = "Current welcome message settings:\n"
+    preview += f"Enabled: {settings.welcome_enabled}\n"
+    
+    if settings.welcome_channel_id:
+        channel = interaction.guild.get_channel(int(settings.welcome_channel_id))
+        preview += f"Channel: {channel.mention if channel else 'Not found'}\n"
+    else:
+        preview += "Channel: Default (system channel or #general)\n"
+    
+    if settings.welcome_message:
+        message_preview = compile_template(settings.welcome_message, WELCOME_FIELDS).render(
+            user=interaction.user.mention,
+            server=interaction.guild.name,
+            membercount=interaction.guild.member_count,
+        )
+        preview += f"Message: {message_preview}\n"
+    else:
+        preview += "Message: Default (Welcome to the server, @user! 👋)\n"
+    
+    preview += "\nAvailable placeholders: " + ", ".join("{" + field + "}" for field in WELCOME_FIELDS)
+    
+    await interaction.response.send_message(preview)
 
 @tree.command(name="addfilter", description="Add a word or phrase to the filter list")
 @app_commands.checks.has_permissions(manage_messages=True)
 async def add_filter(interaction: discord.Interaction, word: str):
-    with Session(engine) as session:
-        settings = session.query(GuildSettings).filter_by(guild_id=str(interaction.guild_id)).first()
-        
-        if not settings:
-            settings = GuildSettings(guild_id=str(interaction.guild_id))
-            session.add(settings)
-            settings.filter_enabled = True
-        
-        filtered_word = FilteredWord(guild_id=str(interaction.guild_id), word=word)
-        session.add(filtered_word)
-        session.commit()
-        
-        await interaction.response.send_message(f"Added '{word}' to the filter list.", ephemeral=True)
+    settings_cache.update(await db.add_filtered_word(interaction.guild_id, word))
+    word_filters.add_word(interaction.guild_id, word)
+    
+    await interaction.response.send_message(f"Added '{word}' to the filter list.", ephemeral=True)
 
 @tree.command(name="removefilter", description="Remove a word or phrase from the filter list")
 @app_commands.checks.has_permissions(manage_messages=True)
 async def remove_filter(interaction: discord.Interaction, word: str):
-    with Session(engine) as session:
-        filtered_word = session.query(FilteredWord).filter_by(
-            guild_id=str(interaction.guild_id),
-            word=word
-        ).first()
-        
-        if filtered_word:
-            session.delete(filtered_word)
-            session.commit()
-            await interaction.response.send_message(f"Removed '{word}' from the filter list.", ephemeral=True)
-        else:
-            await interaction.response.send_message(f"'{word}' was not found in the filter list.", ephemeral=True)
+    if await db.remove_filtered_word(interaction.guild_id, word):
+        word_filters.remove_word(interaction.guild_id, word)
+        await interaction.response.send_message(f"Removed '{word}' from the filter list.", ephemeral=True)
+    else:
+        await interaction.response.send_message(f"'{word}' was not found in the filter list.", ephemeral=True)
 
 @tree.command(name="listfilters", description="List all filtered words and phrases")
 @app_commands.checks.has_permissions(manage_messages=True)
 async def list_filters(interaction: discord.Interaction):
-    with Session(engine) as session:
-        filtered_words = session.query(FilteredWord).filter_by(guild_id=str(interaction.guild_id)).all()
-        settings = session.query(GuildSettings).filter_by(guild_id=str(interaction.guild_id)).first()
-        
-        if not filtered_words:
-            await interaction.response.send_message("No words are currently filtered.", ephemeral=True)
-            return
-        
-        filter_status = "enabled" if settings and settings.filter_enabled else "disabled"
-        word_list = "\n".join([f"• {word.word}" for word in filtered_words])
-        message = f"Word filter is currently {filter_status}.\nFiltered words:\n{word_list}"
-        
-        await interaction.response.send_message(message, ephemeral=True)
+    filtered_words = await db.get_filtered_words(interaction.guild_id)
+    settings = await settings_cache.get(interaction.guild_id)
+    
+    if not filtered_words:
+        await interaction.response.send_message("No words are currently filtered.", ephemeral=True)
+        return
+    
+    filter_status = "enabled" if settings and settings.filter_enabled else "disabled"
+    word_list = "\n".join([f"• {word}" for word in filtered_words])
+    message = f"Word filter is currently {filter_status}.\nFiltered words:\n{word_list}"
+    
+    await interaction.response.send_message(message, ephemeral=True)
 
 @tree.command(name="togglefilter", description="Enable or disable the word filter")
 @app_commands.checks.has_permissions(manage_messages=True)
 async def toggle_filter(interaction: discord.Interaction, enabled: bool):
-    with Session(engine) as session:
-        settings = session.query(GuildSettings).filter_by(guild_id=str(interaction.guild_id)).first()
-        
-        if not settings:
-            settings = GuildSettings(guild_id=str(interaction.guild_id))
-            session.add(settings)
-        
-        settings.filter_enabled = enabled
-        session.commit()
-        
-        status = "enabled" if enabled else "disabled"
-        await interaction.response.send_message(f"Word filter has been {status}.", ephemeral=True)
+    settings_cache.update(await db.update_guild_settings(interaction.guild_id, filter_enabled=enabled))
+    
+    status = "enabled" if enabled else "disabled"
+    await interaction.response.send_message(f"Word filter has been {status}.", ephemeral=True)
 
 @tree.command(name="setranking", description="Enable or disable the ranking system")
 @app_commands.checks.has_permissions(manage_guild=True)
 async def set_ranking(interaction: discord.Interaction, enabled: bool):
     """Enable or disable the ranking system for the server."""
-    with Session(engine) as session:
-        settings = session.query(GuildSettings).filter_by(guild_id=str(interaction.guild_id)).first()
-        
-        if not settings:
-            settings = GuildSettings(guild_id=str(interaction.guild_id))
-            session.add(settings)
-        
-        settings.level_enabled = enabled
-        session.commit()
-        
-        status = "enabled" if enabled else "disabled"
-        await interaction.response.send_message(f"Ranking system has been {status}.", ephemeral=True)
-
-@tree.command(name="leaderboard", description="Show the server's top 10 most active members")
-async def leaderboard_top(interaction: discord.Interaction):
-    """Display the leaderboard of the top 10 members based on XP."""
-    with Session(engine) as session:
-        settings = session.query(GuildSettings).filter_by(guild_id=str(interaction.guild.id)).first()
-        
-        if not settings or not settings.level_enabled:
-            await interaction.response.send_message("The ranking system is not enabled on this server.", ephemeral=True)
-            return
-        
-        top_users = session.query(UserLevel).filter_by(guild_id=str(interaction.guild.id)) \
-                            .order_by(UserLevel.xp.desc()).limit(10).all()
-        
-        if not top_users:
-            await interaction.response.send_message("No members have earned XP yet!", ephemeral=True)
-            return
-        
-        response = "🏆 **Server Leaderboard** 🏆\n\n"
-        for i, user_level in enumerate(top_users, 1):
-            member = interaction.guild.get_member(int(user_level.user_id))
-            if member:
-                level = calculate_level_for_xp(user_level.xp)
-                response += f"{i}. {member.display_name} - Level {level} ({user_level.xp} XP)\n"
-        
-        await interaction.response.send_message(response)
-
-@bot.event
-async def on_guild_role_create(role):
-    guild_id = str(role.guild.id)
-    if guild_id in recent_actions:
-        recent_actions[guild_id].append(("role_create", role.id))
-    else:
-        recent_actions[guild_id] = [("role_create", role.id)]
+    settings_cache.update(await db.update_guild_settings(interaction.guild_id, level_enabled=enabled))
     
-    # Check for suspicious activity
-    if len(recent_actions[guild_id]) > 5:  # Example threshold for role creations
-        await handle_suspicious_activity(role.guild)
-
-message_counts = {}
-
-@bot.event
-async def on_message_spam_check(message):
-    if message.author.bot:
-        return
+    status = "enabled" if enabled else "disabled"
+    await interaction.response.send_message(f"Ranking system has been {status}.", ephemeral=True)
+
+def format_leaderboard_page(guild, entries, page, page_count):
+    levels = levels_for_xp([xp for _, _, xp in entries])
+    response = "🏆 **Server Leaderboard** 🏆\n\n"
+    for (position, user_id, xp), level in zip(entries, levels):
+        member = guild.get_member(int(user_id))
+        name = member.display_name if member else "Former member"
+        response += f"{position}. {name} - Level {level} ({xp} XP)\n"
+    if page_count > 1:
+        response += f"\nPage {page}/{page_count}"
+    return response
+
+class LeaderboardView(discord.ui.View):
+    def __init__(self, guild, page, page_count):
+        super().__init__(timeout=300)
+        self.guild = guild
+        self.page = page
+        self.page_count = page_count
+        self.update_buttons()
     
-    guild_id = str(message.guild.id)
-    now = datetime.utcnow()
+    def update_buttons(self):
+        self.previous_page.disabled = self.page <= 1
+        self.next_page.disabled = self.page >= self.page_count
     
-    if guild_id not in message_counts:
-        message_counts[guild_id] = {}
+    async def show(self, interaction, page):
+        self.page_count = await leaderboards.page_count(self.guild.id)
+        self.page = max(1, min(page, self.page_count))
+        self.update_buttons()
+        content = await leaderboards.render(
+            self.guild.id, self.page, lambda entries, page, page_count: format_leaderboard_page(self.guild, entries, page, page_count))
+        await interaction.response.edit_message(content=content, view=self)
     
-    if message.author.id not in message_counts[guild_id]:
-        message_counts[guild_id][message.author.id] = []
+    @discord.ui.button(label="◀ Previous", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show(interaction, self.page - 1)
     
-    message_counts[guild_id][message.author.id].append(now)
+    @discord.ui.button(label="Next ▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show(interaction, self.page + 1)
+
+async def send_leaderboard(interaction, page):
+    """Show a page of the guild's leaderboard with buttons to move between pages."""
+    settings = await settings_cache.get(interaction.guild_id)
+    
+    if not settings or not settings.level_enabled:
+        await interaction.response.send_message("The ranking system is not enabled on this server.", ephemeral=True)
+        return
     
-    # Remove messages older than 10 seconds
-    message_counts[guild_id][message.author.id] = [msg_time for msg_time in message_counts[guild_id][message.author.id] if (now - msg_time).total_seconds() < 10]
+    page_count = await leaderboards.page_count(interaction.guild_id)
+    if not await leaderboards.page(interaction.guild_id, 1):
+        await interaction.response.send_message("No members have earned XP yet!", ephemeral=True)
+        return
     
-    if len(message_counts[guild_id][message.author.id]) > 5:  # Example threshold for spam
-        await message.author.timeout(duration=60)  # Mute for 60 seconds
-        await message.channel.send(f"{message.author.mention}, you have been muted for spamming.")
+    page = min(page, page_count)
+    guild = interaction.guild
+    content = await leaderboards.render(
+        guild.id, page, lambda entries, page, page_count: format_leaderboard_page(guild, entries, page, page_count))
+    if page_count > 1:
+        await interaction.response.send_message(content, view=LeaderboardView(guild, page, page_count))
+    else:
+        await interaction.response.send_message(content)
+
+@tree.command(name="leaderboard", description="Show the server's most active members")
+async def leaderboard_top(interaction: discord.Interaction, page: app_commands.Range[int, 1, 10000] = 1):
+    """Display the leaderboard of members based on XP, 10 per page."""
+    await send_leaderboard(interaction, page)
 
 @bot.event
-async def on_guild_update_event(before, after):
-    guild_id = str(after.id)
-    if before.region != after.region:
-        if guild_id in recent_actions:
-            recent_actions[guild_id].append(("region_change", after.region))
-        else:
-            recent_actions[guild_id] = [("region_change", after.region)]
-    
-    if before.verification_level != after.verification_level:
-        if guild_id in recent_actions:
-            recent_actions[guild_id].append(("verification_level_change", after.verification_level))
-        else:
-            recent_actions[guild_id] = [("verification_level_change", after.verification_level)]
-    
+async def on_guild_role_create(role):
+    join_roles.invalidate(role.guild.id)
+    snapshots.record_role(role)
     # Check for suspicious activity
-    if len(recent_actions[guild_id]) > 3:  # Example threshold for critical changes
-        await notify_suspicious_activity(after)
+    await record_action(role.guild, "role_create", role.id)
 
-async def restore_roles(guild):
-    for action in recent_actions[guild.id]:
-        if action[0] == "role_delete":
-            role_id = action[1]
-            # Logic to restore the role (you may need to store the role data before deletion)
-            # This is a placeholder example, you would need to customize this based on your needs.
-            await guild.create_role(name="Restored Role", color=discord.Color.default()) 
+@tree.command(name="setspamlimit", description="Set how many messages per time window count as spam")
+@app_commands.checks.has_permissions(manage_guild=True)
+async def set_spam_limit(interaction: discord.Interaction, messages: app_commands.Range[int, 1, 50], seconds: app_commands.Range[int, 1, 300]):
+    await db.set_threshold(interaction.guild_id, 'spam', messages, seconds)
+    thresholds.set(interaction.guild_id, 'spam', messages, seconds)
+    await interaction.response.send_message(
+        f"Members sending more than {messages} messages within {seconds} seconds will be muted.",
+        ephemeral=True
+    )
+
+@tree.command(name="setraidlimit", description="Set the join rate that switches the server into raid mode")
+@app_commands.checks.has_permissions(manage_guild=True)
+async def set_raid_limit(interaction: discord.Interaction, joins: app_commands.Range[int, 2, 1000], seconds: app_commands.Range[int, 1, 3600], raise_verification: bool = None):
+    await db.set_threshold(interaction.guild_id, 'raid_joins', joins, seconds)
+    thresholds.set(interaction.guild_id, 'raid_joins', joins, seconds)
+    response = f"Raid mode will start when more than {joins} members join within {seconds} seconds."
+    if raise_verification is not None:
+        await db.set_raise_verification(interaction.guild_id, raise_verification)
+        response += " The verification level will " + ("be raised to High" if raise_verification else "not be changed") + " during raids."
+    await interaction.response.send_message(response, ephemeral=True)
 
 async def handle_suspicious_activity(guild):
     # Notify the server owner or admins
@@ -507,27 +720,25 @@ async def handle_suspicious_activity(guild):
     await owner.send("@Everyone 🚨 Suspicious activity detected in your server! Please check the recent actions.")
     
     # Notify all admins
-    for member in guild.members:
-        if member.guild_permissions.administrator:
-            await member.send("@Everyone 🚨 Suspicious activity detected in your server! Please check the recent actions.")
+    admins = [member for member in guild.members
+              if member.guild_permissions.administrator and not member.bot and member.id != guild.owner_id]
+    job = BulkJob(f"Alerting admins of {guild.name}", len(admins))
+    await bulk.run(job, 'dm', admins, lambda member: member.send(
+        "@Everyone 🚨 Suspicious activity detected in your server! Please check the recent actions."
+    ))
 
 @bot.event
-async def on_guild_role_delete(role):
-    guild_id = str(role.guild.id)
-    if guild_id in recent_actions:
-        recent_actions[guild_id].append(("role_delete", role.id))
-    else:
-        recent_actions[guild_id] = [("role_delete", role.id)]
-    
-    # Check for suspicious activity
-    if len(recent_actions[guild_id]) > 2:  # Example threshold for role deletions
-        await handle_suspicious_activity(role.guild)
+async def on_guild_role_update(before, after):
+    if before.name != after.name:
+        join_roles.invalidate(after.guild.id)
+    snapshots.record_role(after)
 
 @bot.event
-async def on_member_join_role_assignment(member):
-    role = discord.utils.get(member.guild.roles, name="New Member")  # Change to your role name
-    if role:
-        await member.add_roles(role)
+async def on_guild_role_delete(role):
+    join_roles.invalidate(role.guild.id)
+    snapshots.mark_deleted(role.guild.id, role.id)
+    # Check for suspicious activity
+    await record_action(role.guild, "role_delete", role.id)
 
 @tree.command(name="reactionroles", description="Set up reaction roles")
 async def reaction_roles(interaction: discord.Interaction, role: discord.Role):
@@ -549,30 +760,45 @@ async def flip_coin(interaction: discord.Interaction):
     result = random.choice(["Heads", "Tails"])
     await interaction.response.send_message(f"You flipped: {result}")
 
-import requests
-
 @tree.command(name="meme", description="Get a random meme")
 async def meme(interaction: discord.Interaction):
-    response = requests.get("https://meme-api.com/gimme")
-    if response.status_code == 200:
-        meme_data = response.json()
-        await interaction.response.send_message(meme_data['url'])
+    if not meme_buffer.ready:
+        # The buffer is being refilled; don't let the API round trip expire the interaction
+        await interaction.response.defer()
+    send = interaction.followup.send if interaction.response.is_done() else interaction.response.send_message
+    meme_url = await meme_buffer.get()
+    if meme_url:
+        await send(meme_url)
     else:
-        await interaction.response.send_message("Couldn't fetch a meme at the moment.")
+        await send("Couldn't fetch a meme at the moment.")
 
 @tree.command(name="roll", description="Roll a dice")
 async def roll(interaction: discord.Interaction):
     result = random.randint(1, 6)
     await interaction.response.send_message(f"You rolled a {result}!")
 
-@tree.command(name="stats", description="Get server statistics")
+@tree.command(name="stats", description="Get server statistics and activity trends")
 async def server_stats(interaction: discord.Interaction):
     member_count = interaction.guild.member_count
     channel_count = len(interaction.guild.channels)
     role_count = len(interaction.guild.roles)
     
     stats_message = f"**Server Statistics:**\nMembers: {member_count}\nChannels: {channel_count}\nRoles: {role_count}"
-    await interaction.response.send_message(stats_message)
+
+    # Read from the rollups: a fixed number of buckets whatever the guild's volume
+    guild_activity = await activity.guild(interaction.guild_id)
+    now = time.time()
+    lines = ["", "**Activity:**"]
+    for label, resolution, count in (("Last hour", 'minute', 60), ("Last 24 hours", 'hour', 24), ("Last 7 days", 'day', 7)):
+        messages, joins, leaves, xp = guild_activity.totals(resolution, count, now)
+        lines.append(f"{label}: {messages} messages, {joins} joins, {leaves} leaves, {xp} XP")
+    hourly = [counts[0] for counts in guild_activity.series('hour', 24, now)]
+    lines.append(f"Messages per hour (24h): {sparkline(hourly)} peak {max(hourly)}")
+    top = guild_activity.top_channels(5, now)
+    if top:
+        channels = ", ".join(f"<#{channel_id}> {messages}" for channel_id, messages in top)
+        lines.append(f"Top channels (7 days): {channels}")
+    await interaction.response.send_message(stats_message + "\n".join(lines))
 
 @bot.event
 async def on_member_join_welcome(member):
@@ -581,99 +807,125 @@ async def on_member_join_welcome(member):
 @tree.command(name="rank", description="Show your current level and XP")
 async def rank(interaction: discord.Interaction, user: discord.Member = None):
     target_user = user or interaction.user
+    settings = await settings_cache.get(interaction.guild_id)
     
-    with Session(engine) as session:
-        settings = session.query(GuildSettings).filter_by(guild_id=str(interaction.guild_id)).first()
-        
-        if not settings or not settings.level_enabled:
-            await interaction.response.send_message("Leveling system is not enabled on this server.", ephemeral=True)
-            return
-        
-        user_level = session.query(UserLevel).filter_by(
-            guild_id=str(interaction.guild_id),
-            user_id=str(target_user.id)
-        ).first()
-        
-        if not user_level:
-            await interaction.response.send_message(f"{target_user.display_name} hasn't earned any XP yet!", ephemeral=True)
-            return
-        
-        current_level = calculate_level_for_xp(user_level.xp)
-        current_level_xp = calculate_xp_for_level(current_level)
-        next_level_xp = calculate_xp_for_level(current_level + 1)
-        level_progress = user_level.xp - current_level_xp
-        level_requirement = next_level_xp - current_level_xp
-        progress_bar = generate_progress_bar(level_progress, level_requirement)
-        
-        response = f"**{target_user.display_name}'s Level Stats**\n"
-        response += f"Level: {current_level}\n"
-        response += f"Total XP: {user_level.xp}\n"
-        response += f"Progress to Level {current_level + 1}:\n"
-        response += f"{progress_bar} {level_progress}/{level_requirement} XP"
-        
-        await interaction.response.send_message(response)
+    if not settings or not settings.level_enabled:
+        await interaction.response.send_message("Leveling system is not enabled on this server.", ephemeral=True)
+        return
+    
+    ranked = await leaderboards.rank(interaction.guild_id, target_user.id)
+    
+    if ranked is None:
+        await interaction.response.send_message(f"{target_user.display_name} hasn't earned any XP yet!", ephemeral=True)
+        return
+    
+    position, xp, ranked_members = ranked
+    current_level = calculate_level_for_xp(xp)
+    current_level_xp = calculate_xp_for_level(current_level)
+    next_level_xp = calculate_xp_for_level(current_level + 1)
+    level_progress = xp - current_level_xp
+    level_requirement = next_level_xp - current_level_xp
+    progress_bar = generate_progress_bar(level_progress, level_requirement)
+    
+    response = f"**{target_user.display_name}'s Level Stats**\n"
+    response += f"Rank: #{position} of {ranked_members}\n"
+    response += f"Level: {current_level}\n"
+    response += f"Total XP: {xp}\n"
+    response += f"Progress to Level {current_level + 1}:\n"
+    response += f"{progress_bar} {level_progress}/{level_requirement} XP"
+    
+    await interaction.response.send_message(response)
 
-@tree.command(name="leaderboards", description="Show the server's top 10 most active members")
-async def leaderboard(interaction: discord.Interaction):
-    with Session(engine) as session:
-        settings = session.query(GuildSettings).filter_by(guild_id=str(interaction.guild_id)).first()
-        
-        if not settings or not settings.level_enabled:
-            await interaction.response.send_message("Leveling system is not enabled on this server.", ephemeral=True)
-            return
-        
-        top_users = session.query(UserLevel).filter_by(guild_id=str(interaction.guild_id)) \
-                           .order_by(UserLevel.xp.desc()).limit(10).all()
-        
-        if not top_users:
-            await interaction.response.send_message("No one has earned any XP yet!", ephemeral=True)
-            return
-        
-        response = "🏆 **Server Leaderboard** 🏆\n\n"
-        for i, user_level in enumerate(top_users, 1):
-            member = interaction.guild.get_member(int(user_level.user_id))
-            if member:
-                level = calculate_level_for_xp(user_level.xp)
-                response += f"{i}. {member.display_name} - Level {level} ({user_level.xp} XP)\n"
-        
-        await interaction.response.send_message(response)
+@tree.command(name="leaderboards", description="Show the server's most active members")
+async def leaderboard(interaction: discord.Interaction, page: app_commands.Range[int, 1, 10000] = 1):
+    await send_leaderboard(interaction, page)
 
 @tree.command(name="setupvoice", description="Setup a channel for creating temporary voice channels")
 @app_commands.checks.has_permissions(manage_channels=True)
 async def setup_voice(interaction: discord.Interaction):
     guild = interaction.guild
-    existing_channel = discord.utils.get(guild.voice_channels, name="Create Voice Channel")
+    lobby_id = temp_voice.lobby_id(guild.id)
+    existing_channel = guild.get_channel(lobby_id) if lobby_id else None
     if existing_channel:
-        await interaction.response.send_message("The 'Create Voice Channel' already exists.", ephemeral=True)
+        await interaction.response.send_message(f"{existing_channel.mention} already exists.", ephemeral=True)
         return
 
-    new_channel = await guild.create_voice_channel("Create Voice Channel")
-    await interaction.response.send_message(f"'Create Voice Channel' has been created: {new_channel.mention}", ephemeral=True)
+    new_channel = await guild.create_voice_channel(temp_voice.lobby_name)
+    await temp_voice.set_lobby(guild, new_channel)
+    await interaction.response.send_message(f"'{temp_voice.lobby_name}' has been created: {new_channel.mention}", ephemeral=True)
 
 @bot.event
 async def on_voice_state_update(member, before, after):
-    if after.channel and after.channel.name == "Create Voice Channel":
-        guild = member.guild
-        category = after.channel.category
-        temp_channel = await guild.create_voice_channel(f"🎮 {member.display_name}'s Channel", category=category)
-        await member.move_to(temp_channel)
-        await temp_channel.set_permissions(member, manage_channels=True)
-
-        def check_empty_channel():
-            if len(temp_channel.members) == 0:
-                return True
-            return False
-
-        while not check_empty_channel():
-            await asyncio.sleep(60)  # Check every minute
-
-        await temp_channel.delete()
+    await temp_voice.handle_voice_state(member, before, after)
 
 @tree.command(name="clear", description="Clear a specified number of messages from a channel")
 @app_commands.checks.has_permissions(manage_messages=True)
-async def clear_messages(interaction: discord.Interaction, amount: int):
-    await interaction.channel.purge(limit=amount + 1)  # +1 to remove the command message
-    await interaction.response.send_message(f"Cleared {amount} messages.", ephemeral=True)
+async def clear_messages(interaction: discord.Interaction, amount: app_commands.Range[int, 1, 10000],
+                         user: discord.User = None, bots: bool = False, contains: str = None,
+                         before: str = None, after: str = None):
+    """Delete up to `amount` of the newest messages matching every filter given."""
+    try:
+        before_id = int(before) if before else None
+        after_id = int(after) if after else None
+    except ValueError:
+        await interaction.response.send_message("`before` and `after` must be message IDs.", ephemeral=True)
+        return
+    
+    purge_filter = PurgeFilter(user_id=user.id if user else None, bots_only=bots, contains=contains,
+                               before=before_id, after=after_id)
+    job = PurgeJob(f"Clearing messages in {interaction.channel.mention}", amount)
+    # Answer within Discord's 3 seconds; the purge itself can take minutes
+    report = await show_progress(interaction, job, ephemeral=True)
+    await purger.run(interaction.channel, job, purge_filter, on_progress=report)
+
+class BulkCancelView(discord.ui.View):
+    def __init__(self, job, owner_id):
+        # Follow-up messages can only be edited for 15 minutes after the command
+        super().__init__(timeout=900)
+        self.job = job
+        self.owner_id = owner_id
+    
+    async def interaction_check(self, interaction: discord.Interaction):
+        if interaction.user.id != self.owner_id:
+            await interaction.response.send_message("Only the member who started this job can cancel it.", ephemeral=True)
+            return False
+        return True
+    
+    @discord.ui.button(label="Cancel", style=discord.ButtonStyle.secondary)
+    async def cancel(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.job.cancel()
+        button.disabled = True
+        await interaction.response.edit_message(content=self.job.summary(), view=self)
+
+async def show_progress(interaction, job, ephemeral=False):
+    """Defer the interaction and post the job's progress with a cancel button. Returns `await report(job)`."""
+    await interaction.response.defer(ephemeral=ephemeral, thinking=True)
+    view = BulkCancelView(job, interaction.user.id)
+    progress_message = await interaction.followup.send(job.summary(), view=view, ephemeral=ephemeral, wait=True)
+    
+    async def report(job):
+        if job.finished:
+            view.stop()
+        await progress_message.edit(content=job.summary(), view=None if job.finished else view)
+    return report
+
+async def run_bulk_command(interaction, description, route, items, action):
+    """Run a bulk action for a slash command, with live progress and a cancel button."""
+    job = BulkJob(description, len(items))
+    report = await show_progress(interaction, job)
+    await bulk.run(job, route, items, action, scope=interaction.guild_id, on_progress=report)
+
+@tree.command(name="restore", description="Rebuild roles and channels deleted in the last few minutes")
+@app_commands.checks.has_permissions(administrator=True)
+async def restore_deleted(interaction: discord.Interaction, minutes: app_commands.Range[int, 1, 10080] = 10):
+    records = snapshots.deleted(interaction.guild_id, since=time.time() - minutes * 60)
+    if not records:
+        await interaction.response.send_message(f"Nothing was deleted in the last {minutes} minutes.", ephemeral=True)
+        return
+    
+    job = BulkJob(f"Restoring {len(records)} deleted roles and channels", len(records))
+    report = await show_progress(interaction, job)
+    await restorer.restore(interaction.guild, records, job, on_progress=report)
 
 class NukeView(discord.ui.View):
     def __init__(self, channel):
@@ -683,8 +935,14 @@ class NukeView(discord.ui.View):
     @discord.ui.button(label="Confirm Nuke", style=discord.ButtonStyle.danger)
     async def confirm(self, interaction: discord.Interaction, button: discord.ui.Button):
         try:
-            # Create a new channel with the same settings
+            # Create a new channel with the same settings. clone() leaves out the position,
+            # so it comes from a fresh snapshot of the original
+            snapshots.record_channel(self.channel)
+            original = snapshots.get(self.channel.guild.id, self.channel.id)
             new_channel = await self.channel.clone(reason=f"Channel nuked by {interaction.user}")
+            await new_channel.edit(position=original['position'])
+            # A deliberate nuke isn't something for /restore to undo
+            snapshots.forget(self.channel.guild.id, self.channel.id)
             await self.channel.delete()
             await new_channel.send(f"Channel has been nuked by {interaction.user.mention}! 💥")
         except discord.Forbidden:
@@ -705,39 +963,30 @@ async def set_trusted_admin(interaction: discord.Interaction, role: discord.Role
         await interaction.response.send_message("Only the server owner can set the trusted admin role!", ephemeral=True)
         return
     
-    with Session(engine) as session:
-        settings = session.query(GuildSettings).filter_by(guild_id=str(interaction.guild_id)).first()
-        
-        if not settings:
-            settings = GuildSettings(guild_id=str(interaction.guild_id))
-            session.add(settings)
-        
-        settings.trusted_admin_role_id = str(role.id)
-        session.commit()
-        
-        await interaction.response.send_message(f"Set {role.mention} as the trusted admin role.", ephemeral=True)
+    settings_cache.update(await db.update_guild_settings(interaction.guild_id, trusted_admin_role_id=str(role.id)))
+    
+    await interaction.response.send_message(f"Set {role.mention} as the trusted admin role.", ephemeral=True)
 
 @tree.command(name="nuke", description="💣 Completely clear a channel by recreating it")
 @app_commands.checks.has_permissions(administrator=True)
 async def nuke_channel(interaction: discord.Interaction):
     """Nuke the current channel by deleting and recreating it"""
-    with Session(engine) as session:
-        settings = session.query(GuildSettings).filter_by(guild_id=str(interaction.guild_id)).first()
-        
-        if not settings or not settings.trusted_admin_role_id:
-            await interaction.response.send_message(
-                "The trusted admin role has not been set up. Please ask the server owner to set it up using /settrustedadmin",
-                ephemeral=True
-            )
-            return
-        
-        member = interaction.guild.get_member(interaction.user.id)
-        if not any(role.id == int(settings.trusted_admin_role_id) for role in member.roles):
-            await interaction.response.send_message(
-                "You need the trusted admin role to use this command!",
-                ephemeral=True
-            )
-            return
+    settings = await settings_cache.get(interaction.guild_id)
+    
+    if not settings or not settings.trusted_admin_role_id:
+        await interaction.response.send_message(
+            "The trusted admin role has not been set up. Please ask the server owner to set it up using /settrustedadmin",
+            ephemeral=True
+        )
+        return
+    
+    member = interaction.guild.get_member(interaction.user.id)
+    if not any(role.id == int(settings.trusted_admin_role_id) for role in member.roles):
+        await interaction.response.send_message(
+            "You need the trusted admin role to use this command!",
+            ephemeral=True
+        )
+        return
     
     view = NukeView(interaction.channel)
     await interaction.response.send_message(
@@ -751,10 +1000,12 @@ async def nuke_channel(interaction: discord.Interaction):
 
 
 @tree.command(name="remind", description="Set a reminder")
-async def set_reminder(interaction: discord.Interaction, duration: int, *, reminder: str):
+async def set_reminder(interaction: discord.Interaction, duration: app_commands.Range[int, 1, 525600], *, reminder: str):
+    now = time.time()
+    due_at = now + duration * 60
+    reminder_id = await db.add_reminder(interaction.user.id, interaction.guild_id, reminder, due_at, now)
+    reminders.add(reminder_id, due_at)
     await interaction.response.send_message(f"Reminder set for {duration} minutes!", ephemeral=True)
-    await asyncio.sleep(duration * 60)
-    await interaction.user.send(f"⏰ Reminder: {reminder}")
 
 @tree.command(name="avatar", description="Get a user's avatar")
 async def avatar(interaction: discord.Interaction, user: discord.Member = None):
@@ -775,12 +1026,11 @@ async def unban(interaction: discord.Interaction, user_id: str):
         await interaction.guild.unban(user)
         
         # Log the unban if there's a log channel
-        with Session(engine) as session:
-            settings = session.query(GuildSettings).filter_by(guild_id=str(interaction.guild_id)).first()
-            if settings and settings.log_channel_id:
-                log_channel = interaction.guild.get_channel(int(settings.log_channel_id))
-                if log_channel:
-                    await log_channel.send(f"🔓 {interaction.user.mention} unbanned user {user.name} (ID: {user.id})")
+        settings = await settings_cache.get(interaction.guild_id)
+        if settings and settings.log_channel_id:
+            log_channel = interaction.guild.get_channel(int(settings.log_channel_id))
+            if log_channel:
+                await log_channel.send(f"🔓 {interaction.user.mention} unbanned user {user.name} (ID: {user.id})")
         
         await interaction.response.send_message(f"Successfully unbanned {user.name}#{user.discriminator}", ephemeral=True)
     except ValueError:
@@ -801,9 +1051,8 @@ async def invite_link(interaction: discord.Interaction):
 @tree.command(name="kickall", description="Kick all members with a specific role")
 @app_commands.checks.has_permissions(kick_members=True)
 async def kick_all(interaction: discord.Interaction, role: discord.Role):
-    for member in role.members:
-        await member.kick(reason="Kicked by command")
-    await interaction.response.send_message(f"Kicked all members with the role {role.name}.")
+    await run_bulk_command(interaction, f"Kicking members with the role {role.name}", 'kick', list(role.members),
+                           lambda member: member.kick(reason="Kicked by command"))
 
 @tree.command(name="slowmode", description="Set slowmode for a channel")
 @app_commands.checks.has_permissions(manage_channels=True)
@@ -822,9 +1071,18 @@ async def quote_message(interaction: discord.Interaction, message_id: int):
 
 @tree.command(name="weather", description="Get the current weather for a specified location")
 async def weather(interaction: discord.Interaction, location: str):
-    # You would need to integrate with a weather API
-    weather_info = f"Current weather in {location}: Sunny, 25°C."  # Placeholder response
-    await interaction.response.send_message(weather_info)
+    # A cache miss with retries can outlast the 3 seconds an interaction has to respond
+    await interaction.response.defer()
+    # safe='' so a location can't add path segments to the request
+    url = f"{WEATHER_API_URL}/{quote(location, safe='')}"
+    try:
+        # Conditions change slowly, so repeated lookups are served from the cache for 10 minutes
+        data = await http.get_json(url, params={'format': 'j1'}, ttl=600)
+        current = data['current_condition'][0]
+        weather_info = f"Current weather in {location}: {current['weatherDesc'][0]['value']}, {current['temp_C']}°C."
+    except (HTTPError, KeyError, IndexError, TypeError):
+        weather_info = f"Couldn't fetch the weather for {location} at the moment."
+    await interaction.followup.send(weather_info)
 
 @tree.command(name="flip", description="Flip a coin")
 async def flip_coin_alternative(interaction: discord.Interaction):
@@ -868,22 +1126,28 @@ async def help_command(interaction: discord.Interaction):
         "/setlogchannel <channel> - Set a channel for logging anti-nuke actions\n"
         "/checkrecentactions - Check recent actions that triggered anti-nuke\n"
         "/resetrecentactions - Reset the recent actions log\n"
+        "/setnukelimit <action> <count> <seconds> - Set the anti-nuke threshold for an action\n"
         "/setantinuke <enabled> - Enable or disable anti-nuke features\n"
         "/setwelcome <channel> <message> <enabled> - Configure welcome message settings\n"
         "/addfilter <word> - Add a word or phrase to the filter list\n"
         "/removefilter <word> - Remove a word or phrase from the filter list\n"
         "/listfilters - List all filtered words and phrases\n"
         "/togglefilter <enabled> - Enable or disable the word filter\n"
+        "/setspamlimit <messages> <seconds> - Set how many messages per time window count as spam\n"
+        "/pipelinestats - Show message handling latency per stage\n"
+        "/setraidlimit <joins> <seconds> [raise_verification] - Set the join rate that starts raid mode\n"
         "/setranking <enabled> - Enable or disable the ranking system\n"
-        "/leaderboard - Show the server's top 10 most active members\n"
+        "/leaderboard - Show the server's most active members\n"
         "/rank <user> - Show your current level and XP\n"
         "/meme - Get a random meme\n"
         "/flipcoin - Flip a coin\n"
         "/roll - Roll a dice\n"
-        "/stats - Get server statistics\n"
+        "/stats - Get server statistics and activity trends\n"
         "/reactionroles <role> - Set up reaction roles\n"
         "/feedback <text> - Submit feedback or suggestions\n"
-        "/setupvoice - Setup a channel for creating temporary voice channels"
+        "/setupvoice - Setup a channel for creating temporary voice channels\n"
+        "/clear <amount> [user] [bots] [contains] [before] [after] - Delete recent messages, optionally filtered\n"
+        "/restore [minutes] - Rebuild roles and channels deleted in the last few minutes"
     )
 
     await interaction.response.send_message(help_message, ephemeral=True)
@@ -893,7 +1157,7 @@ async def help_command(interaction: discord.Interaction):
 async def voice_limit(interaction: discord.Interaction, limit: int):
     if interaction.user.voice and interaction.user.voice.channel:
         channel = interaction.user.voice.channel
-        if channel.name.startswith("🎮") and channel.name.endswith("'s Channel"):
+        if temp_voice.owner_id(channel.id) == interaction.user.id:
             await channel.edit(user_limit=limit)
             await interaction.response.send_message(f"User limit set to {limit} for {channel.mention}.", ephemeral=True)
         else:
@@ -901,8 +1165,34 @@ async def voice_limit(interaction: discord.Interaction, limit: int):
     else:
         await interaction.response.send_message("You are not in a temporary voice channel.", ephemeral=True)
 
-def main():
+def install_metrics():
+    """Time every event handler, command and SQL statement; call once they are all defined."""
+    instrument_events(bot, metrics)
+    instrument_commands(tree, metrics)
+    instrument_engine(engine, metrics)
+    observe_rate_limits(metrics)
+    pacing = metrics.histogram('bulk_pacing_wait_seconds', 'Time bulk actions waited on their route pacing', ('route',))
+    bulk.on_wait = lambda route, seconds: pacing.observe(seconds, route)
+    stages = metrics.histogram('message_stage_duration_seconds', 'Time spent in each message pipeline stage', ('stage',))
+    for name, histogram in message_pipeline.histograms.items():
+        stages.adopt(histogram, name)
+    metrics.collect('settings_cache_hits_total', 'GuildSettings cache hits', 'counter', lambda: {(): settings_cache.hits})
+    metrics.collect('settings_cache_misses_total', 'GuildSettings cache misses', 'counter', lambda: {(): settings_cache.misses})
+    metrics.collect('settings_cache_entries', 'Guilds held in the GuildSettings cache', 'gauge', lambda: {(): settings_cache.stats()['size']})
+    metrics.collect('join_role_queue_length', 'Members waiting for their join role', 'gauge',
+                    lambda: {(): sum(join_roles.queued(guild.id) for guild in bot.guilds)})
+    metrics.collect('discord_guilds', 'Guilds this process serves', 'gauge', lambda: {(): len(bot.guilds)})
+    metrics.collect('startup_milestone_seconds', 'Seconds from process start to each start-up milestone', 'gauge',
+                    lambda: {(name,): seconds for name, seconds in startup.marks.items()}, ('milestone',))
+    metrics.collect('discord_gateway_latency_seconds', 'Gateway heartbeat latency', 'gauge', lambda: {(): bot.latency})
+
+def prepare_database():
     apply_sqlite_migrations(engine, Base, 'migrations')
+    db.ensure_indexes()
+
+def main():
+    # Shard processes started below share the parent's freshly migrated database
+    migrate = not os.environ.get('MIGRATIONS_APPLIED')
     
     client_id = os.environ.get('CLIENT_ID')
     bot_token = os.environ.get('BOT_TOKEN')
@@ -916,6 +1206,16 @@ def main():
     elif not bot_token:
         print("🚨 Error: BOT_TOKEN is invalid or missing. Please check your Discord Developer Portal for the correct value.")
         return
+    if shard_config.processes > 1:
+        if migrate:
+            prepare_database()
+        db.executor.shutdown(wait=True)
+        return run_shard_processes(shard_config, extra_env={'MIGRATIONS_APPLIED': '1'})
+    if migrate:
+        # Migrations run on the DB executor while the bot logs in; setup_hook waits for them
+        bot.database_ready = db.executor.submit(prepare_database)
+    if metrics_port:
+        install_metrics()
     try:
         oauth_link = generate_oauth_link(client_id)
         print(f"🔗 Click this link to invite your Discord bot to your server 👉 {oauth_link}")
@@ -924,7 +1224,9 @@ def main():
         print("🚨 Error: Invalid BOT_TOKEN. Please check your Discord Developer Portal for the correct value.")
     except Exception as e:
         print(f"🚨 Error: An unexpected error occurred: {str(e)}")
+    finally:
+        db.executor.shutdown(wait=True)
     return
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
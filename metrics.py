@@ -0,0 +1,262 @@
+import asyncio
+import functools
+import inspect
+import logging
+import re
+import threading
+import time
+
+from sqlalchemy import event
+
+from pipeline import LATENCY_BUCKETS, LatencyHistogram
+
+SNOWFLAKE = re.compile(r'/\d{15,}')
+VERB = re.compile(r'\s*(\w+)')
+TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE)\s+["`]?(\w+)', re.IGNORECASE)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _pairs(names, values):
+    return [(name, value) for name, value in zip(names, values)]
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in self.values.items():
+            yield self.name, _pairs(self.labelnames, labels), value
+
+
+class Histogram:
+    """A family of LatencyHistograms, one per label combination."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), bounds=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.bounds = bounds
+        self.children = {}
+
+    def observe(self, seconds, *labels):
+        child = self.children.get(labels)
+        if child is None:
+            child = self.children[labels] = LatencyHistogram(self.bounds)
+        child.observe(seconds)
+
+    def adopt(self, histogram, *labels):
+        """Export a histogram some other component already keeps."""
+        self.children[labels] = histogram
+
+    def samples(self):
+        for labels, child in list(self.children.items()):
+            pairs = _pairs(self.labelnames, labels)
+            cumulative = 0
+            for bound, count in zip(child.bounds + (float('inf'),), child.counts):
+                cumulative += count
+                yield f"{self.name}_bucket", pairs + [('le', '+Inf' if bound == float('inf') else repr(bound))], cumulative
+            yield f"{self.name}_sum", pairs, child.total
+            yield f"{self.name}_count", pairs, child.count
+
+
+class Collected:
+    """Values read from `fn() -> {labels: value}` at scrape time, so the hot path pays nothing."""
+
+    def __init__(self, name, help, kind, fn, labelnames=()):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.fn = fn
+        self.labelnames = labelnames
+
+    def samples(self):
+        for labels, value in self.fn().items():
+            yield self.name, _pairs(self.labelnames, labels), value
+
+
+class MetricsRegistry:
+    """Named metrics rendered in the Prometheus text format, each sample tagged with `const_labels`."""
+
+    def __init__(self, const_labels=None):
+        self.const_labels = list((const_labels or {}).items())
+        self._metrics = {}
+
+    def _get(self, cls, name, *args):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, *args)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._get(Counter, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), bounds=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help, labelnames, bounds)
+
+    def collect(self, name, help, kind, fn, labelnames=()):
+        return self._get(Collected, name, help, kind, fn, labelnames)
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                print(f"🚨 Error: Could not collect metric {metric.name}: {str(e)}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, pairs, value in samples:
+                pairs = self.const_labels + pairs
+                labels = ','.join(f'{key}="{_escape(label)}"' for key, label in pairs)
+                lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+def _timed(fn, histogram, errors, *labels):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        except Exception:
+            errors.inc(*labels)
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - started, *labels)
+    return wrapper
+
+
+def instrument_events(client, registry):
+    """Time every `@client.event` handler registered so far. Call after they are all defined."""
+    durations = registry.histogram('discord_event_duration_seconds', 'Time spent in each event handler', ('event',))
+    errors = registry.counter('discord_event_errors_total', 'Event handlers that raised', ('event',))
+    for name, handler in list(vars(client).items()):
+        if name.startswith('on_') and inspect.iscoroutinefunction(handler):
+            setattr(client, name, _timed(handler, durations, errors, name[3:]))
+
+
+def instrument_commands(tree, registry):
+    """Time every application command's callback; checks that reject a call aren't counted."""
+    durations = registry.histogram('discord_command_duration_seconds', 'Time spent in each slash command', ('command',))
+    errors = registry.counter('discord_command_errors_total', 'Slash commands that raised', ('command',))
+    for command in tree.walk_commands():
+        if hasattr(command, '_callback'):
+            # Commands call their own _callback, so wrapping it covers every invocation
+            command._callback = _timed(command._callback, durations, errors, command.qualified_name)
+
+
+@functools.lru_cache(maxsize=1024)
+def statement_label(statement):
+    """"SELECT user_levels" for a statement, keeping the label set as small as the schema."""
+    verb = VERB.match(statement)
+    if not verb:
+        return 'OTHER'
+    table = TABLE.search(statement)
+    return f"{verb.group(1).upper()} {table.group(1)}" if table else verb.group(1).upper()
+
+
+def instrument_engine(engine, registry):
+    """Time every SQL statement the engine runs, by verb and table.
+
+    Statements run on the DB executor's threads, so observations take a lock.
+    """
+    durations = registry.histogram('db_query_duration_seconds', 'SQL statement execution time', ('statement',))
+    errors = registry.counter('db_query_errors_total', 'SQL statements that failed', ('statement',))
+    lock = threading.Lock()
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['metrics_started'].pop()
+        label = statement_label(statement)
+        with lock:
+            durations.observe(elapsed, label)
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(context):
+        connection = context.connection
+        if connection is not None and connection.info.get('metrics_started'):
+            connection.info['metrics_started'].pop()
+        with lock:
+            errors.inc(statement_label(context.statement or ''))
+
+
+def route_label(method, url):
+    """"DELETE /channels/:id/messages/:id" for a REST call, with snowflakes folded."""
+    path = str(url).split('/api/', 1)[-1]
+    path = '/' + path.split('/', 1)[-1] if path.startswith('v') else path
+    return f"{method} {SNOWFLAKE.sub('/:id', path.split('?', 1)[0])}"
+
+
+class RateLimitObserver(logging.Handler):
+    """Counts discord.py's 429 retries from its `discord.http` warnings.
+
+    discord.py waits out rate limits itself and only reports them through logging, so
+    this is the one place they can be seen.
+    """
+
+    def __init__(self, registry):
+        super().__init__(logging.WARNING)
+        self.waits = registry.histogram('discord_rate_limit_wait_seconds', 'Retry-after of 429s from Discord', ('route',))
+
+    def emit(self, record):
+        message = str(record.msg)
+        args = record.args or ()
+        try:
+            if 'responded with 429' in message and len(args) >= 3:
+                self.waits.observe(float(args[2]), route_label(args[0], args[1]))
+            elif message.startswith('Global rate limit') and args:
+                self.waits.observe(float(args[0]), 'global')
+        except (TypeError, ValueError):
+            pass
+
+
+def observe_rate_limits(registry):
+    logging.getLogger('discord.http').addHandler(RateLimitObserver(registry))
+
+
+async def serve(registry, port, host='127.0.0.1'):
+    """Serve `GET /metrics` until cancelled."""
+
+    async def handle(reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request.split()
+            if len(parts) >= 2 and parts[0] == b'GET' and parts[1].split(b'?', 1)[0] == b'/metrics':
+                status, body = '200 OK', registry.render().encode()
+            else:
+                status, body = '404 Not Found', b'Not found\n'
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    print(f"Serving metrics on http://{host}:{port}/metrics")
+    async with server:
+        await server.serve_forever()
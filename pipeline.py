@@ -0,0 +1,111 @@
+import bisect
+import time
+
+# Histogram bucket upper bounds in seconds, from 10us (in-memory stages) to 10s (slow REST calls)
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class LatencyHistogram:
+    """Counts of observed durations per bucket, cheap enough to update on every message."""
+
+    __slots__ = ('bounds', 'counts', 'count', 'total')
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (inf past the last bucket)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+        }
+
+
+class MessageContext:
+    """What the stages share about one message, worked out once."""
+
+    __slots__ = ('message', 'guild_id', 'author_id', 'settings', 'received', '_content_lower')
+
+    def __init__(self, message, settings):
+        self.message = message
+        self.guild_id = message.guild.id
+        self.author_id = message.author.id
+        self.settings = settings
+        self.received = time.monotonic()
+        self._content_lower = None
+
+    @property
+    def content_lower(self):
+        if self._content_lower is None:
+            self._content_lower = self.message.content.lower()
+        return self._content_lower
+
+
+class MessagePipeline:
+    """Runs each guild message through ordered stages, timing every stage.
+
+    `await prepare(message)` builds the MessageContext, or returns None to skip the
+    message. A stage is `await stage(ctx)`; returning True stops the message there (it
+    was handled, e.g. deleted or its author muted). A stage that raises is logged and
+    the rest still run, as when they were separate event handlers.
+    """
+
+    def __init__(self, prepare):
+        self.prepare = prepare
+        self.stages = []
+        self.histograms = {'total': LatencyHistogram()}
+        self.stopped = {}
+
+    def stage(self, name):
+        def register(fn):
+            self.stages.append((name, fn))
+            self.histograms[name] = LatencyHistogram()
+            self.stopped[name] = 0
+            return fn
+        return register
+
+    async def dispatch(self, message):
+        started = time.perf_counter()
+        ctx = await self.prepare(message)
+        if ctx is None:
+            return None
+        for name, fn in self.stages:
+            stage_started = time.perf_counter()
+            try:
+                stop = await fn(ctx)
+            except Exception as e:
+                print(f"🚨 Error: Message stage {name} failed: {str(e)}")
+                stop = False
+            self.histograms[name].observe(time.perf_counter() - stage_started)
+            if stop:
+                self.stopped[name] += 1
+                break
+        self.histograms['total'].observe(time.perf_counter() - started)
+        return ctx
+
+    def stats(self):
+        return {
+            name: dict(histogram.summary(), stopped=self.stopped.get(name, 0))
+            for name, histogram in self.histograms.items()
+        }
@@ -0,0 +1,148 @@
+import asyncio
+import time
+from datetime import timedelta
+
+import discord
+
+from bulk import BulkJob, safe_progress
+
+# Discord bulk-deletes at most 100 messages per call, and only ones younger than 14 days
+BULK_DELETE_MAX = 100
+BULK_DELETE_MAX_AGE = timedelta(days=14)
+# Leeway so a message can't age out between being read and its batch being sent
+BULK_DELETE_MARGIN = timedelta(minutes=5)
+
+
+class PurgeFilter:
+    """Which messages a purge deletes. Every criterion given must match."""
+
+    def __init__(self, user_id=None, bots_only=False, contains=None, before=None, after=None):
+        self.user_id = user_id
+        self.bots_only = bots_only
+        self.contains = contains.lower() if contains else None
+        self.before = before
+        self.after = after
+
+    @property
+    def narrows(self):
+        """Whether some scanned messages may be skipped, so more than `amount` need scanning."""
+        return self.user_id is not None or self.bots_only or self.contains is not None
+
+    def matches(self, message):
+        if self.user_id is not None and message.author.id != self.user_id:
+            return False
+        if self.bots_only and not message.author.bot:
+            return False
+        if self.contains is not None and self.contains not in message.content.lower():
+            return False
+        return True
+
+
+class PurgeJob(BulkJob):
+    """BulkJob progress plus how much history was read and how messages were deleted."""
+
+    def __init__(self, description, total):
+        super().__init__(description, total)
+        self.scanned = 0
+        self.bulk_deleted = 0
+        self.single_deleted = 0
+
+    def summary(self):
+        elapsed = time.monotonic() - self.started
+        rate = self.done / elapsed if elapsed else 0.0
+        return f"{super().summary()}, {self.scanned} scanned, {rate:.0f} msg/s"
+
+
+class PurgeEngine:
+    """Deletes up to `job.total` matching messages from a channel, newest first.
+
+    History is streamed page by page. Matching messages younger than 14 days are
+    deleted 100 at a time, with each bulk delete running while the next page is read.
+    Messages older than that, which Discord won't bulk delete, are queued and deleted
+    one at a time through the bulk scheduler's message_delete bucket after the scan.
+    Progress goes to `await on_progress(job)` every `progress_interval` seconds.
+    """
+
+    def __init__(self, bulk, scan_factor=10, max_scan=50000):
+        self.bulk = bulk
+        self.scan_factor = scan_factor
+        self.max_scan = max_scan
+
+    def scan_limit(self, amount, purge_filter):
+        if not purge_filter.narrows:
+            return amount
+        return max(amount, min(amount * self.scan_factor, self.max_scan))
+
+    async def _bulk_delete(self, channel, batch, job, fallback):
+        await self.bulk.bucket('message_bulk_delete', channel.id).acquire()
+        try:
+            await channel.delete_messages(batch)
+        except discord.NotFound:
+            # Someone else deleted one of them first; the rest still need deleting
+            fallback.extend(batch)
+            return
+        except discord.HTTPException:
+            job.failed += len(batch)
+            return
+        job.done += len(batch)
+        job.bulk_deleted += len(batch)
+
+    async def run(self, channel, job, purge_filter, on_progress=None, progress_interval=2.0):
+        cutoff = discord.utils.utcnow() - BULK_DELETE_MAX_AGE + BULK_DELETE_MARGIN
+        before = discord.Object(id=purge_filter.before) if purge_filter.before else None
+        after = discord.Object(id=purge_filter.after) if purge_filter.after else None
+        old, batch, matched = [], [], 0
+        deleting = None
+        last_report = time.monotonic()
+        on_progress = safe_progress(on_progress)
+
+        async def send(batch):
+            nonlocal deleting
+            if deleting is not None:
+                await deleting
+            deleting = asyncio.create_task(self._bulk_delete(channel, batch, job, old))
+
+        try:
+            async for message in channel.history(limit=self.scan_limit(job.total, purge_filter),
+                                                 before=before, after=after, oldest_first=False):
+                if job.cancelled:
+                    break
+                job.scanned += 1
+                if not purge_filter.matches(message):
+                    continue
+                matched += 1
+                if message.created_at > cutoff:
+                    batch.append(message)
+                    if len(batch) == BULK_DELETE_MAX:
+                        await send(batch)
+                        batch = []
+                else:
+                    old.append(message)
+                if matched >= job.total:
+                    break
+                if on_progress and time.monotonic() - last_report >= progress_interval:
+                    last_report = time.monotonic()
+                    await on_progress(job)
+            if batch and not job.cancelled:
+                await send(batch)
+            if deleting is not None:
+                await deleting
+        except asyncio.CancelledError:
+            job.cancel()
+            if deleting is not None:
+                deleting.cancel()
+            job.finished = True
+            raise
+
+        async def delete_one(message):
+            await message.delete()
+            job.single_deleted += 1
+
+        if old and not job.cancelled:
+            # bulk.run reports progress, counts done/failed and marks the job finished
+            return await self.bulk.run(job, 'message_delete', old, delete_one, scope=channel.id,
+                                       concurrency=1, on_progress=on_progress, progress_interval=progress_interval)
+        job.finished = True
+        if on_progress:
+            await on_progress(job)
+        return job
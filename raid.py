@@ -0,0 +1,154 @@
+import asyncio
+import time
+from collections import deque
+
+import discord
+
+from rate_limit import SlidingWindowCounter
+
+
+class RaidState:
+    __slots__ = ('started', 'last_busy', 'joined', 'pending', 'total', 'context', 'task')
+
+    def __init__(self, now):
+        self.started = now
+        self.last_busy = now
+        self.joined = []
+        self.pending = 0
+        self.total = 0
+        self.context = None
+        self.task = None
+
+
+class RaidGuard:
+    """Detects join bursts and coalesces welcomes while a guild is being raided.
+
+    A guild enters raid mode when more than `limit` members join within `window` seconds
+    and leaves it once the rate has stayed under that for `cooldown` seconds. While it
+    lasts, joins are only counted; one task per raided guild posts them as a summary
+    every `summary_interval` seconds.
+
+    Callbacks: `await on_start(guild)`, whose return value is handed back to
+    `await on_end(guild, context, total)`, and `await on_summary(guild, mentions, count)`.
+    """
+
+    def __init__(self, on_start, on_summary, on_end, summary_interval=10, cooldown=120, max_mentions=40):
+        self.on_start = on_start
+        self.on_summary = on_summary
+        self.on_end = on_end
+        self.summary_interval = summary_interval
+        self.cooldown = cooldown
+        self.max_mentions = max_mentions
+        # /setraidlimit allows windows of up to an hour, so joins are kept that long
+        self._joins = SlidingWindowCounter(idle_ttl=3600)
+        self._raids = {}
+
+    def is_active(self, guild_id):
+        return guild_id in self._raids
+
+    async def run_sweeper(self, interval=60):
+        """Forget the join counts of guilds nobody has joined for an hour."""
+        await self._joins.run_sweeper(interval)
+
+    def record_join(self, guild, member, limit, window, now=None):
+        """Count a join. Returns True if the guild is in raid mode and the member's
+        welcome will go out in the next summary instead."""
+        now = time.monotonic() if now is None else now
+        busy = self._joins.hit(guild.id, 'joins', limit, window, now=now) > limit
+        state = self._raids.get(guild.id)
+        if state is None:
+            if not busy:
+                return False
+            state = self._raids[guild.id] = RaidState(now)
+            state.task = asyncio.create_task(self._run(guild, state))
+        if busy:
+            state.last_busy = now
+        if len(state.joined) < self.max_mentions:
+            state.joined.append(member.mention)
+        state.pending += 1
+        state.total += 1
+        return True
+
+    async def _flush(self, guild, state):
+        if state.pending:
+            mentions, count = state.joined, state.pending
+            state.joined, state.pending = [], 0
+            await self.on_summary(guild, mentions, count)
+
+    async def _run(self, guild, state):
+        try:
+            state.context = await self.on_start(guild)
+            while time.monotonic() - state.last_busy < self.cooldown:
+                await asyncio.sleep(self.summary_interval)
+                try:
+                    await self._flush(guild, state)
+                except Exception as e:
+                    print(f"🚨 Error: Could not post the join summary for guild {guild.id}: {str(e)}")
+        finally:
+            del self._raids[guild.id]
+        await self._flush(guild, state)
+        await self.on_end(guild, state.context, state.total)
+
+    def stats(self):
+        return {"raided_guilds": len(self._raids), **self._joins.stats()}
+
+
+class JoinRoleAssigner:
+    """Gives new members a join role from a paced per-guild queue.
+
+    The role is looked up by name once per guild and then by ID; call `invalidate` when
+    a guild's roles change. Each guild's queue is drained by a worker that takes tokens
+    from the bulk scheduler's member_roles bucket, so a join burst turns into a steady
+    trickle of role edits instead of a spike of 429s.
+    """
+
+    def __init__(self, bulk, role_name="New Member"):
+        self.bulk = bulk
+        self.role_name = role_name
+        self._role_ids = {}
+        self._queues = {}
+        self._workers = {}
+
+    def role_for(self, guild):
+        if guild.id not in self._role_ids:
+            role = discord.utils.get(guild.roles, name=self.role_name)
+            self._role_ids[guild.id] = role.id if role else None
+        role_id = self._role_ids[guild.id]
+        return guild.get_role(role_id) if role_id is not None else None
+
+    def invalidate(self, guild_id):
+        self._role_ids.pop(guild_id, None)
+
+    def queued(self, guild_id):
+        return len(self._queues.get(guild_id, ()))
+
+    def enqueue(self, member):
+        guild = member.guild
+        if self.role_for(guild) is None:
+            return False
+        self._queues.setdefault(guild.id, deque()).append(member)
+        if guild.id not in self._workers:
+            self._workers[guild.id] = asyncio.create_task(self._drain(guild))
+        return True
+
+    async def _drain(self, guild):
+        queue = self._queues[guild.id]
+        bucket = self.bulk.bucket('member_roles', guild.id)
+        try:
+            while queue:
+                role = self.role_for(guild)
+                if role is None:
+                    queue.clear()
+                    break
+                member = queue.popleft()
+                await bucket.acquire()
+                try:
+                    await member.add_roles(role, reason="Join role")
+                except discord.NotFound:
+                    pass  # Left before their turn
+                except discord.HTTPException as e:
+                    print(f"🚨 Error: Could not give {member.id} the join role in guild {guild.id}: {str(e)}")
+        finally:
+            del self._workers[guild.id]
+            if not queue:
+                self._queues.pop(guild.id, None)
@@ -0,0 +1,78 @@
+import asyncio
+import sys
+import time
+from collections import deque
+
+_FLOAT_SIZE = sys.getsizeof(0.0)
+
+
+class SlidingWindowCounter:
+    """Recent hit timestamps per (scope, key), each kept in a fixed-size ring buffer.
+
+    A buffer holds at most `limit + 1` monotonic timestamps, which is all that is needed
+    to tell whether more than `limit` hits fell inside the window, so every update is O(1).
+    """
+
+    def __init__(self, idle_ttl=300):
+        self.idle_ttl = idle_ttl
+        self._scopes = {}
+
+    def hit(self, scope, key, limit, window, now=None):
+        """Record a hit and return how many hits (capped at limit + 1) are inside the window."""
+        now = time.monotonic() if now is None else now
+        buckets = self._scopes.get(scope)
+        if buckets is None:
+            buckets = self._scopes[scope] = {}
+
+        timestamps = buckets.get(key)
+        if timestamps is None or timestamps.maxlen != limit + 1:
+            timestamps = buckets[key] = deque(timestamps or (), maxlen=limit + 1)
+
+        timestamps.append(now)
+        while now - timestamps[0] >= window:
+            timestamps.popleft()
+        return len(timestamps)
+
+    def count(self, scope, key, window, now=None):
+        """Hits for a key inside the window, without recording one."""
+        now = time.monotonic() if now is None else now
+        timestamps = self._scopes.get(scope, {}).get(key, ())
+        return sum(1 for timestamp in timestamps if now - timestamp < window)
+
+    def reset(self, scope, key=None):
+        if key is None:
+            self._scopes.pop(scope, None)
+            return
+        buckets = self._scopes.get(scope)
+        if buckets is not None:
+            buckets.pop(key, None)
+            if not buckets:
+                del self._scopes[scope]
+
+    def sweep(self, now=None):
+        """Evict keys idle for longer than `idle_ttl` and scopes left empty. Returns keys evicted."""
+        now = time.monotonic() if now is None else now
+        evicted = 0
+        for scope in list(self._scopes):
+            buckets = self._scopes[scope]
+            for key in [key for key, timestamps in buckets.items() if now - timestamps[-1] >= self.idle_ttl]:
+                del buckets[key]
+                evicted += 1
+            if not buckets:
+                del self._scopes[scope]
+        return evicted
+
+    async def run_sweeper(self, interval=60):
+        while True:
+            await asyncio.sleep(interval)
+            self.sweep()
+
+    def stats(self):
+        tracked_keys = sum(len(buckets) for buckets in self._scopes.values())
+        memory_bytes = sys.getsizeof(self._scopes) + sum(
+            sys.getsizeof(buckets) + sum(
+                sys.getsizeof(timestamps) + len(timestamps) * _FLOAT_SIZE for timestamps in buckets.values()
+            )
+            for buckets in self._scopes.values()
+        )
+        return {"scopes": len(self._scopes), "tracked_keys": tracked_keys, "memory_bytes": memory_bytes}
@@ -0,0 +1,91 @@
+import asyncio
+import heapq
+import time
+
+
+class ReminderScheduler:
+    """Delivers stored reminders from one task driven by a min-heap of due times.
+
+    Only (due_at, reminder_id) pairs are kept in memory; the text lives in the DB and is
+    fetched when a batch falls due, so each pending reminder costs one small tuple. The
+    task sleeps until the earliest deadline and is woken early only when a reminder is
+    added ahead of it.
+
+    `await loader()` returns every pending reminder as (reminder_id, due_at) pairs,
+    `await fetcher(ids)` the full rows for a batch, `await deliver(rows)` sends them and
+    `await deleter(ids)` removes delivered reminders. Due times are Unix timestamps so
+    they survive restarts.
+    """
+
+    def __init__(self, loader, fetcher, deliver, deleter, batch_size=100, max_sleep=300):
+        self.loader = loader
+        self.fetcher = fetcher
+        self.deliver = deliver
+        self.deleter = deleter
+        self.batch_size = batch_size
+        # Re-check the clock at least this often in case the wall clock jumps
+        self.max_sleep = max_sleep
+        self.delivered = 0
+        self._heap = []
+        self._wakeup = asyncio.Event()
+
+    def __len__(self):
+        return len(self._heap)
+
+    async def load_all(self):
+        rows = await self.loader()
+        # Reminders added while the query ran are already in the heap
+        scheduled = {reminder_id for _, reminder_id in self._heap}
+        self._heap.extend((due_at, reminder_id) for reminder_id, due_at in rows if reminder_id not in scheduled)
+        heapq.heapify(self._heap)
+        self._wakeup.set()
+        return len(self._heap)
+
+    def add(self, reminder_id, due_at):
+        """Schedule a reminder that has already been saved to the DB."""
+        heapq.heappush(self._heap, (due_at, reminder_id))
+        if self._heap[0][1] == reminder_id:
+            self._wakeup.set()
+
+    def next_due(self):
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now=None):
+        """Remove and return the ids of up to `batch_size` reminders that are due."""
+        now = time.time() if now is None else now
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+            due.append(heapq.heappop(self._heap)[1])
+        return due
+
+    async def _sleep_until_due(self):
+        self._wakeup.clear()
+        delay = self.max_sleep if not self._heap else min(self.max_sleep, self._heap[0][0] - time.time())
+        if delay <= 0:
+            return
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self):
+        loaded = await self.load_all()
+        print(f'Loaded {loaded} pending reminders')
+        while True:
+            await self._sleep_until_due()
+            while True:
+                ids = self.pop_due()
+                if not ids:
+                    break
+                try:
+                    rows = await self.fetcher(ids)
+                    await self.deliver(rows)
+                    await self.deleter(ids)
+                    self.delivered += len(rows)
+                except Exception as e:
+                    # Put the batch back and retry it after a pause rather than dropping it
+                    print(f"🚨 Error: Could not deliver {len(ids)} reminders: {str(e)}")
+                    retry_at = time.time() + 60
+                    for reminder_id in ids:
+                        heapq.heappush(self._heap, (retry_at, reminder_id))
+                    break
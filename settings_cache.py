@@ -0,0 +1,136 @@
+import asyncio
+from collections import OrderedDict
+
+# Marker stored for guilds that have no settings row, so they don't hit the DB either
+_NO_SETTINGS = object()
+
+
+class GuildSettingsCache:
+    """Process-wide LRU cache of GuildSettings, kept current by the commands that write them.
+
+    `loader(guild_id)` and `bulk_loader(guild_ids, limit)` are awaitables returning
+    settings snapshots (see db.snapshot_settings).
+    """
+
+    def __init__(self, loader, bulk_loader, max_size=10000):
+        self.loader = loader
+        self.bulk_loader = bulk_loader
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._loading = {}
+        # Bumped by every update() and invalidate(), so a bulk load can tell which of the rows
+        # it read were overtaken while it ran. Changes are only remembered while a load runs
+        self._version = 0
+        self._changed = {}
+        self._cleared = 0
+        self._running_loads = []
+
+    async def get(self, guild_id):
+        guild_id = str(guild_id)
+        entry = self._entries.get(guild_id)
+        if entry is not None:
+            self._entries.move_to_end(guild_id)
+            self.hits += 1
+            return None if entry is _NO_SETTINGS else entry
+
+        self.misses += 1
+        # Concurrent misses for the same guild share one DB load
+        task = self._loading.get(guild_id)
+        if task is not None:
+            return await asyncio.shield(task)
+
+        task = self._loading[guild_id] = asyncio.ensure_future(self.loader(guild_id))
+        try:
+            snapshot = await asyncio.shield(task)
+        finally:
+            # update() or invalidate() while loading drops the marker; keep the newer state then
+            owner = self._loading.get(guild_id) is task
+            if owner:
+                del self._loading[guild_id]
+        if owner:
+            self._store(guild_id, snapshot or _NO_SETTINGS)
+        return snapshot
+
+    def update(self, snapshot):
+        """Write-through after a settings row has been committed."""
+        guild_id = str(snapshot.guild_id)
+        self._loading.pop(guild_id, None)
+        self._mark_changed(guild_id)
+        self._store(guild_id, snapshot)
+        return snapshot
+
+    def invalidate(self, guild_id=None):
+        if guild_id is None:
+            self._entries.clear()
+            self._loading.clear()
+            self._version += 1
+            self._cleared = self._version
+        else:
+            self._entries.pop(str(guild_id), None)
+            self._loading.pop(str(guild_id), None)
+            self._mark_changed(str(guild_id))
+
+    async def load_all(self, guild_ids=None):
+        """Bulk-load settings rows, optionally limited to the given guilds.
+
+        Guilds updated or invalidated while the query ran keep their newer state.
+        """
+        if guild_ids is not None:
+            guild_ids = [str(guild_id) for guild_id in guild_ids][:self.max_size]
+        started = self._version
+        self._running_loads.append(started)
+        try:
+            snapshots = await self.bulk_loader(guild_ids, self.max_size)
+            return self._store_loaded(snapshots, guild_ids, started)
+        finally:
+            self._running_loads.remove(started)
+            self._forget_changes()
+
+    def _store_loaded(self, snapshots, guild_ids, started):
+        if self._cleared > started:
+            return 0
+
+        stored = 0
+        for snapshot in snapshots:
+            guild_id = str(snapshot.guild_id)
+            if self._changed.get(guild_id, 0) <= started:
+                self._store(guild_id, snapshot)
+                stored += 1
+        # Guilds we are in but have no row yet are known-empty
+        if guild_ids is not None:
+            for guild_id in guild_ids:
+                if guild_id not in self._entries and self._changed.get(guild_id, 0) <= started:
+                    self._store(guild_id, _NO_SETTINGS)
+        return stored
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+    def _mark_changed(self, guild_id):
+        self._version += 1
+        if self._running_loads:
+            self._changed[guild_id] = self._version
+
+    def _forget_changes(self):
+        """Drop changes no running load started before."""
+        if not self._running_loads:
+            self._changed.clear()
+            return
+        oldest = min(self._running_loads)
+        for guild_id in [guild_id for guild_id, version in self._changed.items() if version <= oldest]:
+            del self._changed[guild_id]
+
+    def _store(self, guild_id, entry):
+        self._entries[guild_id] = entry
+        self._entries.move_to_end(guild_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
@@ -0,0 +1,150 @@
+import asyncio
+import inspect
+import os
+import subprocess
+import sys
+
+
+def shard_for(guild_id, shard_count):
+    """The shard Discord routes a guild's events to."""
+    return (int(guild_id) >> 22) % shard_count
+
+
+def parse_shard_ids(text):
+    """Parse "0-3,6,8-9" into a sorted list of shard IDs."""
+    shard_ids = set()
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        shard_ids.update(range(int(first), int(last or first) + 1))
+    return sorted(shard_ids)
+
+
+class ShardConfig:
+    """How this deployment is sharded, read from the environment by `from_env`.
+
+    SHARD_COUNT      total shards across every process; "auto" uses Discord's recommendation
+    SHARD_IDS        shards this process owns, e.g. "0-3" (default: all of them)
+    SHARD_PROCESSES  split the shards over this many processes, each with its own gateway
+                     connections and in-memory state
+
+    With none of them set the bot runs as a single unsharded client.
+    """
+
+    def __init__(self, shard_count=None, shard_ids=None, processes=1, auto=False):
+        self.shard_count = shard_count
+        self.shard_ids = shard_ids
+        self.processes = processes
+        self.auto = auto
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        count = environ.get('SHARD_COUNT', '').strip().lower()
+        shard_ids = environ.get('SHARD_IDS', '').strip()
+        processes = int(environ.get('SHARD_PROCESSES', 1))
+        if count in ('', '0') and not shard_ids and processes <= 1:
+            return cls()
+        if count in ('', 'auto'):
+            if processes > 1 or shard_ids:
+                raise ValueError("SHARD_COUNT must be set when using SHARD_IDS or SHARD_PROCESSES")
+            return cls(auto=True)
+        shard_count = int(count)
+        ids = parse_shard_ids(shard_ids) if shard_ids else list(range(shard_count))
+        if not ids or ids[-1] >= shard_count:
+            raise ValueError(f"SHARD_IDS {shard_ids!r} doesn't fit SHARD_COUNT {shard_count}")
+        return cls(shard_count, ids, max(1, min(processes, len(ids))))
+
+    @property
+    def sharded(self):
+        return self.auto or self.shard_count is not None
+
+    def client_kwargs(self):
+        """Keyword arguments for the client: none unless sharding with a fixed shard count."""
+        if self.shard_count is None:
+            return {}
+        return {'shard_count': self.shard_count, 'shard_ids': self.shard_ids}
+
+    def process_ranges(self):
+        """This process's shards split into `processes` contiguous ranges."""
+        size, extra = divmod(len(self.shard_ids), self.processes)
+        ranges, start = [], 0
+        for index in range(self.processes):
+            end = start + size + (1 if index < extra else 0)
+            ranges.append(self.shard_ids[start:end])
+            start = end
+        return ranges
+
+    def owns_guild(self, guild_id):
+        """Whether this process handles a guild; guild-less work (DMs) belongs to shard 0."""
+        if self.shard_count is None:
+            return True
+        if guild_id is None:
+            return self.is_primary()
+        return shard_for(guild_id, self.shard_count) in self.shard_ids
+
+    def is_primary(self):
+        """Whether this process does the deployment-wide work, such as syncing commands."""
+        return not self.shard_ids or self.shard_ids[0] == 0
+
+
+def run_shard_processes(config, argv=None, extra_env=None):
+    """Start one child process per shard range with the same command line and wait for them.
+
+    Returns the first non-zero exit code, if any. Stopping the parent stops the children.
+    """
+    argv = argv or [sys.executable] + sys.argv
+    children = []
+    for shard_ids in config.process_ranges():
+        env = dict(os.environ, SHARD_COUNT=str(config.shard_count),
+                   SHARD_IDS=','.join(map(str, shard_ids)), SHARD_PROCESSES='1', **(extra_env or {}))
+        print(f"Starting shards {shard_ids[0]}-{shard_ids[-1]} of {config.shard_count}")
+        children.append(subprocess.Popen(argv, env=env))
+    try:
+        codes = [child.wait() for child in children]
+    except KeyboardInterrupt:
+        for child in children:
+            child.terminate()
+        codes = [child.wait() for child in children]
+    return next((code for code in codes if code), 0)
+
+
+class ShardedState:
+    """Per-guild state split into one store per shard.
+
+    `factory()` builds a shard's store the first time one of its guilds is seen, and
+    `shard_count()` is read at that point, since an auto-sharded client only knows its
+    shard count once it has connected. The sweeper covers every partition.
+    """
+
+    def __init__(self, factory, shard_count):
+        self.factory = factory
+        self.shard_count = shard_count
+        self._count = None
+        self._partitions = {}
+
+    def for_shard(self, shard_id):
+        store = self._partitions.get(shard_id)
+        if store is None:
+            store = self._partitions[shard_id] = self.factory()
+        return store
+
+    def for_guild(self, guild_id):
+        if self._count is None:
+            self._count = self.shard_count() or 1
+        return self.for_shard(shard_for(guild_id, self._count))
+
+    def partitions(self):
+        return dict(self._partitions)
+
+    async def run_sweeper(self, interval=60):
+        while True:
+            await asyncio.sleep(interval)
+            for store in list(self._partitions.values()):
+                swept = store.sweep()
+                if inspect.isawaitable(swept):
+                    await swept
+
+    def stats(self):
+        return {shard_id: store.stats() for shard_id, store in sorted(self._partitions.items())}
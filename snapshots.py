@@ -0,0 +1,353 @@
+import asyncio
+import json
+import time
+
+import discord
+
+from bulk import safe_progress
+
+ROLE = 'role'
+CHANNEL = 'channel'
+
+
+def encode(record):
+    return json.dumps(record, separators=(',', ':'), sort_keys=True)
+
+
+def members_by_role(guild):
+    """Member IDs per role ID in one pass over the members; Role.members rescans them per role."""
+    members = {}
+    for member in guild.members:
+        for role in member.roles:
+            members.setdefault(role.id, []).append(member.id)
+    return members
+
+
+def role_record(role, member_ids):
+    return {
+        'name': role.name,
+        'permissions': role.permissions.value,
+        'colour': role.colour.value,
+        'hoist': role.hoist,
+        'mentionable': role.mentionable,
+        'position': role.position,
+        'members': sorted(member_ids),
+    }
+
+
+def channel_record(channel):
+    overwrites = []
+    for target, overwrite in channel.overwrites.items():
+        allow, deny = overwrite.pair()
+        overwrites.append([target.id, ROLE if isinstance(target, discord.Role) else 'member', allow.value, deny.value])
+    record = {
+        'name': channel.name,
+        'type': str(channel.type),
+        'category': channel.category_id,
+        'position': channel.position,
+        'overwrites': sorted(overwrites),
+    }
+    for attribute in ('topic', 'slowmode_delay', 'nsfw', 'bitrate', 'user_limit'):
+        value = getattr(channel, attribute, None)
+        if value is not None:
+            record[attribute] = value
+    return record
+
+
+def snapshottable(role):
+    # @everyone always exists and managed (bot and integration) roles can't be created by hand
+    return not role.is_default() and not role.managed
+
+
+class SnapshotStore:
+    """The last known state of every role and channel, kept after deletion for restores.
+
+    Each object is one compact JSON record. Events update single records (`record_*`,
+    `mark_deleted`); `capture` diffs a whole guild against its records to catch what
+    events missed, such as members gaining or losing roles. A deleted object keeps its
+    record, stamped with `deleted_at`, for `retention` seconds. Changes are written
+    behind through `await writer(rows, removed)`, with `rows` as (guild_id, object_id,
+    kind, data, deleted_at) and `removed` as (guild_id, object_id). Channels for which
+    `skip_channel(channel_id)` is true, such as the bot's own temporary ones, are never kept.
+    """
+
+    def __init__(self, loader, writer, retention=7 * 86400, skip_channel=None):
+        self.loader = loader
+        self.writer = writer
+        self.retention = retention
+        self.skip_channel = skip_channel or (lambda channel_id: False)
+        self._guilds = {}
+        self._dirty = set()
+        self._loaded = False
+
+    async def load_all(self):
+        """Load every stored record once; later calls (reconnects) keep what is in memory."""
+        if self._loaded:
+            return 0
+        rows = await self.loader()
+        for guild_id, object_id, kind, data, deleted_at in rows:
+            self._guilds.setdefault(guild_id, {})[object_id] = [kind, data, deleted_at]
+        self._loaded = True
+        return len(rows)
+
+    def _set(self, guild_id, object_id, kind, data, deleted_at=None):
+        guild_id, object_id = str(guild_id), str(object_id)
+        entry = self._guilds.setdefault(guild_id, {}).get(object_id)
+        if entry is not None and entry[1] == data and entry[2] == deleted_at:
+            return False
+        self._guilds[guild_id][object_id] = [kind, data, deleted_at]
+        self._dirty.add((guild_id, object_id))
+        return True
+
+    def record_role(self, role):
+        if snapshottable(role):
+            self._set(role.guild.id, role.id, ROLE, encode(role_record(role, [member.id for member in role.members])))
+
+    def record_channel(self, channel):
+        if self.skip_channel(channel.id):
+            return
+        self._set(channel.guild.id, channel.id, CHANNEL, encode(channel_record(channel)))
+
+    def mark_deleted(self, guild_id, object_id, now=None):
+        entry = self._guilds.get(str(guild_id), {}).get(str(object_id))
+        if entry is not None and entry[0] == CHANNEL and self.skip_channel(int(object_id)):
+            self.forget(guild_id, object_id)
+        elif entry is not None and entry[2] is None:
+            self._set(guild_id, object_id, entry[0], entry[1], time.time() if now is None else now)
+
+    def forget(self, guild_id, object_id):
+        """Drop an object's record, e.g. once it has been restored under a new ID."""
+        if self._guilds.get(str(guild_id), {}).pop(str(object_id), None) is not None:
+            self._dirty.add((str(guild_id), str(object_id)))
+
+    def get(self, guild_id, object_id):
+        entry = self._guilds.get(str(guild_id), {}).get(str(object_id))
+        return json.loads(entry[1]) if entry else None
+
+    def capture(self, guild, now=None):
+        """Bring a guild's records in line with its live roles and channels.
+
+        Returns (changed, deleted): records written and objects found missing.
+        """
+        now = time.time() if now is None else now
+        members = members_by_role(guild)
+        live = {}
+        for role in guild.roles:
+            if snapshottable(role):
+                live[str(role.id)] = (ROLE, encode(role_record(role, members.get(role.id, ()))))
+        for channel in guild.channels:
+            if self.skip_channel(channel.id):
+                self.forget(guild.id, channel.id)
+            else:
+                live[str(channel.id)] = (CHANNEL, encode(channel_record(channel)))
+
+        changed = sum(1 for object_id, (kind, data) in live.items() if self._set(guild.id, object_id, kind, data))
+        deleted = 0
+        for object_id, (kind, data, deleted_at) in list(self._guilds.get(str(guild.id), {}).items()):
+            if object_id not in live and deleted_at is None:
+                self._set(guild.id, object_id, kind, data, now)
+                deleted += 1
+        return changed, deleted
+
+    def deleted(self, guild_id, since):
+        """Records of objects deleted at or after `since`, as (object_id, kind, record)."""
+        return [
+            (int(object_id), kind, json.loads(data))
+            for object_id, (kind, data, deleted_at) in self._guilds.get(str(guild_id), {}).items()
+            if deleted_at is not None and deleted_at >= since
+        ]
+
+    def prune(self, now=None):
+        """Forget objects deleted more than `retention` seconds ago. Returns how many."""
+        cutoff = (time.time() if now is None else now) - self.retention
+        expired = [
+            (guild_id, object_id)
+            for guild_id, entries in self._guilds.items()
+            for object_id, (_, _, deleted_at) in entries.items()
+            if deleted_at is not None and deleted_at < cutoff
+        ]
+        for guild_id, object_id in expired:
+            self.forget(guild_id, object_id)
+        return len(expired)
+
+    def drain(self):
+        rows, removed = [], []
+        for guild_id, object_id in self._dirty:
+            entry = self._guilds.get(guild_id, {}).get(object_id)
+            if entry is None:
+                removed.append((guild_id, object_id))
+            else:
+                rows.append((guild_id, object_id, *entry))
+        self._dirty.clear()
+        return rows, removed
+
+    async def flush(self):
+        rows, removed = self.drain()
+        if not rows and not removed:
+            return 0
+        try:
+            await self.writer(rows, removed)
+        except Exception:
+            # Retry with whatever the records hold by then
+            self._dirty.update((row[0], row[1]) for row in rows)
+            self._dirty.update(removed)
+            raise
+        return len(rows) + len(removed)
+
+    async def run(self, guilds, interval=5, refresh_interval=900, initial_delay=0):
+        """Write changes every `interval` seconds and re-capture `guilds()` every `refresh_interval`.
+
+        The first capture waits `initial_delay` seconds; events are recorded meanwhile.
+        """
+        last_refresh = time.monotonic() - refresh_interval + initial_delay
+        while True:
+            if time.monotonic() - last_refresh >= refresh_interval:
+                last_refresh = time.monotonic()
+                for guild in list(guilds()):
+                    self.capture(guild)
+                    await asyncio.sleep(0)  # Let events through between large guilds
+                self.prune()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"🚨 Error: Failed to write role and channel snapshots: {str(e)}")
+            await asyncio.sleep(interval)
+
+    def stats(self):
+        records = sum(len(entries) for entries in self._guilds.values())
+        deleted = sum(1 for entries in self._guilds.values() for entry in entries.values() if entry[2] is not None)
+        return {"guilds": len(self._guilds), "records": records, "deleted": deleted, "pending_writes": len(self._dirty)}
+
+
+class SnapshotRestorer:
+    """Rebuilds deleted roles and channels from their snapshots, paced through the bulk scheduler.
+
+    Roles come first, since channel overwrites refer to them, and get back their
+    position and then their members. Categories come before the channels inside them.
+    Overwrites for a restored role point at its replacement. Restored objects' old
+    records are forgotten; the create events record the new ones.
+    """
+
+    def __init__(self, store, bulk):
+        self.store = store
+        self.bulk = bulk
+
+    async def restore(self, guild, records, job, on_progress=None, progress_interval=2.0, reason="Anti-nuke restore"):
+        """Rebuild `records` from `SnapshotStore.deleted`, counting objects on `job`."""
+        last_report = time.monotonic()
+        on_progress = safe_progress(on_progress)
+
+        async def progress():
+            nonlocal last_report
+            if on_progress and time.monotonic() - last_report >= progress_interval:
+                last_report = time.monotonic()
+                await on_progress(job)
+
+        roles = sorted((record for record in records if record[1] == ROLE), key=lambda record: record[2]['position'])
+        channels = sorted((record for record in records if record[1] == CHANNEL),
+                          key=lambda record: (record[2]['type'] != 'category', record[2]['position']))
+        try:
+            restored_roles = await self._restore_roles(guild, roles, job, progress, reason)
+            await self._restore_channels(guild, channels, restored_roles, job, progress, reason)
+            await self._restore_members(guild, restored_roles, job, reason)
+        finally:
+            job.finished = True
+        if on_progress:
+            await on_progress(job)
+        return job
+
+    async def _create(self, route, guild, job, create):
+        await self.bulk.bucket(route, guild.id).acquire()
+        try:
+            created = await create()
+        except discord.HTTPException as e:
+            print(f"🚨 Error: Could not restore an object in guild {guild.id}: {str(e)}")
+            job.failed += 1
+            return None
+        job.done += 1
+        return created
+
+    async def _restore_roles(self, guild, roles, job, progress, reason):
+        restored = {}
+        for old_id, _, record in roles:
+            if job.cancelled:
+                break
+            role = await self._create('role_create', guild, job, lambda: guild.create_role(
+                name=record['name'], permissions=discord.Permissions(record['permissions']),
+                colour=discord.Colour(record['colour']), hoist=record['hoist'],
+                mentionable=record['mentionable'], reason=reason))
+            if role is not None:
+                restored[old_id] = (role, record)
+                self.store.forget(guild.id, old_id)
+            await progress()
+
+        if restored:
+            # New roles are created just above @everyone; one call puts them all back in place,
+            # short of the bot's own top role, which it can't place roles above
+            top = guild.me.top_role.position - 1
+            positions = {role: max(1, min(record['position'], top)) for role, record in restored.values()}
+            try:
+                await guild.edit_role_positions(positions=positions, reason=reason)
+            except discord.HTTPException as e:
+                print(f"🚨 Error: Could not reorder restored roles in guild {guild.id}: {str(e)}")
+        return restored
+
+    def _overwrites(self, guild, entries, restored_roles):
+        overwrites = {}
+        for target_id, target_type, allow, deny in entries:
+            if target_type == ROLE:
+                restored = restored_roles.get(target_id)
+                target = restored[0] if restored else guild.get_role(target_id)
+            else:
+                target = guild.get_member(target_id)
+            if target is not None:
+                overwrites[target] = discord.PermissionOverwrite.from_pair(discord.Permissions(allow), discord.Permissions(deny))
+        return overwrites
+
+    async def _restore_channels(self, guild, channels, restored_roles, job, progress, reason):
+        restored_categories = {}
+        for old_id, _, record in channels:
+            if job.cancelled:
+                break
+            kwargs = {'name': record['name'], 'position': record['position'], 'reason': reason,
+                      'overwrites': self._overwrites(guild, record['overwrites'], restored_roles)}
+            category_id = record['category']
+            if record['type'] != 'category' and category_id:
+                category = restored_categories.get(category_id) or guild.get_channel(category_id)
+                if category is not None:
+                    kwargs['category'] = category
+
+            if record['type'] == 'category':
+                create = lambda: guild.create_category(**kwargs)
+            elif record['type'] in ('voice', 'stage_voice'):
+                kwargs['user_limit'] = record.get('user_limit', 0)
+                if 'bitrate' in record:
+                    kwargs['bitrate'] = min(record['bitrate'], int(guild.bitrate_limit))
+                create = lambda: guild.create_voice_channel(**kwargs)
+            else:
+                # Text, announcement and anything newer come back as text channels
+                kwargs.update(topic=record.get('topic'), slowmode_delay=record.get('slowmode_delay', 0),
+                              nsfw=record.get('nsfw', False))
+                create = lambda: guild.create_text_channel(**kwargs)
+
+            channel = await self._create('channel_create', guild, job, create)
+            if channel is not None:
+                if record['type'] == 'category':
+                    restored_categories[old_id] = channel
+                self.store.forget(guild.id, old_id)
+            await progress()
+
+    async def _restore_members(self, guild, restored_roles, job, reason):
+        bucket = self.bulk.bucket('member_roles', guild.id)
+        for role, record in restored_roles.values():
+            for member_id in record['members']:
+                if job.cancelled:
+                    return
+                member = guild.get_member(member_id)
+                if member is None:
+                    continue
+                await bucket.acquire()
+                try:
+                    await member.add_roles(role, reason=reason)
+                except discord.HTTPException as e:
+                    print(f"🚨 Error: Could not give {member_id} the restored role {role.id}: {str(e)}")
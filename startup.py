@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+import time
+
+import discord
+
+
+def process_started():
+    """The perf_counter() reading at which this process started.
+
+    On Linux it comes from /proc, so interpreter start-up and imports count too;
+    elsewhere it falls back to the moment this is called.
+    """
+    try:
+        with open('/proc/self/stat') as f:
+            # Fields after the parenthesised command name start at field 3; starttime is field 22
+            started_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        age = uptime - started_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        age = 0.0
+    return time.perf_counter() - max(age, 0.0)
+
+
+class StartupTimeline:
+    """Seconds from process start to each startup milestone, each recorded once."""
+
+    def __init__(self, origin=None):
+        self.origin = process_started() if origin is None else origin
+        self.marks = {}
+
+    def mark(self, name):
+        """Record `name` the first time it is reached. Returns whether this was the first time."""
+        if name in self.marks:
+            return False
+        self.marks[name] = time.perf_counter() - self.origin
+        return True
+
+    def summary(self):
+        return ', '.join(f"{name} {seconds:.2f}s" for name, seconds in self.marks.items())
+
+
+def command_payload(tree, guild=None):
+    """The command definitions `tree.sync(guild=guild)` would upload, in a stable order."""
+    payload = []
+    for command in tree.get_commands(guild=guild):
+        try:
+            payload.append(command.to_dict(tree))
+        except TypeError:
+            # discord.py before 2.4 takes no tree
+            payload.append(command.to_dict())
+    return sorted(payload, key=lambda data: (data.get('type', 1), data['name']))
+
+
+def tree_hash(tree, guild=None):
+    encoded = json.dumps(command_payload(tree, guild), sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class CommandSync:
+    """Syncs the command tree with Discord only when it differs from what was last synced.
+
+    The hash of the last synced tree is kept through `await loader(key)` and
+    `await writer(key, value)`, so a restart with unchanged commands makes no sync call.
+    With `dev_guild_id` the global commands are copied into that guild and synced there
+    alone, where changes show up at once instead of after Discord's global rollout.
+    """
+
+    def __init__(self, tree, loader, writer, dev_guild_id=None):
+        self.tree = tree
+        self.loader = loader
+        self.writer = writer
+        self.dev_guild_id = dev_guild_id
+
+    @property
+    def key(self):
+        return f"command_tree_hash:{self.dev_guild_id or 'global'}"
+
+    async def sync(self, force=False):
+        """Sync if the tree changed since the last sync, or always with `force`. Returns whether it synced."""
+        guild = discord.Object(id=self.dev_guild_id) if self.dev_guild_id else None
+        if guild is not None:
+            self.tree.copy_global_to(guild=guild)
+        digest = tree_hash(self.tree, guild)
+        try:
+            if not force and await self.loader(self.key) == digest:
+                print("Command tree unchanged since the last sync; skipping sync")
+                return False
+            synced = await self.tree.sync(guild=guild)
+            await self.writer(self.key, digest)
+        except Exception as e:
+            print(f"🚨 Error: Failed to sync the command tree: {str(e)}")
+            return False
+        print(f"Synced {len(synced)} commands " + (f"to guild {self.dev_guild_id}" if guild else "globally"))
+        return True
@@ -0,0 +1,311 @@
+import asyncio
+import os
+from abc import ABC, abstractmethod
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from rate_limit import SlidingWindowCounter
+
+
+class CounterBackend(ABC):
+    """Rate counters keyed by (scope, key), for spam and anti-nuke detection.
+
+    `hit` atomically counts an event and returns how many fell inside the window; callers
+    compare that against `limit`. The in-process backend counts over an exact sliding
+    window. The shared backends use a fixed window that starts with the first hit and
+    expires `window` seconds later, which is what an atomic increment-with-expiry gives;
+    their counts are shared by every process pointed at them and survive restarts.
+    """
+
+    name = None
+
+    @abstractmethod
+    async def hit(self, scope, key, limit, window, now=None):
+        ...
+
+    @abstractmethod
+    async def reset(self, scope, key=None):
+        ...
+
+    async def sweep(self, now=None):
+        """Drop expired counters. Returns how many were removed."""
+        return 0
+
+    def stats(self):
+        return {"backend": self.name}
+
+    def namespaced(self, namespace):
+        return NamespacedCounter(self, namespace)
+
+    async def close(self):
+        pass
+
+
+class NamespacedCounter(CounterBackend):
+    """One user's view of a shared backend, with its scopes kept apart from other users'."""
+
+    def __init__(self, backend, namespace):
+        self.backend = backend
+        self.namespace = namespace
+        self.name = backend.name
+
+    async def hit(self, scope, key, limit, window, now=None):
+        return await self.backend.hit(f"{self.namespace}:{scope}", key, limit, window, now=now)
+
+    async def reset(self, scope, key=None):
+        await self.backend.reset(f"{self.namespace}:{scope}", key)
+
+    async def sweep(self, now=None):
+        return await self.backend.sweep(now)
+
+    def stats(self):
+        return self.backend.stats()
+
+
+class MemoryCounterBackend(CounterBackend):
+    """Counters in this process only (see SlidingWindowCounter)."""
+
+    name = 'memory'
+
+    def __init__(self, idle_ttl=300):
+        self._counter = SlidingWindowCounter(idle_ttl=idle_ttl)
+
+    async def hit(self, scope, key, limit, window, now=None):
+        return self._counter.hit(scope, key, limit, window, now=now)
+
+    async def reset(self, scope, key=None):
+        self._counter.reset(scope, key)
+
+    async def sweep(self, now=None):
+        return self._counter.sweep(now)
+
+    def stats(self):
+        return {"backend": self.name, **self._counter.stats()}
+
+
+class SQLiteCounterBackend(CounterBackend):
+    """Counters in a SQLite table in WAL mode, shared by every process using the file.
+
+    Each hit is a single UPSERT ... RETURNING, so concurrent writers can't lose
+    increments. The connection lives on its own thread, apart from the main database's
+    executor, so counter writes never queue behind ORM work.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='counters')
+        self._connection = None
+
+    def _connect(self):
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS counters ("
+                "scope TEXT NOT NULL, key TEXT NOT NULL, count INTEGER NOT NULL, expires_at REAL NOT NULL, "
+                "PRIMARY KEY (scope, key)) WITHOUT ROWID"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS ix_counters_expires_at ON counters (expires_at)")
+            self._connection = connection
+        return self._connection
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    def _hit(self, scope, key, window, now):
+        row = self._connect().execute(
+            "INSERT INTO counters (scope, key, count, expires_at) VALUES (?, ?, 1, ?) "
+            "ON CONFLICT (scope, key) DO UPDATE SET "
+            "count = CASE WHEN expires_at <= ? THEN 1 ELSE count + 1 END, "
+            "expires_at = CASE WHEN expires_at <= ? THEN excluded.expires_at ELSE expires_at END "
+            "RETURNING count",
+            (scope, key, now + window, now, now),
+        ).fetchone()
+        return row[0]
+
+    async def hit(self, scope, key, limit, window, now=None):
+        now = time.time() if now is None else now
+        return await self._run(self._hit, str(scope), str(key), window, now)
+
+    def _reset(self, scope, key):
+        if key is None:
+            self._connect().execute("DELETE FROM counters WHERE scope = ?", (scope,))
+        else:
+            self._connect().execute("DELETE FROM counters WHERE scope = ? AND key = ?", (scope, key))
+
+    async def reset(self, scope, key=None):
+        await self._run(self._reset, str(scope), None if key is None else str(key))
+
+    def _sweep(self, now):
+        return self._connect().execute("DELETE FROM counters WHERE expires_at <= ?", (now,)).rowcount
+
+    async def sweep(self, now=None):
+        return await self._run(self._sweep, time.time() if now is None else now)
+
+    async def close(self):
+        if self._connection is not None:
+            await self._run(self._connection.close)
+            self._connection = None
+        self._executor.shutdown(wait=True)
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisCounterBackend(CounterBackend):
+    """Counters in a Redis-compatible server, spoken to directly over RESP.
+
+    A hit runs `SET key 0 PX window NX` and `INCR key` inside MULTI/EXEC, so the expiry
+    is set exactly once per window and the increment can't race it. Only plain string
+    commands, transactions and SCAN are used, so a local stand-in can serve it.
+    """
+
+    name = 'redis'
+
+    def __init__(self, url, prefix='counters'):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.database = int(parsed.path.lstrip('/') or 0)
+        self.prefix = prefix
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+
+    def _key(self, scope, key):
+        return f"{self.prefix}:{scope}:{key}"
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            if self.password:
+                await self._send([('AUTH', self.password)])
+            if self.database:
+                await self._send([('SELECT', self.database)])
+        except BaseException:
+            self._disconnect()
+            raise
+
+    def _disconnect(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def _read(self):
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Redis connection closed")
+        kind, body = line[:1], line[1:-2]
+        if kind == b'+':
+            return body.decode()
+        if kind == b'-':
+            return RedisError(body.decode())
+        if kind == b':':
+            return int(body)
+        if kind == b'$':
+            length = int(body)
+            return None if length < 0 else (await self._reader.readexactly(length + 2))[:-2].decode()
+        if kind == b'*':
+            length = int(body)
+            return None if length < 0 else [await self._read() for _ in range(length)]
+        raise RedisError(f"Unexpected reply {line!r}")
+
+    async def _send(self, commands):
+        """Pipeline commands and return their replies, raising the first error reply."""
+        payload = bytearray()
+        for command in commands:
+            payload += b'*%d\r\n' % len(command)
+            for argument in command:
+                argument = str(argument).encode()
+                payload += b'$%d\r\n%s\r\n' % (len(argument), argument)
+        try:
+            self._writer.write(payload)
+            await self._writer.drain()
+            replies = [await self._read() for _ in commands]
+        except BaseException:
+            # Cancelled or failed partway, the stream may still hold unread replies
+            # that the next command would take for its own
+            self._disconnect()
+            raise
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    async def execute(self, *commands):
+        async with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._writer is None:
+                        await self._connect()
+                    return await self._send(commands)
+                except (ConnectionError, OSError, asyncio.IncompleteReadError):
+                    # Reconnect once; _send has already dropped the broken connection
+                    if attempt:
+                        raise
+
+    async def hit(self, scope, key, limit, window, now=None):
+        name = self._key(scope, key)
+        replies = await self.execute(
+            ('MULTI',), ('SET', name, 0, 'PX', max(1, int(window * 1000)), 'NX'), ('INCR', name), ('EXEC',))
+        return replies[-1][1]
+
+    async def reset(self, scope, key=None):
+        if key is not None:
+            await self.execute(('DEL', self._key(scope, key)))
+            return
+        # Whole-scope resets are rare admin actions, so walking the keyspace is fine
+        cursor = '0'
+        while True:
+            cursor, names = (await self.execute(('SCAN', cursor, 'MATCH', self._key(scope, '*'), 'COUNT', 500)))[0]
+            if names:
+                await self.execute(('DEL', *names))
+            if cursor == '0':
+                return
+
+    async def close(self):
+        self._disconnect()
+
+
+class CounterBackends:
+    """Hands out the counters for each detector from the backend chosen by STATE_BACKEND.
+
+    `memory` (the default) gives every caller its own in-process store. `sqlite:<path>`
+    and `redis://host:port/db` share one backend, with each caller's scopes under its
+    own namespace.
+    """
+
+    def __init__(self, shared=None):
+        self.shared = shared
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        spec = environ.get('STATE_BACKEND', 'memory').strip()
+        if spec == 'memory':
+            return cls()
+        if spec.startswith('sqlite:'):
+            return cls(SQLiteCounterBackend(spec[len('sqlite:'):] or 'state.db'))
+        if spec.startswith('redis://'):
+            return cls(RedisCounterBackend(spec))
+        raise ValueError(f"Unknown STATE_BACKEND {spec!r}; use memory, sqlite:<path> or redis://host:port/db")
+
+    @property
+    def name(self):
+        return self.shared.name if self.shared else MemoryCounterBackend.name
+
+    def counter(self, namespace, idle_ttl=300):
+        if self.shared is None:
+            return MemoryCounterBackend(idle_ttl=idle_ttl)
+        return self.shared.namespaced(namespace)
+
+    async def close(self):
+        if self.shared is not None:
+            await self.shared.close()
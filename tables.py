@@ -0,0 +1,120 @@
+from sqlalchemy import Boolean, Column, Float, Index, Integer, String, UniqueConstraint
+
+from models import Base, FilteredWord, UserLevel
+
+# Tables added on top of models.py. They share its Base, so apply_sqlite_migrations
+# creates them together with the original schema.
+
+
+class GuildThreshold(Base):
+    """Per-guild override of a rate threshold: more than `max_events` within `window_seconds`."""
+    __tablename__ = 'guild_thresholds'
+    __table_args__ = (UniqueConstraint('guild_id', 'key'),)
+
+    id = Column(Integer, primary_key=True)
+    guild_id = Column(String, nullable=False, index=True)
+    key = Column(String, nullable=False)
+    max_events = Column(Integer, nullable=False)
+    window_seconds = Column(Float, nullable=False)
+
+
+class Reminder(Base):
+    """A pending /remind reminder; deleted once it has been delivered."""
+    __tablename__ = 'reminders'
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(String, nullable=False)
+    guild_id = Column(String)
+    message = Column(String, nullable=False)
+    due_at = Column(Float, nullable=False, index=True)
+    created_at = Column(Float, nullable=False)
+
+
+class VoiceLobby(Base):
+    """The voice channel members join to get a temporary channel of their own."""
+    __tablename__ = 'voice_lobbies'
+
+    guild_id = Column(String, primary_key=True)
+    channel_id = Column(String, nullable=False)
+
+
+class TempVoiceChannel(Base):
+    """A temporary voice channel created from a lobby; deleted once it empties."""
+    __tablename__ = 'temp_voice_channels'
+
+    channel_id = Column(String, primary_key=True)
+    guild_id = Column(String, nullable=False, index=True)
+    owner_id = Column(String, nullable=False)
+    created_at = Column(Float, nullable=False)
+
+
+class RaidSettings(Base):
+    """How a guild responds to raids, beyond the join threshold kept in guild_thresholds."""
+    __tablename__ = 'raid_settings'
+
+    guild_id = Column(String, primary_key=True)
+    raise_verification = Column(Boolean, nullable=False, default=False)
+
+
+class GuildObjectSnapshot(Base):
+    """The last known state of a role or channel as compact JSON (see snapshots.py).
+
+    Kept after the object is deleted, with `deleted_at` set, so it can be rebuilt.
+    """
+    __tablename__ = 'guild_object_snapshots'
+
+    guild_id = Column(String, primary_key=True)
+    object_id = Column(String, primary_key=True)
+    kind = Column(String, nullable=False)
+    data = Column(String, nullable=False)
+    deleted_at = Column(Float)
+
+
+class ActivityRollup(Base):
+    """Messages, joins, leaves and XP gained in a guild during one minute, hour or day (see analytics.py)."""
+    __tablename__ = 'activity_rollups'
+    # Pruning deletes by resolution and age across all guilds
+    __table_args__ = (Index('ix_activity_rollups_resolution_bucket', 'resolution', 'bucket'),)
+
+    guild_id = Column(String, primary_key=True)
+    resolution = Column(String, primary_key=True)
+    bucket = Column(Integer, primary_key=True)
+    messages = Column(Integer, nullable=False, default=0)
+    joins = Column(Integer, nullable=False, default=0)
+    leaves = Column(Integer, nullable=False, default=0)
+    xp = Column(Integer, nullable=False, default=0)
+
+
+class ChannelActivity(Base):
+    """Messages sent in a channel during one day, for /stats' top channels."""
+    __tablename__ = 'channel_activity'
+
+    guild_id = Column(String, primary_key=True)
+    channel_id = Column(String, primary_key=True)
+    day = Column(Integer, primary_key=True, index=True)
+    messages = Column(Integer, nullable=False, default=0)
+
+
+class BotState(Base):
+    """Small process-wide values that must survive restarts, such as the synced command tree hash."""
+    __tablename__ = 'bot_state'
+
+    key = Column(String, primary_key=True)
+    value = Column(String, nullable=False)
+
+
+USER_LEVEL_UNIQUE_INDEX = 'ux_userlevel_guild_id_user_id'
+
+# Indexes on tables from models.py. Fresh databases get them from apply_sqlite_migrations;
+# db.ensure_indexes adds them to databases created before they existed.
+ADDED_INDEXES = (
+    # Guild-scoped XP reads, ordered by XP for rankings
+    Index('ix_userlevel_guild_id_xp', UserLevel.guild_id, UserLevel.xp),
+    # One row per member: the XP flush upserts on it
+    Index(USER_LEVEL_UNIQUE_INDEX, UserLevel.guild_id, UserLevel.user_id, unique=True),
+    # Filter loads by guild and /removefilter's lookup of one word
+    Index('ix_filteredword_guild_id_word', FilteredWord.guild_id, FilteredWord.word),
+)
+
+# Indexes replaced by ones in ADDED_INDEXES, dropped by db.ensure_indexes
+DROPPED_INDEXES = ('ix_userlevel_guild_id_user_id',)
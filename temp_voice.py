@@ -0,0 +1,123 @@
+import asyncio
+import time
+
+import discord
+
+
+class TempVoiceManager:
+    """Lobby and temporary voice channels, tracked by ID in memory and in the DB.
+
+    Joining a guild's lobby creates a channel owned by the member; the channel is deleted
+    from the voice state event in which its last member leaves. `store` provides the
+    async temp voice queries (see db.py) so tracked channels survive restarts, and
+    `reconcile` cleans up whatever emptied or disappeared while the bot was offline.
+    `on_removed(guild_id, channel_id)` is called for every temp channel dropped.
+    """
+
+    def __init__(self, store, lobby_name="Create Voice Channel", on_removed=None):
+        self.store = store
+        self.lobby_name = lobby_name
+        self.on_removed = on_removed or (lambda guild_id, channel_id: None)
+        self._lobbies = {}
+        self._channels = {}
+        self._deleting = set()
+
+    async def load_all(self):
+        lobbies, channels = await self.store.get_temp_voice_state()
+        self._lobbies = {int(guild_id): int(channel_id) for guild_id, channel_id in lobbies}
+        self._channels = {int(channel_id): (int(guild_id), int(owner_id)) for channel_id, guild_id, owner_id in channels}
+        return len(self._channels)
+
+    def lobby_id(self, guild_id):
+        return self._lobbies.get(guild_id)
+
+    def owner_id(self, channel_id):
+        channel = self._channels.get(channel_id)
+        return channel[1] if channel else None
+
+    def is_temp(self, channel_id):
+        return channel_id in self._channels
+
+    async def forget(self, channel_id):
+        """Drop a temp channel that was deleted by someone else."""
+        tracked = self._channels.pop(channel_id, None)
+        if tracked is not None:
+            self.on_removed(tracked[0], channel_id)
+            await self.store.delete_temp_voice_channels([channel_id])
+
+    async def set_lobby(self, guild, channel):
+        await self.store.set_voice_lobby(guild.id, channel.id)
+        self._lobbies[guild.id] = channel.id
+
+    async def handle_voice_state(self, member, before, after):
+        if before.channel == after.channel:
+            return
+        if before.channel is not None and before.channel.id in self._channels and not before.channel.members:
+            await self._delete(before.channel)
+        if after.channel is not None and after.channel.id == self._lobbies.get(member.guild.id):
+            await self._create_for(member, after.channel)
+
+    async def _create_for(self, member, lobby):
+        channel = await member.guild.create_voice_channel(f"🎮 {member.display_name}'s Channel", category=lobby.category)
+        self._channels[channel.id] = (member.guild.id, member.id)
+        await self.store.add_temp_voice_channel(channel.id, member.guild.id, member.id, time.time())
+        try:
+            await member.move_to(channel)
+            await channel.set_permissions(member, manage_channels=True)
+        except discord.HTTPException:
+            pass
+        # The member may have left the lobby before the move, leaving the channel empty
+        if not channel.members:
+            await self._delete(channel)
+
+    async def _delete(self, channel):
+        if channel.id in self._deleting:
+            return
+        self._deleting.add(channel.id)
+        try:
+            await channel.delete(reason="Temporary voice channel is empty")
+        except discord.NotFound:
+            pass
+        finally:
+            self._deleting.discard(channel.id)
+        if self._channels.pop(channel.id, None) is not None:
+            self.on_removed(channel.guild.id, channel.id)
+        await self.store.delete_temp_voice_channels([channel.id])
+
+    async def reconcile(self, guilds):
+        """One pass over tracked channels after startup: delete the empty ones and forget
+        those that no longer exist. Returns (deleted, forgotten)."""
+        guilds = {guild.id: guild for guild in guilds}
+        empty, gone = [], []
+        for channel_id, (guild_id, _) in self._channels.items():
+            guild = guilds.get(guild_id)
+            if guild is None:
+                continue
+            channel = guild.get_channel(channel_id)
+            if channel is None:
+                gone.append(channel_id)
+            elif not channel.members:
+                empty.append(channel)
+
+        for guild_id, guild in guilds.items():
+            lobby_id = self._lobbies.get(guild_id)
+            if lobby_id is not None and guild.get_channel(lobby_id) is None:
+                del self._lobbies[guild_id]
+                await self.store.set_voice_lobby(guild_id, None)
+            elif lobby_id is None:
+                # Guilds set up before lobbies were tracked by ID
+                lobby = discord.utils.get(guild.voice_channels, name=self.lobby_name)
+                if lobby is not None:
+                    await self.set_lobby(guild, lobby)
+
+        results = await asyncio.gather(*(channel.delete(reason="Temporary voice channel is empty") for channel in empty),
+                                       return_exceptions=True)
+        deleted = [channel.id for channel, result in zip(empty, results)
+                   if result is None or isinstance(result, discord.NotFound)]
+        for channel_id in gone + deleted:
+            tracked = self._channels.pop(channel_id, None)
+            if tracked is not None:
+                self.on_removed(tracked[0], channel_id)
+        if gone or deleted:
+            await self.store.delete_temp_voice_channels(gone + deleted)
+        return len(deleted), len(gone)
@@ -0,0 +1,77 @@
+import functools
+import re
+from operator import itemgetter
+
+# Placeholders each kind of message can use, as {name}
+WELCOME_FIELDS = ('user', 'server', 'membercount')
+LEVEL_UP_FIELDS = ('user', 'level')
+
+_PLACEHOLDER = re.compile(r'\{(\w+)\}')
+
+
+class TemplateError(ValueError):
+    pass
+
+
+class Template:
+    """A message template compiled once into a %-format pattern and rendered in one pass.
+
+    Chained str.replace calls rescan the whole message once per placeholder; here the
+    literal text and the placeholder order are worked out up front. Placeholders outside
+    `fields` are kept as literal text, which is how templates saved before placeholders
+    were validated have always rendered; they are listed in `unknown`.
+    """
+
+    __slots__ = ('text', 'fields', 'unknown', '_pattern', '_pick')
+
+    def __init__(self, text, fields):
+        self.text = text
+        self.fields = fields
+        unknown = []
+        names = []
+        parts = []
+        position = 0
+        for match in _PLACEHOLDER.finditer(text):
+            parts.append(text[position:match.start()].replace('%', '%%'))
+            name = match.group(1)
+            if name in fields:
+                names.append(name)
+                parts.append('%s')
+            else:
+                unknown.append(name)
+                parts.append(match.group(0).replace('%', '%%'))
+            position = match.end()
+        parts.append(text[position:].replace('%', '%%'))
+        self.unknown = tuple(dict.fromkeys(unknown))
+
+        if not names:
+            self._pattern = text
+            self._pick = None
+        elif len(names) == 1:
+            self._pattern = ''.join(parts)
+            self._pick = lambda values, name=names[0]: (values[name],)
+        else:
+            self._pattern = ''.join(parts)
+            self._pick = itemgetter(*names)
+
+    def render(self, **values):
+        """Fill in the placeholders; every field must be passed as a keyword argument."""
+        if self._pick is None:
+            return self._pattern
+        return self._pattern % self._pick(values)
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_template(text, fields):
+    """The compiled template for `text`, cached by text so each guild's is parsed once."""
+    return Template(text, fields)
+
+
+def validate_template(text, fields):
+    """Compile a template being saved, rejecting placeholders that `fields` doesn't have."""
+    template = compile_template(text, fields)
+    if template.unknown:
+        unknown = ', '.join('{' + name + '}' for name in template.unknown)
+        available = ', '.join('{' + name + '}' for name in fields)
+        raise TemplateError(f"Unknown placeholder(s) {unknown}. Available placeholders: {available}")
+    return template
@@ -0,0 +1,141 @@
+import asyncio
+from types import SimpleNamespace
+
+import discord
+
+from antinuke import AuditAttributor
+
+
+class AuditGuild:
+    """A guild whose audit log holds whatever entries the test has written so far."""
+
+    def __init__(self, guild_id=1):
+        self.id = guild_id
+        self.entries = []
+        self.error = None
+        self.fetch_delay = 0
+
+    def write(self, entry_id, user_id, action, target_id):
+        self.entries.append(SimpleNamespace(id=entry_id, user=SimpleNamespace(id=user_id),
+                                            action=SimpleNamespace(name=action), target=SimpleNamespace(id=target_id)))
+
+    async def audit_logs(self, limit):
+        if self.fetch_delay:
+            await asyncio.sleep(self.fetch_delay)
+        if self.error:
+            raise self.error
+        for entry in sorted(self.entries, key=lambda entry: entry.id, reverse=True)[:limit]:
+            yield entry
+
+
+def forbidden():
+    return discord.Forbidden(SimpleNamespace(status=403, reason='Forbidden'), 'Missing Access')
+
+
+def attributor(**kwargs):
+    offenders = []
+
+    async def on_offender(guild, actor, action):
+        offenders.append((actor.id, action))
+    return AuditAttributor(on_offender, **kwargs), offenders
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_events_without_audit_entries_yet_are_retried():
+    async def test():
+        attribution, offenders = attributor(delay=0.01)
+        guild = AuditGuild()
+        for target_id in (10, 11):
+            attribution.submit(guild, 'channel_delete', target_id, 1, 60)
+        # The trip flush runs before Discord has written the entries
+        assert await attribution.flush(guild) == []
+        for entry_id, target_id in ((100, 10), (101, 11)):
+            guild.write(entry_id, 7, 'channel_delete', target_id)
+        await asyncio.sleep(0.2)
+        assert offenders == [(7, 'channel_delete')]
+        assert not attribution._pending
+    run(test())
+
+
+def test_unmatched_events_are_dropped_after_the_retries():
+    async def test():
+        attribution, offenders = attributor(delay=0.01, retries=3)
+        guild = AuditGuild()
+        attribution.submit(guild, 'role_delete', 10, 1, 60)
+        await asyncio.sleep(0.3)
+        assert attribution.fetches == 3
+        assert not attribution._pending and not attribution._timers
+    run(test())
+
+
+def test_forbidden_audit_log_pauses_attribution():
+    async def test():
+        attribution, offenders = attributor(delay=0.01, forbidden_backoff=60)
+        guild = AuditGuild()
+        guild.error = forbidden()
+        attribution.submit(guild, 'member_ban', 10, 1, 60)
+        await attribution.flush(guild)
+        attribution.submit(guild, 'member_ban', 11, 1, 60)
+        await attribution.flush(guild)
+        await asyncio.sleep(0.2)
+        assert attribution.fetches == 1
+        assert not attribution._pending and not attribution._timers
+    run(test())
+
+
+def test_failed_fetches_are_retried():
+    async def test():
+        attribution, offenders = attributor(delay=0.01)
+        guild = AuditGuild()
+        guild.error = OSError("connection reset")
+        for target_id in (10, 11):
+            attribution.submit(guild, 'member_ban', target_id, 1, 60)
+            guild.write(100 + target_id, 7, 'ban', target_id)
+        await attribution.flush(guild)
+        guild.error = None
+        await asyncio.sleep(0.2)
+        assert offenders == [(7, 'member_ban')]
+    run(test())
+
+
+def test_concurrent_flushes_count_each_entry_once():
+    async def test():
+        attribution, offenders = attributor(delay=10)
+        guild = AuditGuild()
+        guild.fetch_delay = 0.01
+        for target_id in range(4):
+            guild.write(100 + target_id, 7, 'channel_delete', target_id)
+        attribution.submit(guild, 'channel_delete', 0, 3, 60)
+        attribution.submit(guild, 'channel_delete', 1, 3, 60)
+        first = asyncio.create_task(attribution.flush(guild))
+        await asyncio.sleep(0)
+        attribution.submit(guild, 'channel_delete', 2, 3, 60)
+        attribution.submit(guild, 'channel_delete', 3, 3, 60)
+        # The first flush sees entries 102 and 103 before their events are submitted
+        await asyncio.gather(first, attribution.flush(guild))
+        assert offenders == [(7, 'channel_delete')]
+        for timer in attribution._timers.values():
+            timer.cancel()
+    run(test())
+
+
+def test_an_entry_is_never_counted_twice():
+    async def test():
+        attribution, offenders = attributor(delay=10, retries=1)
+        guild = AuditGuild()
+        guild.write(100, 7, 'guild_update', 1)
+        for _ in range(3):
+            attribution.submit(guild, 'guild_update', 1, 1, 60)
+            await attribution.flush(guild)
+        # One audit entry explains only the first update; the others never got theirs
+        assert offenders == []
+        guild.write(101, 7, 'guild_update', 1)
+        attribution.submit(guild, 'guild_update', 1, 1, 60)
+        await attribution.flush(guild)
+        assert offenders == [(7, 'guild_update')]
+        for timer in attribution._timers.values():
+            timer.cancel()
+    run(test())
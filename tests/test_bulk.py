@@ -0,0 +1,91 @@
+import asyncio
+from types import SimpleNamespace
+
+import discord
+import pytest
+
+from bulk import BulkJob, BulkScheduler
+
+FAST = {'kick': (1000.0, 1000)}
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_failures_are_counted_not_raised():
+    async def test():
+        async def kick(item):
+            if item % 3 == 0:
+                raise discord.Forbidden(SimpleNamespace(status=403, reason='Forbidden'), 'Missing Permissions')
+
+        job = BulkJob("Kicking", 9)
+        await BulkScheduler(route_rates=FAST).run(job, 'kick', range(9), kick)
+        assert (job.done, job.failed, job.finished) == (6, 3, True)
+    run(test())
+
+
+def test_cancelling_the_job_stops_new_items():
+    async def test():
+        started, release = [], asyncio.Event()
+        job = BulkJob("Kicking", 20)
+
+        async def kick(item):
+            started.append(item)
+            if len(started) == 3:
+                job.cancel()
+            await release.wait()
+
+        task = asyncio.create_task(BulkScheduler(route_rates=FAST).run(job, 'kick', range(20), kick, concurrency=3))
+        await asyncio.sleep(0.01)
+        release.set()
+        await task
+        # The three in flight when it was cancelled still finish
+        assert started == [0, 1, 2]
+        assert job.done == 3 and job.finished and job.cancelled
+        assert job.summary() == "Kicking: 3/20 (cancelled)"
+    run(test())
+
+
+def test_cancelling_the_task_stops_its_workers():
+    async def test():
+        in_flight = []
+
+        async def kick(item):
+            in_flight.append(item)
+            try:
+                await asyncio.sleep(10)
+            finally:
+                in_flight.remove(item)
+
+        job = BulkJob("Kicking", 20)
+        task = asyncio.create_task(BulkScheduler(route_rates=FAST).run(job, 'kick', range(20), kick, concurrency=4))
+        await asyncio.sleep(0.01)
+        assert len(in_flight) == 4
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0)
+        assert in_flight == []
+        assert job.cancelled and job.finished
+    run(test())
+
+
+def test_failed_progress_reports_do_not_stop_the_job():
+    async def test():
+        reports = []
+
+        async def report(job):
+            reports.append(job.done)
+            raise discord.NotFound(SimpleNamespace(status=404, reason='Not Found'), 'Unknown Message')
+
+        async def kick(item):
+            await asyncio.sleep(0.002)
+
+        job = BulkJob("Kicking", 20)
+        await BulkScheduler(route_rates=FAST).run(job, 'kick', range(20), kick, concurrency=1,
+                                                  on_progress=report, progress_interval=0.005)
+        assert job.done == 20 and job.finished
+        # Reporting stops after the first failure
+        assert len(reports) == 1
+    run(test())
@@ -0,0 +1,163 @@
+import asyncio
+import json
+
+import pytest
+
+from http_client import HTTPClient, HTTPError, MemeBuffer
+
+
+class StubServer:
+    """A local HTTP server answering each path from a queue of (status, body, headers)."""
+
+    def __init__(self):
+        self.responses = {}
+        self.requests = []
+        self._server = None
+
+    def add(self, path, status=200, body=None, headers=None):
+        if not isinstance(body, (str, bytes)):
+            body = json.dumps(body)
+        self.responses.setdefault(path, []).append((status, body, headers or {}))
+
+    @property
+    def url(self):
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def __aenter__(self):
+        self._server = await asyncio.start_server(self._handle, '127.0.0.1', 0)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        request = await reader.readline()
+        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+            pass
+        target = request.split()[1].decode()
+        self.requests.append(target)
+        queue = self.responses.get(target.split('?', 1)[0], [])
+        status, body, headers = queue.pop(0) if len(queue) > 1 else (queue[0] if queue else (404, 'not found', {}))
+        body = body.encode() if isinstance(body, str) else body
+        head = f"HTTP/1.1 {status} X\r\nContent-Length: {len(body)}\r\nConnection: close\r\n"
+        head += ''.join(f"{key}: {value}\r\n" for key, value in headers.items())
+        writer.write(head.encode() + b'\r\n' + body)
+        await writer.drain()
+        writer.close()
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def with_client(test, **kwargs):
+    client = HTTPClient(timeout=5, backoff=0.001, **kwargs)
+    async with StubServer() as server:
+        try:
+            return await test(server, client)
+        finally:
+            await client.close()
+
+
+def test_get_json_returns_the_document():
+    async def test(server, client):
+        server.add('/doc', body={'ok': True})
+        assert await client.get_json(f"{server.url}/doc", params={'a': '1'}) == {'ok': True}
+        assert server.requests == ['/doc?a=1']
+    run(with_client(test))
+
+
+def test_retries_transient_statuses_then_succeeds():
+    async def test(server, client):
+        server.add('/flaky', status=503, body='busy')
+        server.add('/flaky', status=429, body='slow down', headers={'Retry-After': '0.01'})
+        server.add('/flaky', body=[1, 2])
+        assert await client.get_json(f"{server.url}/flaky") == [1, 2]
+        assert len(server.requests) == 3
+    run(with_client(test, retries=3))
+
+
+def test_gives_up_after_retries():
+    async def test(server, client):
+        server.add('/down', status=503, body='busy')
+        with pytest.raises(HTTPError):
+            await client.get_json(f"{server.url}/down")
+        assert len(server.requests) == 3
+    run(with_client(test, retries=2))
+
+
+def test_other_statuses_fail_without_retrying():
+    async def test(server, client):
+        server.add('/missing', status=404, body='nope')
+        with pytest.raises(HTTPError):
+            await client.get_json(f"{server.url}/missing")
+        assert len(server.requests) == 1
+    run(with_client(test))
+
+
+def test_invalid_json_is_an_http_error():
+    async def test(server, client):
+        server.add('/html', body='<html>maintenance</html>')
+        with pytest.raises(HTTPError):
+            await client.get_json(f"{server.url}/html")
+        assert len(server.requests) == 1
+    run(with_client(test))
+
+
+def test_connection_failures_are_http_errors():
+    async def test(server, client):
+        with pytest.raises(HTTPError):
+            await client.get_json("http://127.0.0.1:9/unreachable")
+    run(with_client(test, retries=1))
+
+
+def test_ttl_cache_serves_repeat_requests():
+    async def test(server, client):
+        server.add('/weather', body={'temp': 20})
+        url = f"{server.url}/weather"
+        assert await client.get_json(url, params={'format': 'j1'}, ttl=60) == {'temp': 20}
+        assert await client.get_json(url, params={'format': 'j1'}, ttl=60) == {'temp': 20}
+        assert len(server.requests) == 1
+        await client.get_json(url, params={'format': 'other'}, ttl=60)
+        assert len(server.requests) == 2
+    run(with_client(test))
+
+
+def test_meme_buffer_prefetches_and_refills():
+    async def test(server, client):
+        server.add('/gimme/3', body={'memes': [{'url': f"https://memes/{index}"} for index in range(3)]})
+        memes = MemeBuffer(client, f"{server.url}/gimme", size=3, refill_below=1)
+        await memes.refill()
+        assert memes.ready
+        assert await memes.get() == "https://memes/0"
+        assert await memes.get() == "https://memes/1"
+        # Down to the refill threshold, so a refill for the missing memes is under way
+        await memes._refill
+        assert '/gimme/2' in server.requests
+    run(with_client(test))
+
+
+def test_meme_buffer_survives_bad_responses():
+    async def test(server, client):
+        server.add('/gimme/2', body='not json')
+        server.add('/gimme/2', body=['not', 'an', 'object'])
+        memes = MemeBuffer(client, f"{server.url}/gimme", size=2)
+        await memes.refill()
+        await memes.refill()
+        assert not memes.ready
+        assert await memes.get() is None
+        await memes._refill
+    run(with_client(test))
+
+
+def test_long_retry_after_gives_up_instead_of_waiting():
+    async def test(server, client):
+        server.add('/limited', status=429, body='slow down', headers={'Retry-After': '3600'})
+        started = asyncio.get_running_loop().time()
+        with pytest.raises(HTTPError):
+            await client.get_json(f"{server.url}/limited")
+        assert len(server.requests) == 1
+        assert asyncio.get_running_loop().time() - started < 1
+    run(with_client(test, retries=3, max_retry_after=5))
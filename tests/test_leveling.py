@@ -0,0 +1,40 @@
+import random
+
+from leveling import MAX_TABLE_LEVEL, calculate_level_for_xp, calculate_xp_for_level, levels_for_xp
+
+
+def loop_level_for_xp(xp):
+    """The level-by-level walk calculate_level_for_xp replaced."""
+    level = 0
+    while xp >= calculate_xp_for_level(level + 1):
+        level += 1
+    return level
+
+
+def test_matches_loop_over_a_range():
+    for xp in range(-5, 50000):
+        assert calculate_level_for_xp(xp) == loop_level_for_xp(xp), xp
+
+
+def test_matches_loop_around_every_threshold():
+    # Past the table the closed form takes over, so cover well beyond it
+    for level in range(MAX_TABLE_LEVEL + 200):
+        threshold = calculate_xp_for_level(level)
+        for xp in (threshold - 1, threshold, threshold + 1):
+            assert calculate_level_for_xp(xp) == loop_level_for_xp(xp), xp
+
+
+def test_matches_loop_for_large_random_xp():
+    rng = random.Random(0)
+    for _ in range(30):
+        xp = rng.randint(calculate_xp_for_level(MAX_TABLE_LEVEL), 10 ** 9)
+        assert calculate_level_for_xp(xp) == loop_level_for_xp(xp), xp
+
+
+def test_levels_for_xp_matches_loop():
+    rng = random.Random(1)
+    xp_values = [rng.randint(0, 5_000_000) for _ in range(2000)]
+    # Leaderboards repeat values and cluster within levels
+    xp_values += xp_values[:200] + [calculate_xp_for_level(level) for level in range(0, 300, 7)]
+    assert levels_for_xp(xp_values) == [loop_level_for_xp(xp) for xp in xp_values]
+    assert levels_for_xp([]) == []
@@ -0,0 +1,95 @@
+import asyncio
+from datetime import timedelta
+from types import SimpleNamespace
+
+import discord
+
+from bulk import BulkScheduler
+from purge import PurgeEngine, PurgeFilter, PurgeJob
+
+FAST = {'message_bulk_delete': (1000.0, 1000), 'message_delete': (1000.0, 1000)}
+
+
+class Message:
+    def __init__(self, channel, message_id, age, author_id=1, bot=False, content="hello"):
+        self.channel = channel
+        self.id = message_id
+        self.created_at = discord.utils.utcnow() - age
+        self.author = SimpleNamespace(id=author_id, bot=bot)
+        self.content = content
+
+    async def delete(self):
+        self.channel.single_deleted.append(self.id)
+
+
+class Channel:
+    """A channel whose history is newest first, as Discord returns it."""
+
+    def __init__(self, id=10):
+        self.id = id
+        self.messages = []
+        self.bulk_batches = []
+        self.single_deleted = []
+        self.not_found = False
+
+    def add(self, count, age, **kwargs):
+        for _ in range(count):
+            self.messages.append(Message(self, len(self.messages) + 1, age, **kwargs))
+
+    async def history(self, limit, before=None, after=None, oldest_first=False):
+        for message in sorted(self.messages, key=lambda message: message.created_at, reverse=True)[:limit]:
+            yield message
+
+    async def delete_messages(self, batch):
+        if self.not_found:
+            raise discord.NotFound(SimpleNamespace(status=404, reason='Not Found'), 'Unknown Message')
+        ages = [discord.utils.utcnow() - message.created_at for message in batch]
+        assert len(batch) <= 100 and max(ages) < timedelta(days=14)
+        self.bulk_batches.append([message.id for message in batch])
+
+
+def purge(channel, amount, purge_filter=None):
+    job = PurgeJob("Purging", amount)
+    engine = PurgeEngine(BulkScheduler(route_rates=FAST))
+    return asyncio.run(engine.run(channel, job, purge_filter or PurgeFilter()))
+
+
+def test_young_messages_are_bulk_deleted_and_old_ones_singly():
+    channel = Channel()
+    channel.add(250, timedelta(days=1))
+    channel.add(30, timedelta(days=20))
+    job = purge(channel, 1000)
+    assert [len(batch) for batch in channel.bulk_batches] == [100, 100, 50]
+    assert len(channel.single_deleted) == 30
+    assert job.bulk_deleted == 250 and job.single_deleted == 30
+    assert job.done == 280 and job.finished and job.scanned == 280
+
+
+def test_messages_near_the_14_day_limit_are_not_bulk_deleted():
+    channel = Channel()
+    channel.add(3, timedelta(days=14) - timedelta(hours=1))
+    # Inside the safety margin: they could age out before their batch is sent
+    channel.add(2, timedelta(days=14) - timedelta(minutes=2))
+    job = purge(channel, 10)
+    assert sum(len(batch) for batch in channel.bulk_batches) == 3
+    assert sorted(channel.single_deleted) == [4, 5]
+    assert job.done == 5
+
+
+def test_amount_counts_matching_messages_only():
+    channel = Channel()
+    channel.add(40, timedelta(hours=1), author_id=1)
+    channel.add(40, timedelta(hours=2), author_id=2)
+    job = purge(channel, 30, PurgeFilter(user_id=2))
+    deleted = {message_id for batch in channel.bulk_batches for message_id in batch}
+    assert len(deleted) == 30 and all(message_id > 40 for message_id in deleted)
+    assert job.done == 30
+
+
+def test_a_batch_that_hits_a_deleted_message_falls_back_to_single_deletes():
+    channel = Channel()
+    channel.add(5, timedelta(hours=1))
+    channel.not_found = True
+    job = purge(channel, 5)
+    assert sorted(channel.single_deleted) == [1, 2, 3, 4, 5]
+    assert job.done == 5 and job.failed == 0
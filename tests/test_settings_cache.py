@@ -0,0 +1,92 @@
+import asyncio
+from types import SimpleNamespace
+
+from settings_cache import GuildSettingsCache
+
+
+def settings(guild_id, **fields):
+    return SimpleNamespace(guild_id=str(guild_id), **fields)
+
+
+class SettingsTable:
+    """Settings rows, with bulk loads that block until the test releases them."""
+
+    def __init__(self, rows):
+        self.rows = {str(row.guild_id): row for row in rows}
+        self.loads = 0
+        self.release = asyncio.Event()
+
+    async def load(self, guild_id):
+        self.loads += 1
+        return self.rows.get(str(guild_id))
+
+    async def bulk_load(self, guild_ids, limit):
+        # The rows are read when the query starts; the test changes things while it "runs"
+        rows = [row for guild_id, row in self.rows.items() if guild_ids is None or guild_id in guild_ids]
+        await self.release.wait()
+        return rows[:limit]
+
+
+def cache_for(rows):
+    table = SettingsTable(rows)
+    return GuildSettingsCache(table.load, table.bulk_load), table
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_load_all_serves_later_gets_from_memory():
+    async def test():
+        cache, table = cache_for([settings(1, level_enabled=True)])
+        table.release.set()
+        assert await cache.load_all(['1', '2']) == 1
+        assert (await cache.get(1)).level_enabled
+        assert await cache.get(2) is None
+        assert table.loads == 0
+    run(test())
+
+
+def test_updates_during_load_all_are_not_overwritten():
+    async def test():
+        cache, table = cache_for([settings(1, level_enabled=False), settings(2, level_enabled=False)])
+        load = asyncio.create_task(cache.load_all())
+        await asyncio.sleep(0)
+        cache.update(settings(1, level_enabled=True))
+        cache.invalidate(2)
+        table.rows['2'] = settings(2, level_enabled=True)
+        table.release.set()
+        assert await load == 0
+        assert (await cache.get(1)).level_enabled
+        # Invalidated mid-load, so it is read again rather than taken from the stale query
+        assert (await cache.get(2)).level_enabled
+        assert table.loads == 1
+    run(test())
+
+
+def test_full_invalidate_during_load_all_discards_the_load():
+    async def test():
+        cache, table = cache_for([settings(1, level_enabled=False)])
+        load = asyncio.create_task(cache.load_all())
+        await asyncio.sleep(0)
+        cache.invalidate()
+        table.release.set()
+        assert await load == 0
+        assert cache.stats()['size'] == 0
+    run(test())
+
+
+def test_changes_are_only_remembered_while_a_load_runs():
+    async def test():
+        cache, table = cache_for([settings(guild_id) for guild_id in range(3)])
+        for guild_id in range(100):
+            cache.update(settings(guild_id))
+        assert not cache._changed
+
+        first = asyncio.create_task(cache.load_all())
+        await asyncio.sleep(0)
+        cache.update(settings(1))
+        table.release.set()
+        await first
+        assert not cache._changed
+    run(test())
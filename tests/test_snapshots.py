@@ -0,0 +1,155 @@
+import asyncio
+import random
+from types import SimpleNamespace
+
+import discord
+
+from bulk import BulkJob, BulkScheduler
+from snapshots import CHANNEL, ROLE, SnapshotRestorer
+
+FAST = {route: (1000.0, 1000) for route in ('role_create', 'channel_create', 'member_roles')}
+MODS, VIP, STAFF, MOD_CHAT, LOUNGE = 101, 102, 201, 202, 203
+
+
+class Created:
+    def __init__(self, object_id, name, **kwargs):
+        self.id = object_id
+        self.name = name
+        self.kwargs = kwargs
+
+
+class Member:
+    def __init__(self, guild, member_id):
+        self.guild = guild
+        self.id = member_id
+
+    async def add_roles(self, role, reason=None):
+        self.guild.calls.append(('member', self.id, role.name))
+
+
+class Guild:
+    """Records every call the restorer makes, in order."""
+
+    id = 1
+    bitrate_limit = 96000
+
+    def __init__(self, member_ids):
+        self.calls = []
+        self.members = {member_id: Member(self, member_id) for member_id in member_ids}
+        self.me = SimpleNamespace(top_role=SimpleNamespace(position=50))
+        self._next_id = 1000
+
+    def _created(self, kind, name, **kwargs):
+        self._next_id += 1
+        created = Created(self._next_id, name, **kwargs)
+        self.calls.append((kind, name))
+        return created
+
+    async def create_role(self, name, **kwargs):
+        return self._created('role', name, **kwargs)
+
+    async def edit_role_positions(self, positions, reason=None):
+        self.calls.append(('positions', {role.name: position for role, position in positions.items()}))
+
+    async def create_category(self, name, **kwargs):
+        return self._created('category', name, **kwargs)
+
+    async def create_text_channel(self, name, **kwargs):
+        return self._created('text', name, **kwargs)
+
+    async def create_voice_channel(self, name, **kwargs):
+        return self._created('voice', name, **kwargs)
+
+    def get_role(self, role_id):
+        return None
+
+    def get_channel(self, channel_id):
+        return None
+
+    def get_member(self, member_id):
+        return self.members.get(member_id)
+
+
+def role(name, position, members):
+    return {'name': name, 'permissions': 8, 'colour': 0, 'hoist': False, 'mentionable': False,
+            'position': position, 'members': members}
+
+
+def channel(name, kind, position, category=None, overwrites=(), **extra):
+    return {'name': name, 'type': kind, 'category': category, 'position': position,
+            'overwrites': [list(overwrite) for overwrite in overwrites], **extra}
+
+
+def restore(records):
+    guild = Guild([1, 2])
+    forgotten = []
+    store = SimpleNamespace(forget=lambda guild_id, object_id: forgotten.append(object_id))
+    job = BulkJob("Restoring", len(records))
+    restorer = SnapshotRestorer(store, BulkScheduler(route_rates=FAST))
+    asyncio.run(restorer.restore(guild, records, job))
+    return guild, job, forgotten
+
+
+def deleted_guild():
+    moderators_only = (MODS, ROLE, 1024, 0)
+    records = [
+        (LOUNGE, CHANNEL, channel('Lounge', 'voice', 2, category=STAFF, bitrate=128000, user_limit=5)),
+        (MOD_CHAT, CHANNEL, channel('mod-chat', 'text', 1, category=STAFF, overwrites=[moderators_only], topic='Mods')),
+        (MODS, ROLE, role('Mods', 5, [1, 2])),
+        (STAFF, CHANNEL, channel('Staff', 'category', 0, overwrites=[moderators_only])),
+        (VIP, ROLE, role('VIP', 3, [2])),
+    ]
+    random.Random(0).shuffle(records)
+    return records
+
+
+def test_roles_then_categories_then_channels_then_members():
+    guild, job, forgotten = restore(deleted_guild())
+    assert guild.calls == [
+        ('role', 'VIP'),
+        ('role', 'Mods'),
+        ('positions', {'VIP': 3, 'Mods': 5}),
+        ('category', 'Staff'),
+        ('text', 'mod-chat'),
+        ('voice', 'Lounge'),
+        ('member', 2, 'VIP'),
+        ('member', 1, 'Mods'),
+        ('member', 2, 'Mods'),
+    ]
+    assert job.done == 5 and job.finished
+    assert sorted(forgotten) == sorted([MODS, VIP, STAFF, MOD_CHAT, LOUNGE])
+
+
+def test_restored_channels_point_at_restored_roles_and_categories():
+    guild = Guild([1, 2])
+    created = {}
+    original = guild._created
+
+    def remember(kind, name, **kwargs):
+        created[name] = original(kind, name, **kwargs)
+        return created[name]
+    guild._created = remember
+    store = SimpleNamespace(forget=lambda guild_id, object_id: None)
+    asyncio.run(SnapshotRestorer(store, BulkScheduler(route_rates=FAST)).restore(
+        guild, deleted_guild(), BulkJob("Restoring", 5)))
+
+    mod_chat = created['mod-chat'].kwargs
+    assert mod_chat['category'] is created['Staff']
+    assert list(mod_chat['overwrites']) == [created['Mods']]
+    assert mod_chat['overwrites'][created['Mods']].pair()[0].value == 1024
+    # Capped at what the guild's boost level allows
+    assert created['Lounge'].kwargs['bitrate'] == 96000
+
+
+def test_a_cancelled_restore_stops_before_the_next_object():
+    guild = Guild([1, 2])
+    job = BulkJob("Restoring", 5)
+
+    async def create_role(name, **kwargs):
+        job.cancel()
+        return guild._created('role', name, **kwargs)
+    guild.create_role = create_role
+    store = SimpleNamespace(forget=lambda guild_id, object_id: None)
+    asyncio.run(SnapshotRestorer(store, BulkScheduler(route_rates=FAST)).restore(guild, deleted_guild(), job))
+    assert [call[0] for call in guild.calls] == ['role', 'positions']
+    assert job.done == 1 and job.finished
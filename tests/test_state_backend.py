@@ -0,0 +1,292 @@
+import asyncio
+import fnmatch
+import time
+
+import pytest
+
+from state_backend import (CounterBackend, CounterBackends, MemoryCounterBackend, RedisCounterBackend, RedisError,
+                           SQLiteCounterBackend)
+
+
+class StubRedis:
+    """A local Redis stand-in speaking RESP, with the commands RedisCounterBackend uses.
+
+    `delay` holds EXEC replies back after the transaction has run, to catch clients mid-read.
+    """
+
+    def __init__(self, password=None):
+        self.password = password
+        self.values = {}
+        self.expiry = {}
+        self.connections = 0
+        self.delay = 0
+        self._server = None
+
+    @property
+    def url(self):
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"redis://{host}:{port}/0"
+
+    async def __aenter__(self):
+        self._server = await asyncio.start_server(self._handle, '127.0.0.1', 0)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _command(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        arguments = []
+        for _ in range(int(line[1:])):
+            length = int((await reader.readline())[1:])
+            arguments.append((await reader.readexactly(length + 2))[:-2].decode())
+        return arguments
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        session = {'authed': self.password is None, 'queue': None}
+        try:
+            while True:
+                command = await self._command(reader)
+                if command is None:
+                    return
+                reply = self._encode(self._run(session, command))
+                if self.delay and command[0].upper() == 'EXEC':
+                    await asyncio.sleep(self.delay)
+                writer.write(reply)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _live(self, name):
+        if name in self.expiry and self.expiry[name] <= time.monotonic():
+            del self.values[name], self.expiry[name]
+        return name in self.values
+
+    def _run(self, session, command):
+        name, arguments = command[0].upper(), command[1:]
+        if name == 'AUTH':
+            session['authed'] = arguments[0] == self.password
+            return 'OK' if session['authed'] else RedisError('WRONGPASS invalid password')
+        if not session['authed']:
+            return RedisError('NOAUTH Authentication required')
+        if name == 'MULTI':
+            session['queue'] = []
+            return 'OK'
+        if name == 'EXEC':
+            queue, session['queue'] = session['queue'], None
+            return [self._apply(command) for command in queue]
+        if session['queue'] is not None:
+            session['queue'].append(command)
+            return 'QUEUED'
+        return self._apply(command)
+
+    def _apply(self, command):
+        name, arguments = command[0].upper(), command[1:]
+        if name == 'SELECT':
+            return 'OK'
+        if name == 'SET':
+            key, value, options = arguments[0], arguments[1], [option.upper() for option in arguments[2:]]
+            if 'NX' in options and self._live(key):
+                return None
+            self.values[key] = value
+            self.expiry.pop(key, None)
+            if 'PX' in options:
+                self.expiry[key] = time.monotonic() + int(arguments[2 + options.index('PX') + 1]) / 1000
+            return 'OK'
+        if name == 'INCR':
+            value = int(self.values[arguments[0]]) + 1 if self._live(arguments[0]) else 1
+            self.values[arguments[0]] = str(value)
+            return value
+        if name == 'DEL':
+            removed = [key for key in arguments if self._live(key)]
+            for key in removed:
+                del self.values[key]
+                self.expiry.pop(key, None)
+            return len(removed)
+        if name == 'SCAN':
+            pattern = arguments[arguments.index('MATCH') + 1]
+            return ['0', [key for key in list(self.values) if self._live(key) and fnmatch.fnmatchcase(key, pattern)]]
+        return RedisError(f"ERR unknown command '{name}'")
+
+    def _encode(self, reply):
+        if isinstance(reply, RedisError):
+            return f"-{reply}\r\n".encode()
+        if reply is None:
+            return b'$-1\r\n'
+        if isinstance(reply, int):
+            return f":{reply}\r\n".encode()
+        if isinstance(reply, list):
+            return f"*{len(reply)}\r\n".encode() + b''.join(self._encode(item) for item in reply)
+        if reply in ('OK', 'QUEUED'):
+            return f"+{reply}\r\n".encode()
+        data = reply.encode()
+        return b'$%d\r\n%s\r\n' % (len(data), data)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def with_redis(test, password=None):
+    async with StubRedis(password) as server:
+        backend = RedisCounterBackend(server.url.replace('redis://', f"redis://:{password}@") if password else server.url)
+        try:
+            return await test(server, backend)
+        finally:
+            await backend.close()
+
+
+def test_memory_counts_a_sliding_window():
+    async def test():
+        backend = MemoryCounterBackend(idle_ttl=30)
+        assert [await backend.hit('spam', 'user', 3, 10, now=now) for now in (0, 1, 2)] == [1, 2, 3]
+        assert await backend.hit('spam', 'user', 3, 10, now=5) == 4
+        # Hits slide out of the window one by one, rather than all at once
+        assert await backend.hit('spam', 'user', 3, 10, now=11) == 3
+        assert await backend.hit('spam', 'user', 3, 10, now=15.5) == 2
+        assert await backend.hit('spam', 'other', 3, 10, now=15.5) == 1
+        await backend.reset('spam', 'user')
+        assert await backend.hit('spam', 'user', 3, 10, now=16) == 1
+        assert await backend.sweep(now=100) == 2
+        assert backend.stats()['tracked_keys'] == 0
+    run(test())
+
+
+def test_sqlite_counts_a_fixed_window_shared_by_backends(tmp_path):
+    async def test():
+        path = str(tmp_path / 'state.db')
+        first, second = SQLiteCounterBackend(path), SQLiteCounterBackend(path)
+        try:
+            assert await first.hit('spam', 'user', 3, 10, now=0) == 1
+            assert await second.hit('spam', 'user', 3, 10, now=1) == 2
+            assert await first.hit('spam', 'user', 3, 10, now=9) == 3
+            # The window started with the first hit, so it has expired by now
+            assert await second.hit('spam', 'user', 3, 10, now=10) == 1
+            await first.hit('spam', 'other', 3, 10, now=10)
+            await first.hit('raid', 'user', 3, 10, now=10)
+            await second.reset('spam', 'user')
+            assert await first.hit('spam', 'user', 3, 10, now=11) == 1
+            await second.reset('spam')
+            assert await first.hit('spam', 'other', 3, 10, now=12) == 1
+            assert await first.sweep(now=30) == 2
+        finally:
+            await first.close()
+            await second.close()
+    run(test())
+
+
+def test_sqlite_hits_from_many_tasks_are_all_counted(tmp_path):
+    async def test():
+        backends = [SQLiteCounterBackend(str(tmp_path / 'state.db')) for _ in range(3)]
+        try:
+            await asyncio.gather(*(backend.hit('spam', 'user', 100, 60, now=0) for backend in backends for _ in range(20)))
+            assert await backends[0].hit('spam', 'user', 100, 60, now=1) == 61
+        finally:
+            for backend in backends:
+                await backend.close()
+    run(test())
+
+
+def test_redis_counts_a_fixed_window():
+    async def test(server, backend):
+        assert [await backend.hit('spam', 'user', 3, 0.2) for _ in range(3)] == [1, 2, 3]
+        assert await backend.hit('spam', 'other', 3, 0.2) == 1
+        await asyncio.sleep(0.25)
+        assert await backend.hit('spam', 'user', 3, 0.2) == 1
+        assert server.connections == 1
+    run(with_redis(test))
+
+
+def test_redis_resets_keys_and_scopes():
+    async def test(server, backend):
+        for key in ('a', 'b'):
+            await backend.hit('spam', key, 3, 60)
+        await backend.hit('raid', 'a', 3, 60)
+        await backend.reset('spam', 'a')
+        assert await backend.hit('spam', 'a', 3, 60) == 1
+        await backend.reset('spam')
+        assert await backend.hit('spam', 'b', 3, 60) == 1
+        assert await backend.hit('raid', 'a', 3, 60) == 2
+    run(with_redis(test))
+
+
+def test_redis_authenticates_and_surfaces_error_replies():
+    async def test(server, backend):
+        assert await backend.hit('spam', 'user', 3, 60) == 1
+        with pytest.raises(RedisError):
+            await backend.execute(('FLUSHALL',))
+        # An error reply leaves the connection in step
+        assert await backend.hit('spam', 'user', 3, 60) == 2
+        assert server.connections == 1
+    run(with_redis(test, password='secret'))
+
+
+def test_redis_wrong_password_is_not_kept_connected():
+    async def test():
+        async with StubRedis(password='secret') as server:
+            backend = RedisCounterBackend(server.url.replace('redis://', 'redis://:wrong@'))
+            with pytest.raises(RedisError):
+                await backend.hit('spam', 'user', 3, 60)
+            assert backend._writer is None
+            await backend.close()
+    run(test())
+
+
+def test_redis_reconnects_after_a_cancelled_hit():
+    async def test(server, backend):
+        await backend.hit('spam', 'user', 3, 60)
+        server.delay = 0.3
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(backend.hit('spam', 'user', 3, 60), 0.05)
+        assert backend._writer is None and backend._reader is None
+        server.delay = 0
+        # The cancelled hit's replies are never read as this one's
+        assert await backend.hit('spam', 'user', 3, 60) == 3
+        assert server.connections == 2
+    run(with_redis(test))
+
+
+def test_redis_reconnects_when_the_server_drops_the_connection():
+    async def test(server, backend):
+        await backend.hit('spam', 'user', 3, 60)
+        backend._writer.transport.abort()
+        assert await backend.hit('spam', 'user', 3, 60) == 2
+        assert server.connections == 2
+    run(with_redis(test))
+
+
+def test_backends_from_env(tmp_path):
+    async def test():
+        memory = CounterBackends.from_env({})
+        assert memory.name == 'memory'
+        assert memory.counter('spam') is not memory.counter('spam')
+
+        backends = CounterBackends.from_env({'STATE_BACKEND': f"sqlite:{tmp_path / 'state.db'}"})
+        spam, raid = backends.counter('spam'), backends.counter('raid')
+        assert await spam.hit('user', 'a', 3, 60, now=0) == 1
+        assert await spam.hit('user', 'a', 3, 60, now=1) == 2
+        # Each caller's scopes live under its own namespace
+        assert await raid.hit('user', 'a', 3, 60, now=1) == 1
+        await backends.close()
+
+        assert CounterBackends.from_env({'STATE_BACKEND': 'redis://cache:6380/2'}).shared.port == 6380
+        with pytest.raises(ValueError):
+            CounterBackends.from_env({'STATE_BACKEND': 'memcached://cache'})
+    run(test())
+
+
+def test_incomplete_backends_fail_when_constructed():
+    class HitOnly(CounterBackend):
+        name = 'hit-only'
+
+        async def hit(self, scope, key, limit, window, now=None):
+            return 1
+
+    with pytest.raises(TypeError):
+        HitOnly()
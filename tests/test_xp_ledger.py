@@ -0,0 +1,107 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from xp_ledger import XPLedger
+
+NOW = datetime(2026, 1, 1)
+
+
+class Store:
+    """UserLevel rows in a dict, written the way db._write_xp_batch upserts them."""
+
+    def __init__(self, rows=None, delay=0):
+        self.rows = dict(rows or {})
+        self.delay = delay
+        self.fail = False
+        self.batches = []
+        self.writing = 0
+
+    async def load(self, guild_id):
+        return {user_id: (xp, NOW - timedelta(hours=1)) for (stored_guild, user_id), xp in self.rows.items() if stored_guild == guild_id}
+
+    async def write(self, batch):
+        self.writing += 1
+        assert self.writing == 1, "two batches written at once"
+        try:
+            await asyncio.sleep(self.delay)
+            if self.fail:
+                raise OSError("database is locked")
+            for change in batch:
+                key = (change['guild_id'], change['user_id'])
+                self.rows[key] = self.rows.get(key, 0) + change['delta']
+            self.batches.append(batch)
+        finally:
+            self.writing -= 1
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_awards_respect_the_cooldown_and_flush_deltas():
+    async def test():
+        store = Store({('1', 'a'): 100})
+        ledger = XPLedger(store.load, store.write, cooldown=60)
+        assert await ledger.award(1, 'a', 20, NOW) == (100, 120)
+        assert await ledger.award(1, 'a', 20, NOW + timedelta(seconds=30)) is None
+        assert await ledger.award(1, 'a', 5, NOW + timedelta(seconds=60)) == (120, 125)
+        assert await ledger.award(1, 'b', 15, NOW) == (0, 15)
+        assert await ledger.flush() == 2
+        assert store.rows == {('1', 'a'): 125, ('1', 'b'): 15}
+        assert await ledger.flush() == 0
+    run(test())
+
+
+def test_a_failed_write_is_restored_and_merged_with_later_awards():
+    async def test():
+        store = Store()
+        ledger = XPLedger(store.load, store.write, cooldown=0)
+        await ledger.award(1, 'a', 10, NOW)
+        store.fail = True
+        with pytest.raises(OSError):
+            await ledger.flush()
+        assert ledger.pending_count == 1
+        await ledger.award(1, 'a', 5, NOW)
+        store.fail = False
+        assert await ledger.flush() == 1
+        assert store.rows == {('1', 'a'): 15}
+        assert ledger.peek(1, 'a') == 15
+    run(test())
+
+
+def test_overlapping_flushes_write_one_batch_at_a_time():
+    async def test():
+        store = Store(delay=0.01)
+        ledger = XPLedger(store.load, store.write, cooldown=0)
+        await ledger.award(1, 'new', 10, NOW)
+        first = asyncio.create_task(ledger.flush())
+        await asyncio.sleep(0)
+        await ledger.award(1, 'new', 5, NOW)
+        # e.g. close() flushing while run()'s flush is still writing
+        await asyncio.gather(first, ledger.flush())
+        assert [len(batch) for batch in store.batches] == [1, 1]
+        assert store.rows == {('1', 'new'): 15}
+    run(test())
+
+
+def test_awards_during_a_failed_write_are_kept_with_the_restored_batch():
+    async def test():
+        store = Store({('1', 'a'): 100}, delay=0.01)
+        ledger = XPLedger(store.load, store.write, cooldown=0)
+        await ledger.award(1, 'a', 10, NOW)
+        store.fail = True
+        flush = asyncio.create_task(ledger.flush())
+        await asyncio.sleep(0)
+        # Drained and in flight, so this lands in a fresh pending delta
+        await ledger.award(1, 'a', 7, NOW)
+        try:
+            await flush
+        except OSError:
+            pass
+        store.fail = False
+        assert await ledger.flush() == 1
+        assert store.rows == {('1', 'a'): 117}
+        assert ledger.peek(1, 'a') == 117
+    run(test())
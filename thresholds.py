@@ -0,0 +1,40 @@
+# Defaults as (limit, window seconds): trigger on more than `limit` events within the window
+DEFAULT_THRESHOLDS = {
+    'spam': (5, 10),
+    'channel_create': (5, 10),
+    'channel_delete': (5, 10),
+    'role_create': (5, 10),
+    'role_delete': (2, 10),
+    'member_ban': (4, 10),
+    'member_remove': (4, 10),
+    'guild_update': (3, 10),
+    'verification_level_change': (3, 10),
+    'raid_joins': (10, 10),
+}
+
+
+class ThresholdStore:
+    """Per-guild threshold overrides held in memory, falling back to DEFAULT_THRESHOLDS.
+
+    `loader()` awaits every stored override as (guild_id, key, limit, window) rows.
+    """
+
+    def __init__(self, loader):
+        self.loader = loader
+        self._overrides = {}
+
+    async def load_all(self):
+        self._overrides.clear()
+        for guild_id, key, limit, window in await self.loader():
+            self._overrides.setdefault(str(guild_id), {})[key] = (limit, window)
+        return sum(len(overrides) for overrides in self._overrides.values())
+
+    def get(self, guild_id, key):
+        overrides = self._overrides.get(str(guild_id))
+        if overrides and key in overrides:
+            return overrides[key]
+        return DEFAULT_THRESHOLDS[key]
+
+    def set(self, guild_id, key, limit, window):
+        """Record an override that has already been saved to the DB."""
+        self._overrides.setdefault(str(guild_id), {})[key] = (limit, window)
@@ -0,0 +1,173 @@
+import asyncio
+import re
+from collections import Counter
+
+_END = ''
+
+
+def _node_pattern(node, tails):
+    """The regex for one trie node, given the patterns already built for its children."""
+    if _END in node and len(node) == 1:
+        return None
+
+    alternatives = []
+    single_chars = []
+    for char, child in sorted((k, v) for k, v in node.items() if k != _END):
+        tail = tails[id(child)]
+        if tail is None:
+            single_chars.append(re.escape(char))
+        else:
+            alternatives.append(re.escape(char) + tail)
+
+    if single_chars:
+        if len(single_chars) == 1:
+            alternatives.append(single_chars[0])
+        else:
+            alternatives.append('[' + ''.join(single_chars) + ']')
+
+    if len(alternatives) == 1:
+        pattern = alternatives[0]
+    else:
+        pattern = '(?:' + '|'.join(alternatives) + ')'
+
+    # A word ends here, so everything after this point is optional
+    if _END in node:
+        pattern = '(?:' + pattern + ')?'
+    return pattern
+
+
+def _trie_pattern(root):
+    """Turn a character trie into a regex that shares common prefixes.
+
+    Built children-first with an explicit stack, since a trie is as deep as its longest phrase.
+    """
+    tails = {}
+    stack = [(root, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if expanded:
+            tails[id(node)] = _node_pattern(node, tails)
+        else:
+            stack.append((node, True))
+            stack.extend((child, False) for key, child in node.items() if key != _END)
+    return tails[id(root)]
+
+
+def compile_words(words, whole_words=False):
+    """Compile a word list into one regex that scans a message in a single pass."""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[_END] = True
+
+    if not trie:
+        return None
+
+    prefix, suffix = (r'(?<!\w)', r'(?!\w)') if whole_words else ('', '')
+    try:
+        return re.compile(prefix + _trie_pattern(trie) + suffix)
+    except (RecursionError, re.error):
+        # re nests one level per phrase that is a prefix of another; hundreds of those
+        # overflow its parser, while a flat alternation of the phrases always compiles
+        flat = '|'.join(re.escape(word) for word in sorted(words, key=len, reverse=True))
+        return re.compile(prefix + '(?:' + flat + ')' + suffix)
+
+
+class WordFilter:
+    """A guild's filtered words, compiled lazily and recompiled only after the list changes."""
+
+    def __init__(self, words=(), whole_words=False):
+        self.whole_words = whole_words
+        self._words = Counter()
+        self._pattern = None
+        self._dirty = False
+        for word in words:
+            self.add(word)
+
+    def __len__(self):
+        return len(self._words)
+
+    def add(self, word):
+        word = word.lower()
+        if not word:
+            return
+        self._words[word] += 1
+        if self._words[word] == 1:
+            self._dirty = True
+
+    def remove(self, word):
+        word = word.lower()
+        if word not in self._words:
+            return
+        self._words[word] -= 1
+        if self._words[word] <= 0:
+            del self._words[word]
+            self._dirty = True
+
+    def find(self, content, lowered=False):
+        """Return the first filtered word found in content, or None.
+
+        Pass `lowered=True` when the caller has already lowercased the content.
+        """
+        if self._dirty:
+            # Cleared first so a list that can't compile isn't retried on every message
+            self._dirty = False
+            self._pattern = compile_words(self._words, self.whole_words)
+        if self._pattern is None:
+            return None
+        match = self._pattern.search(content if lowered else content.lower())
+        return match.group(0) if match else None
+
+
+class WordFilterCache:
+    """Per-guild WordFilter instances, loaded once through `await loader(guild_id) -> [word, ...]`."""
+
+    def __init__(self, loader, whole_words=False):
+        self.loader = loader
+        self.whole_words = whole_words
+        self._filters = {}
+        self._loading = {}
+
+    async def get(self, guild_id):
+        guild_id = str(guild_id)
+        word_filter = self._filters.get(guild_id)
+        if word_filter is not None:
+            return word_filter
+
+        task = self._loading.get(guild_id)
+        if task is None:
+            task = self._loading[guild_id] = asyncio.ensure_future(self.loader(guild_id))
+        words = await asyncio.shield(task)
+
+        word_filter = self._filters.get(guild_id)
+        if word_filter is None:
+            word_filter = WordFilter(words, whole_words=self.whole_words)
+            # A list that changed mid-load may be stale: use it for this call, don't cache it
+            if self._loading.get(guild_id) is task:
+                del self._loading[guild_id]
+                self._filters[guild_id] = word_filter
+        return word_filter
+
+    def add_word(self, guild_id, word):
+        self._changed(str(guild_id), 'add', word)
+
+    def remove_word(self, guild_id, word):
+        self._changed(str(guild_id), 'remove', word)
+
+    def invalidate(self, guild_id=None):
+        if guild_id is None:
+            self._filters.clear()
+            self._loading.clear()
+        else:
+            self._filters.pop(str(guild_id), None)
+            self._loading.pop(str(guild_id), None)
+
+    def _changed(self, guild_id, action, word):
+        word_filter = self._filters.get(guild_id)
+        if word_filter is not None:
+            getattr(word_filter, action)(word)
+        else:
+            # The word list being loaded may predate this change
+            self._loading.pop(guild_id, None)
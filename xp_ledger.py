@@ -0,0 +1,137 @@
+import asyncio
+
+
+class XPEntry:
+    __slots__ = ('xp', 'last_xp_gain', 'pending')
+
+    def __init__(self, xp=0, last_xp_gain=None):
+        self.xp = xp
+        self.last_xp_gain = last_xp_gain
+        self.pending = 0
+
+
+class XPLedger:
+    """In-memory XP balances with a write-behind flush to UserLevel.
+
+    `await loader(guild_id)` returns {user_id: (xp, last_xp_gain)} for a whole guild and
+    is called once per guild. `await writer(batch)` adds each change's `delta` to the
+    member's stored XP in one transaction, creating rows for new members. Flushes take
+    turns, so a batch is never written while an earlier one is still in flight.
+    """
+
+    def __init__(self, loader, writer, cooldown=60, max_pending=500):
+        self.loader = loader
+        self.writer = writer
+        self.cooldown = cooldown
+        self.max_pending = max_pending
+        self._guilds = {}
+        self._loading = {}
+        self._dirty = set()
+        self._flush_requested = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+
+    @property
+    def pending_count(self):
+        return len(self._dirty)
+
+    async def _guild(self, guild_id):
+        entries = self._guilds.get(guild_id)
+        if entries is not None:
+            return entries
+
+        # Messages arriving while a guild loads all wait on the same query
+        task = self._loading.get(guild_id)
+        if task is None:
+            task = self._loading[guild_id] = asyncio.ensure_future(self.loader(guild_id))
+        try:
+            rows = await asyncio.shield(task)
+        finally:
+            if self._loading.get(guild_id) is task and task.done():
+                del self._loading[guild_id]
+
+        entries = self._guilds.get(guild_id)
+        if entries is None:
+            entries = self._guilds[guild_id] = {
+                user_id: XPEntry(xp or 0, last_xp_gain)
+                for user_id, (xp, last_xp_gain) in rows.items()
+            }
+        return entries
+
+    async def award(self, guild_id, user_id, amount, now):
+        """Add XP unless the user is on cooldown. Returns (old_xp, new_xp) or None."""
+        guild_id, user_id = str(guild_id), str(user_id)
+        entries = await self._guild(guild_id)
+        entry = entries.get(user_id)
+        if entry is None:
+            entry = entries[user_id] = XPEntry()
+        elif entry.last_xp_gain and (now - entry.last_xp_gain).total_seconds() < self.cooldown:
+            return None
+
+        old_xp = entry.xp
+        entry.xp += amount
+        entry.pending += amount
+        entry.last_xp_gain = now
+        self._dirty.add((guild_id, user_id))
+        if len(self._dirty) >= self.max_pending:
+            self._flush_requested.set()
+        return old_xp, entry.xp
+
+    async def balances(self, guild_id):
+        """Current XP of every user in a guild as {user_id: xp}, loading the guild if needed."""
+        entries = await self._guild(str(guild_id))
+        return {user_id: entry.xp for user_id, entry in entries.items()}
+
+    def peek(self, guild_id, user_id):
+        """Current XP for a user if their guild is loaded, without touching the DB."""
+        entries = self._guilds.get(str(guild_id))
+        if entries is None:
+            return None
+        entry = entries.get(str(user_id))
+        return entry.xp if entry else None
+
+    def drain(self):
+        """Take every pending change."""
+        batch = []
+        for guild_id, user_id in self._dirty:
+            entry = self._guilds[guild_id][user_id]
+            batch.append({
+                'guild_id': guild_id,
+                'user_id': user_id,
+                'delta': entry.pending,
+                'last_xp_gain': entry.last_xp_gain,
+            })
+            entry.pending = 0
+        self._dirty.clear()
+        self._flush_requested.clear()
+        return batch
+
+    def restore(self, batch):
+        """Put a drained batch back after a failed write so it is retried."""
+        for change in batch:
+            entry = self._guilds[change['guild_id']][change['user_id']]
+            entry.pending += change['delta']
+            self._dirty.add((change['guild_id'], change['user_id']))
+
+    async def flush(self):
+        async with self._flush_lock:
+            batch = self.drain()
+            if not batch:
+                return 0
+            try:
+                await self.writer(batch)
+            except Exception:
+                self.restore(batch)
+                raise
+            return len(batch)
+
+    async def run(self, interval=30):
+        """Flush every `interval` seconds, or sooner once `max_pending` users are dirty."""
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"🚨 Error: Failed to flush XP ledger: {str(e)}")